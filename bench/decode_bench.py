@@ -0,0 +1,71 @@
+## Compares decoding large list and tuple models by walking the
+## model values against simplifying every node of them
+## Usage: python bench/decode_bench.py [elements]
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "priv"))
+from z3_utils import *
+
+## The previous decoder: simplify() on every cons cell and tag test
+class SimplifyDecoder:
+  def __init__(self, erlz3):
+    self.T = erlz3.Term
+    self.L = erlz3.List
+    self.A = erlz3.Atom
+
+  def decode(self, term):
+    T = self.T
+    if (is_true(simplify(T.is_int(term)))):
+      return {"t" : "Int", "v" : simplify(T.ival(term)).as_long()}
+    elif (is_true(simplify(T.is_real(term)))):
+      s = simplify(T.rval(term))
+      return {"t" : "Real", "v" : float(s.numerator_as_long()) / float(s.denominator_as_long())}
+    elif (is_true(simplify(T.is_lst(term)))):
+      return {"t" : "List", "v" : self.elements(T.lval(term))}
+    elif (is_true(simplify(T.is_tpl(term)))):
+      return {"t" : "Tuple", "v" : self.elements(T.tval(term))}
+    elif (is_true(simplify(T.is_atm(term)))):
+      A = self.A
+      s = simplify(T.aval(term))
+      r = []
+      while (is_true(simplify(A.is_acons(s)))):
+        r.append(simplify(A.ahd(s)).as_long())
+        s = simplify(A.atl(s))
+      return {"t" : "Atom", "v" : r}
+
+  def elements(self, t):
+    L = self.L
+    s = simplify(t)
+    r = []
+    while (is_true(simplify(L.is_cons(s)))):
+      hd = simplify(L.hd(s))
+      s = simplify(L.tl(s))
+      r.append(self.decode(hd))
+    return r
+
+## A model with a list of n integers and a tuple of n atoms
+def solved_model(erlz3, n):
+  xs = {"t" : "List", "v" : [{"t" : "Int", "v" : i} for i in range(n)]}
+  ys = {"t" : "Tuple", "v" : [{"t" : "Atom", "v" : [97 + i % 26]} for i in range(n)]}
+  x = erlz3.env.fresh_var("x", erlz3.Term)
+  y = erlz3.env.fresh_var("y", erlz3.Term)
+  erlz3.solver.add(x == erlz3.json_term_to_z3(xs))
+  erlz3.solver.add(y == erlz3.json_term_to_z3(ys))
+  erlz3.solver.check()
+  m = erlz3.solver.model()
+  return [m[x], m[y]], [xs, ys]
+
+def timed(name, f, vals, expected):
+  t = time.time()
+  r = [f(v) for v in vals]
+  dt = time.time() - t
+  assert r == expected
+  print "%-10s %8.3f s" % (name, dt)
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if (len(sys.argv) > 1) else 1000
+  erlz3 = ErlangZ3()
+  vals, expected = solved_model(erlz3, n)
+  print "Decoding a list and a tuple of %d elements" % n
+  timed("simplify", SimplifyDecoder(erlz3).decode, vals, expected)
+  timed("walk", erlz3.z3_term_to_json, vals, expected)
@@ -0,0 +1,44 @@
+## Compares the solver time of list-heavy queries when lists are
+## constrained by recursive functions against unrolled If-chains
+## Usage: python bench/encoding_bench.py [queries]
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "priv"))
+from z3_utils import *
+
+## Typed lists that are converted to tuples and measured,
+## as erlang:length/1 and erlang:tuple_size/1 do in a trace
+def list_query(erlz3, n):
+  T = erlz3.Term
+  s = erlz3.solver
+  for i in range(n):
+    x = erlz3.env.fresh_var("x%d" % i, T)
+    y = erlz3.env.fresh_var("y%d" % i, T)
+    z = erlz3.env.fresh_var("z%d" % i, T)
+    if (i % 2 == 0):
+      s.add(erlz3._bind_term_to_string(x, None, []))
+    else:
+      s.add(erlz3._bind_term_to_list(x, {"t" : "integer", "i" : "pos"}, []))
+    s.add(T.is_tpl(y), T.lval(x) == T.tval(y))
+    s.add(erlz3._bif_len_h("tuple", y, T.int(10 + 7 * i % 80)))
+    s.add(erlz3._make_tuple_h(erlz3.atom_true, T.int(5 + 3 * i % 60), z))
+    s.add(erlz3._bif_len_h("tuple", z, T.int(5 + 3 * i % 60)))
+
+def timed(name, recursive, n):
+  erlz3 = ErlangZ3()
+  erlz3.recursive = recursive
+  t = time.time()
+  list_query(erlz3, n)
+  enc = time.time() - t
+  t = time.time()
+  r = erlz3.solver.check()
+  dt = time.time() - t
+  size = len(erlz3.solver.sexpr())
+  print "%-10s %8.3f s %8.3f s %10d %s" % (name, enc, dt, size, r)
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if (len(sys.argv) > 1) else 20
+  print "Solving %d typed lists of up to 90 elements" % n
+  print "%-10s %10s %10s %10s" % ("encoding", "encode", "check", "size")
+  timed("unrolled", False, n)
+  timed("recursive", True, n)
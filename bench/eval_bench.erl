@@ -0,0 +1,38 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(eval_bench).
+
+%% Reports the time of a concolic execution of some testsuite programs.
+%% Build with and without COMPILE_CLOSURES in concolic_flags.hrl to
+%% compare the closure form of the functions against interpreting
+%% their Core Erlang AST.
+
+-export([run/0, run/2]).
+
+%% ------------------------------------------------------------------
+%% Run function
+%% ------------------------------------------------------------------
+
+-spec run() -> ok.
+
+run() ->
+  Progs = [{demo, fib, [15]}, {mbrot, run, [4, 8]}, {big, run, [16]}],
+  run(Progs, 5).
+
+-spec run([{atom(), atom(), [term()]}], pos_integer()) -> ok.
+
+run(Progs, Reps) ->
+  io:format("~-16s ~14s ~14s~n", ["Program", "first (ms)", "average (ms)"]),
+  lists:foreach(fun(P) -> run_one(P, Reps) end, Progs).
+
+%% ------------------------------------------------------------------
+%% Internal functions
+%% ------------------------------------------------------------------
+
+%% The first execution includes loading the modules
+run_one({M, F, As}, Reps) ->
+  Run = fun() -> {ok, _} = coordinator:test_run(M, F, As) end,
+  {T1, _} = timer:tc(Run),
+  Ts = [element(1, timer:tc(Run)) || _ <- lists:seq(1, Reps)],
+  Name = atom_to_list(M) ++ ":" ++ atom_to_list(F),
+  io:format("~-16s ~14.2f ~14.2f~n", [Name, T1 / 1000, lists:sum(Ts) / Reps / 1000]).
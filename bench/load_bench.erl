@@ -0,0 +1,57 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(load_bench).
+
+%% Reports the latency of building the Core Erlang AST of a module
+%% through a .core text file (write, scan and parse) against
+%% getting it from the compiler in memory.
+
+-export([run/0, run/2]).
+
+-define(COREDIR, "temp/bench_core").
+
+%% ------------------------------------------------------------------
+%% Run function
+%% ------------------------------------------------------------------
+
+-spec run() -> ok.
+
+run() ->
+  Ms = [demo, big, mbrot, bs_bm, concolic_eval, concolic_json, bin_lib],
+  run(Ms, 5).
+
+-spec run([atom()], pos_integer()) -> ok.
+
+run(Ms, Reps) ->
+  io:format("~-16s ~14s ~14s~n", ["Module", "text (ms)", "memory (ms)"]),
+  lists:foreach(fun(M) -> run_one(M, Reps) end, Ms),
+  _ = file:del_dir(filename:absname(?COREDIR)),
+  ok.
+
+%% ------------------------------------------------------------------
+%% Internal functions
+%% ------------------------------------------------------------------
+
+run_one(M, Reps) ->
+  T1 = average(fun() -> text_core(M) end, Reps),
+  T2 = average(fun() -> {ok, _} = concolic_load:module_core(M) end, Reps),
+  io:format("~-16s ~14.2f ~14.2f~n", [M, T1 / 1000, T2 / 1000]).
+
+average(F, Reps) ->
+  Ts = [element(1, timer:tc(F)) || _ <- lists:seq(1, Reps)],
+  lists:sum(Ts) / Reps.
+
+%% The previous loading path of concolic_load
+text_core(M) ->
+  ok = filelib:ensure_dir(?COREDIR ++ "/"),
+  {ok, {_, [{compile_info, Info}]}} = beam_lib:chunks(code:which(M), [compile_info]),
+  Source = proplists:get_value(source, Info),
+  Includes = proplists:lookup_all(i, proplists:get_value(options, Info)),
+  Macros = proplists:lookup_all(d, proplists:get_value(options, Info)),
+  {ok, M} = compile:file(Source, [to_core, return_errors, {outdir, ?COREDIR}] ++ Includes ++ Macros),
+  Core = ?COREDIR ++ "/" ++ atom_to_list(M) ++ ".core",
+  {ok, Bin} = file:read_file(Core),
+  {ok, Tokens, _} = core_scan:string(binary_to_list(Bin)),
+  {ok, AST} = core_parse:parse(Tokens),
+  ok = file:delete(Core),
+  AST.
@@ -0,0 +1,65 @@
+## Compares reading a synthetic trace record by record with
+## per-byte gzip reads against the buffered TraceReader
+## Usage: python bench/reader_bench.py [records]
+
+import gzip, json, os, struct, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "priv"))
+from json_utils import *
+
+FILE = "temp/bench_trace.gz"
+
+## Write a trace of n records in the JSON format
+def synthetic_trace(filename, n):
+  d = os.path.dirname(filename)
+  if (not os.path.isdir(d)):
+    os.makedirs(d)
+  fd = gzip.open(filename, 'wb')
+  fd.write(TRACE_MAGIC + struct.pack('B', TRACE_JSON))
+  for i in range(n):
+    if (i % 3 == 0):
+      k, cmd = 1, {"c" : "T", "a" : [{"s" : "0.%d.1" % i}]}
+    else:
+      x = {"t" : "List", "v" : [{"t" : "Int", "v" : j} for j in range(8)]}
+      k, cmd = 3, {"c" : "=:=", "a" : [{"s" : "0.%d.2" % i}, {"s" : "0.%d.3" % i}, x]}
+    data = json.dumps(cmd, separators=(',', ':'))
+    fd.write(struct.pack('!BI', k, len(data)))
+    fd.write(data)
+  fd.close()
+
+## The previous reader: one gzip read per header byte
+def per_byte(filename):
+  fd = gzip.open(filename, 'rb')
+  fd.read(4)
+  n = 0
+  while True:
+    x = fd.read(1)
+    if (x == ""):
+      break
+    k = struct.unpack('B', x)[0]
+    b = [struct.unpack('B', fd.read(1))[0] for z in range(4)]
+    sz = (b[0] << 24) | (b[1] << 16) | (b[2] << 8) | b[3]
+    json.loads(fd.read(sz))
+    n += 1
+  fd.close()
+  return n
+
+def buffered(filename):
+  rd = TraceReader(filename, sys.maxint)
+  n = 0
+  for c, data in rd.commands():
+    rd.decode(data)
+    n += 1
+  return n
+
+def timed(name, f, filename):
+  t = time.time()
+  n = f(filename)
+  dt = time.time() - t
+  print "%-12s %8d records %8.3f s %10.0f records/s" % (name, n, dt, n / dt)
+
+if __name__ == "__main__":
+  n = int(sys.argv[1]) if (len(sys.argv) > 1) else 100000
+  synthetic_trace(FILE, n)
+  timed("per-byte", per_byte, FILE)
+  timed("buffered", buffered, FILE)
+  os.remove(FILE)
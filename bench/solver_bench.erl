@@ -0,0 +1,71 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(solver_bench).
+
+%% Compares the throughput of the Z3 port when a new Python process
+%% is spawned for every query against a single long-lived solver worker,
+%% both query by query and solving all the negations of a trace at once.
+
+-export([run/0, run/4]).
+
+-define(PYTHON_CALL, ?PYTHON_PATH ++ " -u priv/erlang_port.py").
+-define(DATADIR, "temp/bench").
+
+%% ------------------------------------------------------------------
+%% Run function
+%% ------------------------------------------------------------------
+
+-spec run() -> ok.
+
+run() ->
+  run(demo, min, [[5,1,3,2,7,6,4]], 5).
+
+-spec run(atom(), atom(), [term()], pos_integer()) -> ok.
+
+run(M, F, As, Reps) ->
+  process_flag(trap_exit, true),
+  {File, L, Mapping} = trace(M, F, As),
+  Qs = [X || _ <- lists:seq(1, Reps), X <- lists:seq(1, L)],
+  io:format("Solving ~w queries on a path of length ~w~n", [length(Qs), L]),
+  %% Spawn a Python process per query
+  Spawn = fun(X) -> python:solve(File, X, Mapping, ?PYTHON_CALL) end,
+  T1 = time_queries(Spawn, Qs),
+  report("spawn-per-query", length(Qs), T1),
+  %% Reuse a single solver worker
+  W = python:start_worker(?PYTHON_CALL),
+  Reuse = fun(X) -> python:worker_solve(W, File, X, Mapping) end,
+  T2 = time_queries(Reuse, Qs),
+  report("solver worker", length(Qs), T2),
+  %% Solve all the negations of the trace in one session
+  Is = lists:seq(1, L),
+  Batch = fun(_) -> python:worker_solve_all(W, File, Is, Mapping) end,
+  T3 = time_queries(Batch, lists:seq(1, Reps)),
+  report("incremental", length(Qs), T3),
+  ok = python:stop(W),
+  _ = concolic_analyzer:clear_and_delete_dir(?DATADIR),
+  ok.
+
+%% ------------------------------------------------------------------
+%% Internal functions
+%% ------------------------------------------------------------------
+
+%% Run a concolic execution and return its trace file
+trace(M, F, As) ->
+  Concolic = concolic:init_server(M, F, As, ?DATADIR ++ "/traces", 1000),
+  R =
+    receive
+      {'EXIT', Concolic, Why} -> exit({concolic_execution_failed, Why});
+      {Concolic, Results} -> Results
+    end,
+  Traces = concolic_analyzer:get_traces(R),
+  [{_, [File]}] = Traces,
+  [{_, [V]}] = concolic_analyzer:get_execution_vertices(Traces),
+  {File, length(V), concolic_analyzer:get_mapping(R)}.
+
+time_queries(Solve, Qs) ->
+  {T, ok} = timer:tc(fun() -> lists:foreach(Solve, Qs) end),
+  T.
+
+report(Mode, N, T) ->
+  Rate = N / (T / 1000000),
+  io:format("  ~-16s ~8.3f s  ~10.2f solves/s~n", [Mode, T / 1000000, Rate]).
@@ -0,0 +1,43 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(strategy_bench).
+
+%% Compares the distinct paths found per minute by the FIFO order
+%% of the scheduler against the coverage guided one, giving each
+%% program the same time budget under both strategies.
+
+-export([run/0, run/2]).
+
+%% ------------------------------------------------------------------
+%% Run function
+%% ------------------------------------------------------------------
+
+-spec run() -> ok.
+
+run() ->
+  Progs = [{demo, min, [[5,1,3,2,7,6,4]]}, {demo, foo, [1, 1]}, {demo, fib, [6]}, {big, run, [4]}],
+  run(Progs, 20000).
+
+-spec run([{atom(), atom(), [term()]}], pos_integer()) -> ok.
+
+run(Progs, Budget) ->
+  Results = [{P, [run_one(P, S, Budget) || S <- [fifo, coverage]]} || P <- Progs],
+  io:format("~n~-16s ~10s ~18s ~18s~n", ["Program", "strategy", "distinct paths", "paths/min"]),
+  lists:foreach(fun report/1, Results).
+
+%% ------------------------------------------------------------------
+%% Internal functions
+%% ------------------------------------------------------------------
+
+run_one({M, F, As}, Strategy, Budget) ->
+  Metrics = coordinator:explore(M, F, As, 30, [{strategy, Strategy}, {time_budget, Budget}]),
+  {Strategy, Metrics}.
+
+report({{M, F, _As}, Rs}) ->
+  Name = atom_to_list(M) ++ ":" ++ atom_to_list(F),
+  G = fun({S, Metrics}) ->
+    P = proplists:get_value(distinct_paths, Metrics),
+    T = proplists:get_value(elapsed, Metrics),
+    io:format("~-16s ~10s ~18w ~18.2f~n", [Name, S, P, P * 60000 / erlang:max(1, T)])
+  end,
+  lists:foreach(G, Rs).
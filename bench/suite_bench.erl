@@ -0,0 +1,145 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(suite_bench).
+
+%% Runs the concolic testing of a fixed matrix of testsuite programs
+%% and depths, with repetitions and without printing, and reports the
+%% executions and solver queries per second, the peak memory of the
+%% node (the solver ports are not included) and the distinct paths.
+%% The results are written as Erlang terms, one per program and depth,
+%% so that a later run can be compared against them with compare/2.
+
+-export([run/0, run/4, compare/2]).
+
+-define(RESULTS, "suite_bench.results").
+-define(MEMORY_TICK, 10).  %% ms between two samples of the memory
+
+-type target() :: {atom(), atom(), [term()]}.
+-type result() :: {{atom(), atom(), arity()}, pos_integer(), [{atom(), number()}] | 'failed'}.
+
+%% ------------------------------------------------------------------
+%% Run function
+%% ------------------------------------------------------------------
+
+-spec run() -> ok.
+
+run() ->
+  Targets = [{demo, min, [[5,1,3,2,7,6,4]]}, {demo, foo, [1, 1]}, {demo, fib, [6]},
+             {big, run, [4]}, {mbrot, run, [2, 4]}, {ets_test, run, [314, 2, 16]},
+             {pcmark, run, [8, 16, 16]}, {genstress, run, [proc_call, 4, 4, 4]},
+             {float_bm, main, [[]]}, {bs_bm, main, [[]]}, {call_bm, main, [[]]},
+             {fun_bm, main, [[]]}],
+  run(Targets, [10, 25], 3, ?RESULTS).
+
+%% Run every target at every depth Reps times and write the
+%% average of the repetitions to File
+-spec run([target()], [pos_integer()], pos_integer(), file:name()) -> ok.
+
+run(Targets, Depths, Reps, File) ->
+  io:format("~-24s ~6s ~12s ~12s ~14s ~10s~n", ["Program", "depth", "execs/s", "queries/s", "peak mem (KB)", "paths"]),
+  Rs = [run_one(T, D, Reps) || T <- Targets, D <- Depths],
+  lists:foreach(fun report/1, Rs),
+  ok = file:write_file(File, [io_lib:format("~p.~n", [R]) || R <- Rs]),
+  io:format("Results written to ~s~n", [File]).
+
+%% Compare the results of a run against a baseline and report
+%% the ratio of each metric (higher is better but for the memory)
+-spec compare(file:name(), file:name()) -> ok.
+
+compare(File, Baseline) ->
+  {ok, Rs} = file:consult(File),
+  {ok, Bs} = file:consult(Baseline),
+  io:format("~-24s ~6s ~12s ~12s ~14s ~10s~n", ["Program", "depth", "execs/s", "queries/s", "peak mem", "paths"]),
+  F = fun({_Key, _D, failed}) ->
+        ok;
+      ({Key, D, Ms}) ->
+        case [Ms0 || {Key0, D0, Ms0} <- Bs, Key0 =:= Key, D0 =:= D, Ms0 =/= failed] of
+          [] -> ok;
+          [Ms0|_] ->
+            Ratios = [ratio(K, Ms, Ms0) || K <- [executions_per_sec, queries_per_sec, peak_memory, distinct_paths]],
+            io:format("~-24s ~6w ~12.2f ~12.2f ~14.2f ~10.2f~n", [name(Key), D | Ratios])
+        end
+  end,
+  lists:foreach(F, Rs).
+
+%% ------------------------------------------------------------------
+%% Internal functions
+%% ------------------------------------------------------------------
+
+-spec run_one(target(), pos_integer(), pos_integer()) -> result().
+
+run_one({M, F, As}, Depth, Reps) ->
+  Runs = [headless(fun() -> coordinator:explore(M, F, As, Depth, [{iterations, 200}]) end)
+          || _ <- lists:seq(1, Reps)],
+  Key = {M, F, length(As)},
+  case [measure(Metrics, Peak) || {{ok, Metrics}, Peak} <- Runs] of
+    [] ->
+      {Key, Depth, failed};
+    Ms ->
+      Keys = [executions_per_sec, queries_per_sec, peak_memory, distinct_paths, elapsed],
+      {Key, Depth, [{K, average([proplists:get_value(K, X) || X <- Ms])} || K <- Keys]}
+  end.
+
+measure(Metrics, Peak) ->
+  T = erlang:max(1, proplists:get_value(elapsed, Metrics)),
+  Qs = lists:sum([proplists:get_value(K, Metrics) || K <- [sat, unsat, unknown, timeout]]),
+  [{executions_per_sec, proplists:get_value(executions, Metrics) * 1000 / T},
+   {queries_per_sec, Qs * 1000 / T},
+   {peak_memory, Peak},
+   {distinct_paths, proplists:get_value(distinct_paths, Metrics)},
+   {elapsed, T}].
+
+%% Run a function in a process whose output is dropped and
+%% return its result along with the peak memory of the node
+headless(F) ->
+  Self = self(),
+  Null = spawn_link(fun null_io/0),
+  Mem = spawn_link(fun() -> peak_memory(erlang:memory(total)) end),
+  {Pid, Ref} = spawn_monitor(fun() ->
+    group_leader(Null, self()),
+    Self ! {self(), F()}
+  end),
+  R =
+    receive
+      {Pid, X} ->
+        erlang:demonitor(Ref, [flush]),
+        {ok, X};
+      {'DOWN', Ref, process, Pid, Why} ->
+        {error, Why}
+    end,
+  Mem ! {self(), peak},
+  Peak = receive {Mem, P} -> P end,
+  Null ! stop,
+  {R, Peak}.
+
+null_io() ->
+  receive
+    {io_request, From, ReplyAs, _Request} ->
+      From ! {io_reply, ReplyAs, ok},
+      null_io();
+    stop ->
+      ok
+  end.
+
+peak_memory(Max) ->
+  receive
+    {From, peak} -> From ! {self(), Max}
+  after ?MEMORY_TICK ->
+    peak_memory(erlang:max(Max, erlang:memory(total)))
+  end.
+
+report({Key, D, failed}) ->
+  io:format("~-24s ~6w failed~n", [name(Key), D]);
+report({Key, D, Ms}) ->
+  io:format("~-24s ~6w ~12.2f ~12.2f ~14w ~10.1f~n",
+            [name(Key), D, proplists:get_value(executions_per_sec, Ms), proplists:get_value(queries_per_sec, Ms),
+             round(proplists:get_value(peak_memory, Ms) / 1024), proplists:get_value(distinct_paths, Ms)]).
+
+name({M, F, A}) ->
+  atom_to_list(M) ++ ":" ++ atom_to_list(F) ++ "/" ++ integer_to_list(A).
+
+ratio(K, Ms, Ms0) ->
+  proplists:get_value(K, Ms) / erlang:max(1.0e-9, proplists:get_value(K, Ms0)).
+
+average(Xs) ->
+  lists:sum(Xs) / length(Xs).
@@ -1,40 +1,95 @@
-import json, traceback
+import json, sys, time, traceback
 from json_utils import *
 from z3_utils import *
 
+## Status of a query whose command raised an exception
+## (Erlang counts it as unknown)
+ERROR = "error"
+
 ## Main Program
 
 try:
   erlz3 = ErlangZ3()
   erlport = ErlangPort()
-  
+
+  ## Set when loading the current query failed
+  failed = False
   wait = True
   while wait:
     data = erlport.receive()
+    if data is None:
+      break
     cmd = PortCommand(data)
-    
-    if cmd.type == "load":
-      f, start, end = cmd.args
-      for c in JsonReader(f, end):
-        erlz3.json_command_to_z3(c)
-      
-    elif cmd.type == "check":
-      wait = False
-  
-  chk = erlz3.solve()
-  erlport.send(str(erlz3.check))
-  
-  if chk:
-    data = erlport.receive()
-    cmd = PortCommand(data)
-    if cmd.type == "model":
-      sol = erlz3.z3_solution_to_json()
-      erlport.send(str(json.dumps(sol)))
-    
+    ## Replies to a command that raised an exception, so that Erlang
+    ## gets what it waits for and the worker is kept for the next query
+    pending = []
+
+    try:
+      if cmd.type == "load":
+        f, start, end = cmd.args
+        t = time.time()
+        erlz3.load_query(list(TraceReader(f, end)))
+        erlz3.times.add("trace_loading", time.time() - t)
+
+      elif cmd.type == "check":
+        pending = [ERROR]
+        if (failed):
+          erlport.send(ERROR)
+        else:
+          chk = erlz3.solve()
+          erlport.send(erlz3.status())
+
+      elif cmd.type == "model":
+        ## A model that could not be generated is streamed as ERROR
+        pending = [ERROR, ""]
+        sol = erlz3.z3_solution_to_json()
+        msg = "".join(json.JSONEncoder().iterencode(sol))
+        erlport.send_stream([msg])
+
+      elif cmd.type == "solve_all":
+        f, indices = cmd.args
+        pending = [ERROR for i in set(indices)]
+        end = max(indices) if indices != [] else 0
+        ## The trace is loaded in between the checks
+        t, spent = time.time(), erlz3.times.total()
+        rd = TraceReader(f, end)
+        for i, chk, sol in erlz3.solve_negations(rd.commands(), indices, rd.decode):
+          if sol is not None:
+            msg = "".join(json.JSONEncoder().iterencode(sol))
+          erlport.send(chk)
+          if sol is not None:
+            erlport.send_stream([msg])
+          pending.pop()
+        erlz3.times.add("trace_loading", time.time() - t - (erlz3.times.total() - spent))
+
+      elif cmd.type == "limits":
+        timeout, rlimit, retries = cmd.args
+        erlz3.set_limits(timeout, rlimit, retries)
+
+      elif cmd.type == "reset":
+        failed = False
+        erlz3.reset()
+
+      elif cmd.type == "stats":
+        pending = [ERROR]
+        erlport.send(erlz3.cache.stats())
+
+      elif cmd.type == "timings":
+        pending = [ERROR]
+        erlport.send(erlz3.times.report())
+
+      elif cmd.type == "stop":
+        wait = False
+
+    except Exception:
+      sys.stderr.write(traceback.format_exc())
+      failed = (cmd.type == "load")
+      erlz3.reset()
+      for r in pending:
+        erlport.send(r)
+
 #    yy = JsonWriter("sol")
 #    yy.write(sol)
 except:
   e = traceback.format_exc()
   erlport.send(e)
-
-
@@ -1,21 +1,44 @@
-import gzip, json, struct, sys
+import gzip, json, os, struct, sys
 
+## Messages are framed with a 4-byte length ({packet, 4})
 class ErlangPort:
+  ## Size of the frames of a streamed message
+  CHUNK = 1 << 16
+  
   def __init__(self):
     self.chan_in = sys.stdin
     self.chan_out = sys.stdout
   
   def receive(self):
-    x = self.chan_in.read(2)
-    if (len(x) == 2):
-      sz = struct.unpack('!h', x)[0]
+    x = self.chan_in.read(4)
+    if (len(x) == 4):
+      sz = struct.unpack('!I', x)[0]
       return self.chan_in.read(sz)
+    else:
+      return None
   
   def send(self, data):
-    sz = len(data)
-    x = struct.pack('!h', sz)
-    self.chan_out.write(x)
-    return self.chan_out.write(data)
+    self.write(data)
+    return self.chan_out.flush()
+  
+  ## Send the pieces of a message in frames of about CHUNK bytes
+  ## followed by an empty frame that marks its end
+  def send_stream(self, pieces):
+    buf, sz = [], 0
+    for p in pieces:
+      buf.append(p)
+      sz += len(p)
+      if (sz >= self.CHUNK):
+        self.write("".join(buf))
+        buf, sz = [], 0
+    if (buf != []):
+      self.write("".join(buf))
+    self.write("")
+    return self.chan_out.flush()
+  
+  def write(self, data):
+    self.chan_out.write(struct.pack('!I', len(data)))
+    self.chan_out.write(data)
 
 class PortCommand:
   def __init__(self, port_data):
@@ -28,55 +51,122 @@ class PortCommand:
       self.args = tuple(cmd["a"])
 
 
-class BinaryEOF(Exception):
-  def __init__(self):
-    pass
-  def __str__(self):
-    return 'EOF encountered'
+## Trace file header (see concolic_encdec)
+TRACE_MAGIC = "CCT"
+TRACE_JSON = 1
+TRACE_BINARY = 2
+GZIP_MAGIC = "\x1f\x8b"
+
+## Trace index sidecar (see concolic_encdec)
+INDEX_MAGIC = "CCI"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+## Open a trace file with the reader of its encoding
+## Traces kept in shared memory are not compressed
+def TraceReader(filename, end):
+  fd = open(filename, 'rb')
+  if (fd.read(2) == GZIP_MAGIC):
+    fd.close()
+    fd = gzip.open(filename, 'rb')
+  else:
+    fd.seek(0)
+  hdr = fd.read(4)
+  if (len(hdr) != 4 or hdr[:3] != TRACE_MAGIC):
+    fd.close()
+    raise ValueError("invalid trace header in %s" % filename)
+  version = struct.unpack('B', hdr[3])[0]
+  limit = trace_limit(filename, end)
+  if (version == TRACE_BINARY):
+    return BinaryReader(fd, end, limit)
+  else:
+    return JsonReader(fd, end, limit)
+
+## The number of decompressed bytes after the header that hold
+## the first end constraints of a trace, looked up in its index
+## Returns None when the trace has no index that covers them
+def trace_limit(filename, end):
+  idxfile = filename + INDEX_SUFFIX
+  if (not os.path.exists(idxfile)):
+    return None
+  with open(idxfile, 'rb') as f:
+    idx = f.read()
+  if (idx[:3] != INDEX_MAGIC or idx[3:4] != chr(INDEX_VERSION)):
+    return None
+  n = (len(idx) - 4) // 5
+  if (end < 1 or end > n):
+    return None
+  return struct.unpack_from('!I', idx, 4 + 5 * (end - 1) + 1)[0]
 
 class JsonReader:
-  def __init__(self, filename, end):
-    self.fd = gzip.open(filename, 'rb')
+  ## Size of the decompressed blocks read from the trace
+  BLOCK = 1 << 20
+  
+  def __init__(self, fd, end, limit=None):
+    self.fd = fd
     self.cnt = 0
     self.end = end
+    self.buf = ""
+    self.off = 0
+    ## Bytes left to decompress, if known from the index
+    self.left = limit
   
-  def size(self):
-    x = [struct.unpack('B', self.fd.read(1))[0] for z in range(4)]
-    return (x[0] << 24) | (x[1] << 16) | (x[2] << 8) | x[3]
+  def decode(self, data):
+    return json.loads(data)
   
   def reverse_constraint(self, json_data):
     json_data["r"] = True
     return json_data
   
-  def kind(self):
-    x = self.fd.read(1)
-    if (x == ""):
-      raise BinaryEOF
-    else:
-      return struct.unpack('B', x)[0]
+  ## Ensure that n bytes are buffered after off
+  ## Returns False if the trace ends before that
+  def fill(self, n):
+    while (len(self.buf) - self.off < n):
+      size = self.BLOCK
+      if (self.left is not None):
+        size = min(size, self.left)
+      if (size == 0):
+        return False
+      block = self.fd.read(size)
+      if (block == ""):
+        return False
+      if (self.left is not None):
+        self.left -= len(block)
+      self.buf = self.buf[self.off:] + block
+      self.off = 0
+    return True
   
-  def read(self, sz):
-    return self.fd.read(sz)
+  ## Iterate over the raw records of the trace as (kind, data) pairs
+  def records(self):
+    while (self.fill(5)):
+      k, sz = struct.unpack_from('!BI', self.buf, self.off)
+      self.off += 5
+      if (not self.fill(sz)):
+        return
+      data = self.buf[self.off:self.off+sz]
+      self.off += sz
+      yield (k, data)
   
   def __iter__(self):
-    return self
-  
-  def next(self):
-    if (self.cnt == self.end):
-      raise StopIteration
-    try:
-      k = self.kind()
-      if (self.is_constraint(k)):
-        self.cnt += 1
-      sz = self.size()
-      data = self.read(sz)
-      json_data = json.loads(data)
+    for c, data in self.commands():
+      json_data = self.decode(data)
       if (self.cnt == self.end):
-        return self.reverse_constraint(json_data)
+        yield self.reverse_constraint(json_data)
       else:
-        return json_data
-    except BinaryEOF:
-      raise StopIteration
+        yield json_data
+  
+  ## Iterate over the raw records of the first end constraints
+  ## (and the commands in between) as (is_constraint, data) pairs
+  def commands(self):
+    if (self.cnt >= self.end):
+      return
+    for k, data in self.records():
+      c = self.is_constraint(k)
+      if (c):
+        self.cnt += 1
+      yield (c, data)
+      if (self.cnt >= self.end):
+        return
   
   def is_constraint(self, t):
     if (t == 1 or t == 2):
@@ -87,6 +177,114 @@ class JsonReader:
   def __del__(self):
     self.fd.close()
 
+OPCODES = [
+  "T", "F", "Eq", "Neq", "Ts", "Nts", "Nel", "El", "Nl", "Nt",
+  "M", "Nm", "Nmv", "Bkl", "Bkt", "Pms", "Psp", "=:=", "=/=", "<",
+  ">", ">=", "=<", "+", "-", "*", "/", "div", "rem", "or",
+  "ore", "and", "anda", "not", "xor", "hd", "tl", "abs", "elm", "flt",
+  "isa", "isb", "isf", "isi", "isl", "isn", "ist", "rnd", "trc", "ltt",
+  "ttl", "len", "tpls", "mtpl2",
+]
+
+## Value tags (see concolic_binary)
+TAG_SYMB_NEW = 0
+TAG_SYMB = 1
+TAG_INT = 2
+TAG_REAL = 3
+TAG_ATOM = 4
+TAG_LIST = 5
+TAG_TUPLE = 6
+TAG_ALIAS = 7
+TAG_SHARED = 8
+TAG_ARRAY = 9
+TAG_TYPESIG = 10
+
+## Reader of the compact binary trace format
+## Decodes each record to the same structure as its JSON encoding
+class BinaryReader(JsonReader):
+  def __init__(self, fd, end, limit=None):
+    JsonReader.__init__(self, fd, end, limit)
+    self.symbols = {}
+    self.decoded = 0
+  
+  def decode(self, data):
+    self.data = data
+    self.pos = 0
+    self.decoded += 1
+    op = self.byte()
+    n = self.varint()
+    args = [self.value() for i in range(n)]
+    return {"c" : OPCODES[op], "a" : args}
+  
+  def byte(self):
+    b = ord(self.data[self.pos])
+    self.pos += 1
+    return b
+  
+  def varint(self):
+    x, shift = 0, 0
+    while True:
+      b = ord(self.data[self.pos])
+      self.pos += 1
+      x |= (b & 127) << shift
+      if (b < 128):
+        return x
+      shift += 7
+  
+  def string(self):
+    n = self.varint()
+    s = self.data[self.pos:self.pos+n]
+    self.pos += n
+    return s
+  
+  def value(self):
+    tag = self.byte()
+    if (tag == TAG_SYMB_NEW):
+      i = self.varint()
+      self.symbols[i] = self.string()
+      return {"s" : self.symbols[i]}
+    elif (tag == TAG_SYMB):
+      return {"s" : self.symbols[self.varint()]}
+    elif (tag == TAG_ARRAY):
+      return [self.value() for i in range(self.varint())]
+    elif (tag == TAG_TYPESIG):
+      return json.loads(self.string())
+    elif (tag == TAG_SHARED):
+      d = {}
+      for i in range(self.varint()):
+        k = self.alias(self.varint())
+        d[k] = self.term(self.byte())
+      t = self.term(self.byte())
+      t["d"] = d
+      return t
+    else:
+      return self.term(tag)
+  
+  ## Aliases are only unique within a record, so they are
+  ## qualified with the number of the decoded record
+  def alias(self, i):
+    return "_l%d.%d" % (self.decoded, i)
+  
+  def term(self, tag):
+    if (tag == TAG_INT):
+      z = self.varint()
+      v = (z >> 1) if (z & 1 == 0) else -((z + 1) >> 1)
+      return {"t" : "Int", "v" : v}
+    elif (tag == TAG_REAL):
+      v = struct.unpack_from('!d', self.data, self.pos)[0]
+      self.pos += 8
+      return {"t" : "Real", "v" : v}
+    elif (tag == TAG_ATOM):
+      return {"t" : "Atom", "v" : [self.varint() for i in range(self.varint())]}
+    elif (tag == TAG_LIST):
+      return {"t" : "List", "v" : [self.term(self.byte()) for i in range(self.varint())]}
+    elif (tag == TAG_TUPLE):
+      return {"t" : "Tuple", "v" : [self.term(self.byte()) for i in range(self.varint())]}
+    elif (tag == TAG_ALIAS):
+      return {"l" : self.alias(self.varint())}
+    else:
+      raise ValueError("unknown tag %d" % tag)
+
 class JsonWriter:
   def __init__(self, filename):
     self.fd = open(filename, 'wb')
@@ -1,4 +1,4 @@
-import json
+import collections, copy, hashlib, json, time
 from z3 import *
 
 class Env:
@@ -6,6 +6,18 @@ class Env:
     self.cnt = 0
     self.e = {}
     self.params = []
+    self.scopes = []
+  
+  ## Open a new scope; bindings and parameters made in it
+  ## are forgotten on pop()
+  def push(self):
+    self.scopes.append(([], len(self.params)))
+  
+  def pop(self):
+    ss, n = self.scopes.pop()
+    for s in ss:
+      del self.e[s]
+    del self.params[n:]
   
   def add_param(self, x):
     self.params.append(x)
@@ -20,28 +32,388 @@ class Env:
     self.cnt += 1
     x =  Const("x%s" % self.cnt, Type)
     self.e[s] = x
+    if (self.scopes != []):
+      self.scopes[-1][0].append(s)
     return x
 
+## Groups the commands of a trace by the symbolic variables they share
+## so that only the commands connected to a negated constraint are
+## sent to the solver. The parameters that are left out keep their
+## values from the execution that produced the trace.
+class Slicer:
+  def __init__(self):
+    self.parent = {}
+    self.cmds = []
+  
+  def find(self, x):
+    root = self.parent.setdefault(x, x)
+    while (root != self.parent[root]):
+      root = self.parent[root]
+    while (x != root):
+      x, self.parent[x] = self.parent[x], root
+    return root
+  
+  def union(self, xs):
+    if (xs != []):
+      r = self.find(xs[0])
+      for x in xs[1:]:
+        self.parent[self.find(x)] = r
+  
+  ## Add a command of the trace and the item that stands for it
+  ## The parameter definitions are part of every slice
+  def add(self, json_data, item):
+    if (json_data["c"] == "Pms"):
+      self.cmds.append((None, item))
+    else:
+      xs = json_refs(json_data["a"])
+      self.union(xs)
+      self.cmds.append((xs[0] if (xs != []) else None, item))
+  
+  ## The items of the commands connected to a constraint
+  def slice(self, json_data):
+    roots = set(self.find(x) for x in json_refs(json_data["a"]))
+    return [item for x, item in self.cmds if (x is None or self.find(x) in roots)]
+
+## The symbolic variables and the aliases that a JSON value refers to,
+## including the ones in the definitions of its aliases
+## An alias is named ("l", Name), as alias names are unique in a trace
+## and may be shared by the commands
+def json_refs(x, acc=None):
+  if (acc is None):
+    acc = []
+  if (isinstance(x, list)):
+    for y in x:
+      json_refs(y, acc)
+  elif (isinstance(x, dict)):
+    if ("s" in x):
+      acc.append(x["s"])
+    elif ("l" in x):
+      acc.append(("l", x["l"]))
+    else:
+      if ("v" in x):
+        json_refs(x["v"], acc)
+      if ("d" in x):
+        for a in sorted(x["d"]):
+          acc.append(("l", a))
+          json_refs(x["d"][a], acc)
+  return acc
+
+## The names of the symbolic variables in a JSON value
+def symbolic_vars(x):
+  return [y for y in json_refs(x) if (not isinstance(y, tuple))]
+
+## Collects the assertions made while encoding a command
+class Assertions(list):
+  def add(self, *xs):
+    self.extend(xs)
+
+## Canonical hash of a sequence of commands
+## Symbolic variables and aliases are renamed in the order they
+## appear, so that the same query from different executions
+## gets the same key
+class QueryKey:
+  def __init__(self):
+    self.names = {}
+    self.h = hashlib.sha1()
+  
+  def copy(self):
+    k = QueryKey()
+    k.names = dict(self.names)
+    k.h = self.h.copy()
+    return k
+  
+  def add(self, json_data):
+    self.h.update(json.dumps(self.canonical(json_data), sort_keys=True))
+  
+  def digest(self):
+    return self.h.digest()
+  
+  def rename(self, x):
+    if (x not in self.names):
+      self.names[x] = len(self.names)
+    return "#%d" % self.names[x]
+  
+  def canonical(self, x):
+    if (isinstance(x, list)):
+      return [self.canonical(y) for y in x]
+    elif (not isinstance(x, dict)):
+      return x
+    c = {}
+    for k in sorted(x.keys()):
+      if (k == "s" or k == "l"):
+        c[k] = self.rename(x[k])
+      elif (k != "d"):
+        c[k] = self.canonical(x[k])
+    if ("d" in x):
+      c["d"] = self.canonical_aliases(x["d"])
+    return c
+  
+  ## Visit the shared subterms in the order their aliases were renamed
+  def canonical_aliases(self, d):
+    c = {}
+    left = set(d.keys())
+    while (left):
+      seen = [k for k in left if k in self.names]
+      if (seen != []):
+        k = min(seen, key=lambda k: self.names[k])
+      else:
+        k = min(left)
+      left.remove(k)
+      c[self.rename(k)] = self.canonical(d[k])
+    return c
+
+## LRU cache of solver results keyed by QueryKey digests
+## It also keeps the most recent models to try them on new queries
+class SolverCache:
+  def __init__(self, size=4096, models=4):
+    self.size = size
+    self.entries = collections.OrderedDict()
+    self.recent = collections.deque(maxlen=models)
+    self.hits = 0
+    self.model_hits = 0
+    self.misses = 0
+  
+  def lookup(self, key):
+    if (key not in self.entries):
+      return None
+    r = self.entries.pop(key)
+    self.entries[key] = r
+    self.hits += 1
+    if (r[1] is not None):
+      self.use_model(r[1])
+    return r
+  
+  def store(self, key, check, vals):
+    if (check != sat and check != unsat):
+      return
+    self.entries[key] = (check, vals)
+    if (len(self.entries) > self.size):
+      self.entries.popitem(last=False)
+    if (vals is not None):
+      self.use_model(vals)
+  
+  def use_model(self, vals):
+    if (vals in self.recent):
+      self.recent.remove(vals)
+    self.recent.appendleft(vals)
+  
+  def models(self):
+    return list(self.recent)
+  
+  def stats(self):
+    return "%d %d %d" % (self.hits, self.model_hits, self.misses)
+
+## Wall time and counts of the phases of the port
+## Reported to Erlang as "Phase Count Microseconds ..."
+class PhaseTimes:
+  def __init__(self):
+    self.phases = collections.OrderedDict(
+      (p, [0, 0.0]) for p in ("trace_loading", "solver_check", "model_decoding"))
+  
+  def add(self, phase, secs, n=1):
+    t = self.phases[phase]
+    t[0] += n
+    t[1] += secs
+  
+  def total(self):
+    return sum(t[1] for t in self.phases.values())
+  
+  def report(self):
+    return " ".join("%s %d %d" % (p, n, int(secs * 1e6)) for p, (n, secs) in self.phases.items())
+
 class ErlangZ3:
   def __init__(self):
     self.Term, self.List, self.Atom = self.erlang_types()
     self.env = Env()
     self.solver = Solver()
+    ## Encoded concrete terms (they outlive reset)
+    self.shared = {}
+    self.max_shared = 1 << 16
     self.atom_true = self.json_term_to_z3(json.loads("{\"t\" : \"Atom\", \"v\" : [116,114,117,101]}"))
     self.atom_false = self.json_term_to_z3(json.loads("{\"t\" : \"Atom\", \"v\" : [102,97,108,115,101]}"))
     self.atom_infinity = self.json_term_to_z3(json.loads("{\"t\" : \"Atom\", \"v\" : [105,110,102,105,110,105,116,121]}"))
+    ## Lists are constrained by recursive functions when Z3 supports
+    ## them, otherwise by If-chains unrolled up to max_len elements
+    self.recursive = ("RecFunction" in globals())
     self.max_len = 100
+    self.rec_funs = {}
     self.check = None
     self.model = None
+    self.cache = SolverCache()
+    self.query = QueryKey()
+    self.solution = None
+    self.slicing = True
+    ## Bounds of each check() (None is unbounded)
+    self.timeout = None
+    self.rlimit = None
+    self.retries = 0
+    self.times = PhaseTimes()
+  
+  ## Bound the time (in ms) and the resources of each check()
+  ## A check that hits a bound is retried up to retries times,
+  ## doubling the bounds each time
+  def set_limits(self, timeout, rlimit, retries):
+    self.timeout = timeout
+    self.rlimit = rlimit
+    self.retries = retries
+    self._scale_limits(1)
+  
+  def _scale_limits(self, k):
+    if (self.timeout is not None):
+      self.solver.set("timeout", self.timeout * k)
+    if (self.rlimit is not None):
+      self.solver.set("rlimit", self.rlimit * k)
+  
+  ## Drop all asserted constraints and bindings but keep
+  ## the declared datatypes so that the instance can be reused
+  def reset(self):
+    self.env = Env()
+    self.solver.reset()
+    self._scale_limits(1)
+    self.check = None
+    self.model = None
+    self.query = QueryKey()
+    self.solution = None
+  
+  ## Encode a query to Z3
+  ## When its last command is a negated constraint, only the commands
+  ## connected to it are encoded
+  def load_query(self, cmds):
+    for c in cmds:
+      self.query.add(c)
+    if (self.slicing and cmds != [] and "r" in cmds[-1]):
+      sl = Slicer()
+      for c in cmds[:-1]:
+        sl.add(c, c)
+      cmds = sl.slice(cmds[-1]) + cmds[-1:]
+    for c in cmds:
+      self.json_command_to_z3(c)
   
   ## Solve a Constraint Set
-  def solve(self):
-    self.check = self.solver.check()
-    if (self.check == sat):
-      self.model = self.solver.model()
-      return True
+  ## The cached result of the same query is used if there is one,
+  ## then the recent models are tried before calling Z3
+  def solve(self, query=None):
+    key = (query or self.query).digest()
+    r = self.cache.lookup(key)
+    if (r is not None):
+      self.check, self.solution = r
     else:
-      return False
+      vals = self._reuse_model()
+      if (vals is not None):
+        self.cache.model_hits += 1
+        self.check = sat
+      else:
+        self.cache.misses += 1
+        t = time.time()
+        self.check = self._check()
+        self.times.add("solver_check", time.time() - t)
+        if (self.check == sat):
+          t = time.time()
+          self.model = self.solver.model()
+          vals = [self.z3_param_to_json(s) for s in self.env.params]
+          self.times.add("model_decoding", time.time() - t)
+      self.solution = vals
+      self.cache.store(key, self.check, vals)
+    return (self.check == sat)
+  
+  ## Call Z3, retrying with larger bounds when it runs out of them
+  def _check(self):
+    chk = self.solver.check()
+    n = 0
+    while (chk == unknown and self._hit_limit() and n < self.retries):
+      n += 1
+      self._scale_limits(2 ** n)
+      chk = self.solver.check()
+    if (n > 0):
+      self._scale_limits(1)
+    return chk
+  
+  def _hit_limit(self):
+    r = self.solver.reason_unknown()
+    return ("timeout" in r or "canceled" in r or "resource" in r)
+  
+  ## The outcome of the last solve as reported to Erlang
+  ## An unknown result because of the bounds is a timeout
+  def status(self):
+    if (self.check == unknown and self._hit_limit()):
+      return "timeout"
+    return str(self.check)
+  
+  ## Find a recent model that also satisfies the current query
+  def _reuse_model(self):
+    ps = self.env.params
+    for vals in self.cache.models():
+      if (len(vals) == len(ps) and "any" not in vals and self._satisfies(vals)):
+        return vals
+    return None
+  
+  ## Check the asserted constraints with the parameters bound to vals
+  def _satisfies(self, vals):
+    self.solver.push()
+    for s, v in zip(self.env.params, vals):
+      x = self.env.lookup(s)
+      self.solver.add(x == self.json_term_to_z3(copy.deepcopy(v)))
+    t = time.time()
+    chk = self.solver.check()
+    self.times.add("solver_check", time.time() - t)
+    self.solver.pop()
+    return (chk == sat)
+  
+  ## Solve the negation of each constraint in indices
+  ## Without slicing, the prefix of the trace stays asserted between
+  ## the queries; with slicing, each command is encoded once and each
+  ## query asserts the encodings of its own slice
+  ## Yields (index, check, solution) with solution None when not sat
+  ## The records of commands are decoded with decode
+  def solve_negations(self, commands, indices, decode=json.loads):
+    targets = sorted(set(indices))
+    cnt = 0
+    sl = Slicer()
+    for is_constraint, data in commands:
+      if (targets == []):
+        break
+      json_data = decode(data)
+      if (is_constraint):
+        cnt += 1
+        if (cnt == targets[0]):
+          targets.pop(0)
+          yield self._solve_negation(cnt, json_data, sl)
+      self.query.add(json_data)
+      if (self.slicing):
+        sl.add(json_data, self._assertions(json_data))
+      else:
+        self.json_command_to_z3(json_data)
+    for i in targets:
+      yield (i, "unknown", None)
+  
+  def _solve_negation(self, i, json_data, sl):
+    self.solver.push()
+    self.env.push()
+    json_data = dict(json_data, r=True)
+    q = self.query.copy()
+    q.add(json_data)
+    if (self.slicing):
+      for xs in sl.slice(json_data):
+        if (xs != []):
+          self.solver.add(*xs)
+    self.json_command_to_z3(json_data)
+    sol = None
+    if (self.solve(q)):
+      sol = self.z3_solution_to_json()
+    self.env.pop()
+    self.solver.pop()
+    return (i, self.status(), sol)
+  
+  ## Encode a command and return the assertions it makes
+  ## instead of adding them to the solver
+  ## Its bindings are kept in the current scope of the environment
+  def _assertions(self, json_data):
+    solver, self.solver = self.solver, Assertions()
+    try:
+      self.json_command_to_z3(json_data)
+      return list(self.solver)
+    finally:
+      self.solver = solver
   
   ## Define the Erlang Type System
   def erlang_types(*args):
@@ -83,51 +455,66 @@ class ErlangZ3:
       return x
   
   def _json_concrete_term_to_z3(self, json_data, d):
-    e = self.env
+    return self._json_shared_term_to_z3(json_data, d)[0]
+  
+  ## Encode a concrete term so that equal concrete sub-terms share
+  ## one Z3 expression. Returns the expression and the key of the
+  ## term, which is None when the term contains aliases
+  def _json_shared_term_to_z3(self, json_data, d):
     if ("l" in json_data):
-      return self._json_alias_term_to_z3(json_data, d)
+      return (self._json_alias_term_to_z3(json_data, d), None)
+    t, val = json_data["t"], json_data["v"]
+    if (t == "List" or t == "Tuple"):
+      encs = [self._json_shared_term_to_z3(x, d) for x in val]
+      keys = tuple([k for (_, k) in encs])
+      key = None if (None in keys) else (t, keys)
+    elif (t == "Atom"):
+      encs, key = None, (t, tuple(val))
     else:
-      opts = {
-        "Int" : self._json_int_term_to_z3,
-        "Real" : self._json_real_term_to_z3,
-        "List" : self._json_list_term_to_z3,
-        "Tuple" : self._json_tuple_term_to_z3,
-        "Atom" : self._json_atom_term_to_z3,
-      }
-      return opts[json_data["t"]](json_data["v"], d)
-  
-  
-  def _json_int_term_to_z3(self, val, d):
+      encs, key = None, (t, val)
+    if (key is not None):
+      term = self.shared.get(key)
+      if (term is not None):
+        return (term, key)
+    opts = {
+      "Int" : self._json_int_term_to_z3,
+      "Real" : self._json_real_term_to_z3,
+      "List" : self._json_list_term_to_z3,
+      "Tuple" : self._json_tuple_term_to_z3,
+      "Atom" : self._json_atom_term_to_z3,
+    }
+    term = opts[t](val, encs)
+    if (key is not None):
+      if (len(self.shared) >= self.max_shared):
+        self.shared.clear()
+      self.shared[key] = term
+    return (term, key)
+  
+  def _json_int_term_to_z3(self, val, encs):
     return self.Term.int(val)
   
-  def _json_real_term_to_z3(self, val, d):
+  def _json_real_term_to_z3(self, val, encs):
     return self.Term.real(val)
   
-  def _json_list_term_to_z3(self, val, d):
-    val.reverse()
-    term = self.List.nil
-    while val != []:
-      head, val = val[0], val[1:]
-      enc_head = self._json_concrete_term_to_z3(head, d)
-      term = self.List.cons(enc_head, term)
-    return self.Term.lst(term)
-  
-  def _json_tuple_term_to_z3(self, val, d):
-    val.reverse()
-    term = self.List.nil
-    while val != []:
-      head, val = val[0], val[1:]
-      enc_head = self._json_concrete_term_to_z3(head, d)
-      term = self.List.cons(enc_head, term)
-    return self.Term.tpl(term)
-  
-  def _json_atom_term_to_z3(self, val, d):
-    val.reverse()
-    term = self.Atom.anil
-    while val != []:
-      head, val = val[0], val[1:]
-      term = self.Atom.acons(head, term)
-    term = self.Term.atm(term)
+  def _json_list_term_to_z3(self, val, encs):
+    return self.Term.lst(self._z3_list(encs))
+  
+  def _json_tuple_term_to_z3(self, val, encs):
+    return self.Term.tpl(self._z3_list(encs))
+  
+  def _json_atom_term_to_z3(self, val, encs):
+    A = self.Atom
+    term = A.anil
+    for c in reversed(val):
+      term = A.acons(c, term)
+    return self.Term.atm(term)
+  
+  ## Build a List of already encoded elements
+  def _z3_list(self, encs):
+    L = self.List
+    term = L.nil
+    for (x, _) in reversed(encs):
+      term = L.cons(x, term)
     return term
   
   def _json_alias_term_to_z3(self, json_data, d):
@@ -142,57 +529,54 @@ class ErlangZ3:
       self.solver.add(x == y)
       return x
   
-  ## Decode a Z3 object to an Erlang term in JSON representation
+  ## Decode a Z3 value of a model to an Erlang term in JSON representation
+  ## Model values are constructor applications, so they are walked by
+  ## the names of their declarations without any simplify round-trips
   def z3_term_to_json(self, term):
-    T = self.Term
-    if (is_true(simplify(T.is_int(term)))):
-      return self._z3_int_term_to_json(T.ival(term))
-    elif (is_true(simplify(T.is_real(term)))):
-      return self._z3_real_term_to_json(T.rval(term))
-    elif (is_true(simplify(T.is_lst(term)))):
-      return self._z3_list_term_to_json(T.lval(term))
-    elif (is_true(simplify(T.is_tpl(term)))):
-      return self._z3_tuple_term_to_json(T.tval(term))
-    elif (is_true(simplify(T.is_atm(term)))):
-      return self._z3_atom_term_to_json(T.aval(term))
-  
-  def _z3_int_term_to_json(self, t):
-    return {"t" : "Int", "v" : simplify(t).as_long()}
-  
-  def _z3_real_term_to_json(self, t):
-    s = simplify(t)
-    f = float(s.numerator_as_long()) / float(s.denominator_as_long())
-    return {"t" : "Real", "v" : f}
+    f = term.decl().name()
+    if (f == "int"):
+      return {"t" : "Int", "v" : self._z3_value(term.arg(0)).as_long()}
+    elif (f == "real"):
+      return {"t" : "Real", "v" : self._z3_real_to_json(term.arg(0))}
+    elif (f == "lst"):
+      return {"t" : "List", "v" : self._z3_list_to_json(term.arg(0))}
+    elif (f == "tpl"):
+      return {"t" : "Tuple", "v" : self._z3_list_to_json(term.arg(0))}
+    elif (f == "atm"):
+      return {"t" : "Atom", "v" : self._z3_atom_to_json(term.arg(0))}
+    else:
+      return self.z3_term_to_json(self._z3_value(term))
   
-  def _z3_list_term_to_json(self, t):
-    L = self.List
-    s = simplify(t)
-    r = []
-    while (is_true(simplify(L.is_cons(s)))):
-      hd = simplify(L.hd(s))
-      s = simplify(L.tl(s))
-      r.append(self.z3_term_to_json(hd))
-    return {"t" : "List", "v" : r}
+  def _z3_real_to_json(self, t):
+    s = self._z3_value(t)
+    return float(s.numerator_as_long()) / float(s.denominator_as_long())
   
-  def _z3_tuple_term_to_json(self, t):
-    L = self.List
-    s = simplify(t)
+  def _z3_list_to_json(self, t):
     r = []
-    while (is_true(simplify(L.is_cons(s)))):
-      hd = simplify(L.hd(s))
-      s = simplify(L.tl(s))
-      r.append(self.z3_term_to_json(hd))
-    return {"t" : "Tuple", "v" : r}
-  
-  def _z3_atom_term_to_json(self, t):
-    A = self.Atom
-    s = simplify(t)
+    while (t.decl().name() == "cons"):
+      r.append(self.z3_term_to_json(t.arg(0)))
+      t = t.arg(1)
+    if (t.decl().name() != "nil"):
+      return r + self._z3_list_to_json(self._z3_value(t))
+    return r
+  
+  def _z3_atom_to_json(self, t):
     r = []
-    while (is_true(simplify(A.is_acons(s)))):
-      hd = simplify(A.ahd(s))
-      s = simplify(A.atl(s))
-      r.append(simplify(hd).as_long())
-    return {"t" : "Atom", "v" : r}
+    while (t.decl().name() == "acons"):
+      r.append(self._z3_value(t.arg(0)).as_long())
+      t = t.arg(1)
+    if (t.decl().name() != "anil"):
+      return r + self._z3_atom_to_json(self._z3_value(t))
+    return r
+  
+  ## Only parts of a value that are not in normal form are simplified
+  def _z3_value(self, t):
+    if (is_int_value(t) or is_rational_value(t)):
+      return t
+    s = simplify(t)
+    if (s.eq(t)):
+      raise ValueError("cannot decode the model value %s" % t)
+    return s
   
   ## Encode Commands in JSON representation to Z3
   def json_command_to_z3(self, json_data):
@@ -478,27 +862,47 @@ class ErlangZ3:
     x = T.lval(x)
     if NonEmpty:
       es.append(L.is_cons(x))
-    if String or info["t"] != "any":
-      acc = []
-      for i in range (0, self.max_len):
-        h = L.hd(x)
-        if String:
-          typesig = self._bind_term_to_char(h, "", "")
-        else:
-          typesig = self._bind_term_to_typesig(h, info)
-        acc.append(
-          (L.is_cons(x), typesig, L.is_nil(x))
-        )
-        x = L.tl(x)
-      ax = None
-      for (c, t, f) in reversed(acc):
-        if ax == None:
-          ax = If(c, t, f)
-        else:
-          ax = If(c, And(t, ax), f)
-      es.append(ax)
+    if String:
+      es.append(self._all_elements(x, "char", lambda h: self._bind_term_to_char(h, "", "")))
+    elif info["t"] != "any":
+      key = json.dumps(info, sort_keys=True)
+      es.append(self._all_elements(x, key, lambda h: self._bind_term_to_typesig(h, info)))
     return And(*es)
   
+  # All the elements of a list satisfy a typesig
+  def _all_elements(self, x, key, typesig):
+    L = self.List
+    if self.recursive:
+      f = self._rec_fun(("all", key), BoolSort(),
+        lambda f, l: If(L.is_cons(l), And(typesig(L.hd(l)), f(L.tl(l))), True))
+      return f(x)
+    acc = []
+    for i in range (0, self.max_len):
+      acc.append(
+        (L.is_cons(x), typesig(L.hd(x)), L.is_nil(x))
+      )
+      x = L.tl(x)
+    ax = None
+    for (c, t, f) in reversed(acc):
+      if ax == None:
+        ax = If(c, t, f)
+      else:
+        ax = If(c, And(t, ax), f)
+    return ax
+  
+  # A recursive function over lists, defined once per key
+  # and kept across resets like the datatypes
+  def _rec_fun(self, key, sort, body, *sorts):
+    f = self.rec_funs.get(key)
+    if f == None:
+      L = self.List
+      f = RecFunction("%s_%d" % (key[0], len(self.rec_funs)), *((L,) + sorts + (sort,)))
+      self.rec_funs[key] = f
+      l = Const("l", L)
+      args = [l] + [Const("a%d" % i, z) for i, z in enumerate(sorts)]
+      RecAddDefinition(f, args, body(f, *args))
+    return f
+  
   # Bind variable to number()
   def _bind_term_to_number(self, x, info, args):
     return Or(self.Term.is_int(x), self.Term.is_real(x))
@@ -1074,6 +1478,10 @@ class ErlangZ3:
     elif typ == "tuple":
       e = T.is_tpl(t)
       t = T.tval(t)
+    if self.recursive:
+      f = self._rec_fun(("len",), IntSort(),
+        lambda f, l: If(L.is_cons(l), 1 + f(L.tl(l)), 0))
+      return And(e, T.is_int(n), T.ival(n) == f(t))
     es = []
     i = 0
     while i <= self.max_len:
@@ -1102,6 +1510,11 @@ class ErlangZ3:
   def _make_tuple_h(self, x, n, y):
     T = self.Term
     L = self.List
+    if self.recursive:
+      ## replicate(l, k, x) is k copies of x in front of l
+      f = self._rec_fun(("replicate",), L,
+        lambda f, l, k, x: If(k > 0, L.cons(x, f(l, k - 1, x)), l), IntSort(), self.Term)
+      return And(T.is_int(n), T.ival(n) >= 0, y == T.tpl(f(L.nil, T.ival(n), x)))
     t = L.nil
     es = [And(n == T.int(0), y == T.tpl(t))]
     for i in range(1, self.max_len+1):
@@ -1113,10 +1526,7 @@ class ErlangZ3:
   
   ## Decode the Z3 solution to JSON
   def z3_solution_to_json(self):
-    sol = {}
-    for s in self.env.params:
-      sol[s] = self.z3_param_to_json(s)
-    return sol
+    return dict(zip(self.env.params, self.solution))
   
   def z3_param_to_json(self, s):
     x = self.env.lookup(s)
@@ -2,7 +2,7 @@
 
 ebin = "ebin"
 suite = "testsuite/ebin"
-tests = ["coordinator"]
+tests = ["concolic_binary", "concolic_metrics", "concolic_scheduler", "concolic_strategy", "concolic_trie", "concolic_tserver", "coordinator", "python"]
 tests.each do |t|
   puts "Testing #{t} ..."
   puts `erl -noshell -pa #{ebin} #{suite} -eval "eunit:test(#{t}, [verbose])" -s init stop`
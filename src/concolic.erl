@@ -5,8 +5,9 @@
 -behaviour(gen_server).
 
 %% External exports
--export([init_server/6, node_servers/2, send_clogs/2,
-         send_error_report/3, send_return/2, send_tlogs/2, send_mapping/2]).
+-export([init_server/5, init_server/6, node_servers/2, send_clogs/2,
+         send_error_report/3, send_limit_report/3, send_return/2, send_tlogs/2,
+         send_mapping/2]).
 
 %% gen_server callbacks
 -export([init/1, terminate/2, code_change/3,
@@ -20,6 +21,7 @@
                    | {'mapping', [concolic_symbolic:mapping()]}
                    | {'node_servers', node()}
                    | {'error_report', pid(), term()}
+                   | {'limit_report', pid(), concolic_tserver:limit()}
                    | {'clogs', concolic_cserver:clogs()}
                    | {'tlogs', concolic_tserver:tlogs()}.
 -type exec_info() :: orddict:orddict().
@@ -30,9 +32,9 @@
 %% gen_server state datatype
 -record(state, {
   coord    :: pid(),                     %% Pid of the Coordinator Process
-  coredir  :: string(),                  %% Directory to store .core files
   tracedir :: string(),                  %% Directory to store trace files
   depth    :: integer(),                 %% Number of constraints to log
+  limits   :: concolic_tserver:limits(), %% Limits of the execution
   cpids    :: [spid()],                  %% Proplist of CodeServers
   tpids    :: [spid()],                  %% Proplist of TraceServers
   results  :: exec_info(),               %% Info about the concolic execution
@@ -46,10 +48,16 @@
 %% ============================================================================
 
 %% Initialize the Concolic Server
--spec init_server(atom(), atom(), [term()], string(), string(), integer()) -> pid() | term().
+-spec init_server(atom(), atom(), [term()], string(), integer()) -> pid() | term().
 
-init_server(M, F, As, CoreDir, TraceDir, Depth) ->
-  Args = [M, F, As, CoreDir, TraceDir, self(), Depth],
+init_server(M, F, As, TraceDir, Depth) ->
+  init_server(M, F, As, TraceDir, Depth, []).
+
+-spec init_server(atom(), atom(), [term()], string(), integer(), concolic_tserver:limits()) ->
+  pid() | term().
+
+init_server(M, F, As, TraceDir, Depth, Limits) ->
+  Args = [M, F, As, TraceDir, self(), Depth, Limits],
   case gen_server:start_link(?MODULE, Args, []) of
     {ok, Server} -> Server;
     {error, _Reason} = R -> R
@@ -72,6 +80,12 @@ send_mapping(ConcServer, Mapping) ->
 
 send_error_report(ConcServer, Who, Error) ->
   gen_server:call(ConcServer, {error_report, Who, Error}).
+
+%% Send the report of an exceeded limit
+-spec send_limit_report(pid(), pid(), concolic_tserver:limit()) -> 'ok'.
+
+send_limit_report(ConcServer, Who, Limit) ->
+  gen_server:call(ConcServer, {limit_report, Who, Limit}).
  
 %% Send the logs of a CodeServer
 -spec send_clogs(pid(), concolic_cserver:clogs()) -> 'ok'.
@@ -100,17 +114,17 @@ node_servers(ConcServer, Node) ->
 %% ------------------------------------------------------------------
 -spec init([atom() | string() | pid() | [term()] | integer(), ...]) -> {'ok', state()}.
 
-init([M, F, As, CoreDir, TraceDir, Coord, Depth]) ->
+init([M, F, As, TraceDir, Coord, Depth, Limits]) ->
   process_flag(trap_exit, true),
   Node = node(),
-  CodeServer = concolic_cserver:init_codeserver(CoreDir, self()),
-  TraceServer = concolic_tserver:init_traceserver(TraceDir, self(), Depth),
+  CodeServer = concolic_cserver:init_codeserver(self()),
+  TraceServer = concolic_tserver:init_traceserver(TraceDir, self(), Depth, Limits),
   Ipid = concolic_eval:i(M, F, As, CodeServer, TraceServer),
   InitState = #state{
     coord = Coord,
-    coredir = CoreDir,
     tracedir = TraceDir,
     depth = Depth,
+    limits = Limits,
     cpids = [{Node, CodeServer}],
     tpids = [{Node, TraceServer}],
     results = orddict:new(),
@@ -127,10 +141,7 @@ init([M, F, As, CoreDir, TraceDir, Coord, Depth]) ->
 terminate(_Reason, State) ->
   Coord = State#state.coord,
   Results = State#state.results,
-  CoreDir = State#state.coredir,
   Error = State#state.error,
-  %% Directory will only be deleted if it's empty
-  _ = file:del_dir(filename:absname(CoreDir)),
   case Error of
     {internalc, Node} ->
       Coord ! {self(), {'internal_codeserver_error', Node, Results}},
@@ -141,6 +152,9 @@ terminate(_Reason, State) ->
     {runtime, Node} ->
       Coord ! {self(), {'runtime_error', Node, Results}},
       ok;
+    {limit, Node} ->
+      Coord ! {self(), {'limit_exceeded', Node, Results}},
+      ok;
     {internal, Error} ->
       exit(Error);
     false ->
@@ -215,22 +229,34 @@ handle_call({error_report, Who, Error}, {From, _FromTag}, State) ->
   %% Shutdown execution tree
   force_terminate(CPids, TPids -- [NF]),
   {reply, ok, State#state{results = NRes, int = ok, error = {runtime, Node}}};
+%% Log an exceeded limit
+%% Call Request : {limit_report, Who, Limit}
+%% Reply : ok
+handle_call({limit_report, Who, Limit}, {From, _FromTag}, State) ->
+  CPids = State#state.cpids,
+  TPids = State#state.tpids,
+  Res = State#state.results,
+  {Node, From} = NF = lists:keyfind(From, 2, TPids),  %% Process will never be registered
+  NRes = orddict:append(Node, {limit_exceeded, {Node, Who, Limit}}, Res),
+  %% Shutdown execution tree
+  force_terminate(CPids, TPids -- [NF]),
+  {reply, ok, State#state{results = NRes, int = ok, error = {limit, Node}}};
 %% Handle a request for the servers of a specific node
 %% Call Request : {node_servers, Node}
 %% Reply : Servers | error
 handle_call({node_servers, Node}, _From, State) ->
   CPids = State#state.cpids,
   TPids = State#state.tpids,
-  CoreDir = State#state.coredir,
   TraceDir = State#state.tracedir,
   Depth = State#state.depth,
+  Limits = State#state.limits,
   case node_monitored(Node, CPids, TPids) of
     %% Servers are already up on Node
     {true, Servers} ->
       {reply, Servers, State};
     false ->
       %% Spawn servers on Node
-      case remote_spawn_servers(Node, CoreDir, TraceDir, self(), Depth) of
+      case remote_spawn_servers(Node, TraceDir, self(), Depth, Limits) of
         {ok, {CodeServer, TraceServer} = Servers} ->
           NCPids = [{Node, CodeServer}|CPids],
           NTPids = [{Node, TraceServer}|TPids],
@@ -383,14 +409,15 @@ node_monitored(Node, CPids, TPids) ->
   end.
   
 %% Spawn a TraceServer and a CodeServer at a remote node
--spec remote_spawn_servers(node(), string(), string(), pid(), integer()) -> {'ok', servers()} | 'error'.
+-spec remote_spawn_servers(node(), string(), pid(), integer(), concolic_tserver:limits()) ->
+  {'ok', servers()} | 'error'.
   
-remote_spawn_servers(Node, CoreDir, TraceDir, Super, Depth) ->
+remote_spawn_servers(Node, TraceDir, Super, Depth, Limits) ->
   Me = self(),
   F = fun() ->
     process_flag(trap_exit, true),
-    CodeServer = concolic_cserver:init_codeserver(CoreDir, Super),
-    TraceServer = concolic_tserver:init_traceserver(TraceDir, Super, Depth),
+    CodeServer = concolic_cserver:init_codeserver(Super),
+    TraceServer = concolic_tserver:init_traceserver(TraceDir, Super, Depth, Limits),
     Me ! {self(), {CodeServer, TraceServer}}
   end,
   P = spawn_link(Node, F),
@@ -4,7 +4,7 @@
 
 -export([get_execution_vertices/1,
          get_traces/1, get_result/1, get_mapping/1,
-         clear_and_delete_dir/1, print_trace/1]).
+         clear_and_delete_dir/1, clear_and_delete_dir/2, print_trace/1]).
 
 %% exported types
 -export_type([path_vertex/0, traces/0, internal_error/0, result/0, ret/0]).
@@ -19,9 +19,11 @@
                         | 'internal_traceserver_error'.
 -type result() :: {'ok', node(), concolic:exec_info()}
                 | {'runtime_error', node(), concolic:exec_info()}
+                | {'limit_exceeded', node(), concolic:exec_info()}
                 | {internal_error(), term()}.
 -type ret()    :: {'ok', concolic_eval:result()}         %% Successful Execution
                 | {'error', term()}                      %% Runtime Error
+                | {'limit_exceeded', concolic_tserver:limit()}  %% Stopped by a limit
                 | {'internal_error', internal_error()}.  %% Internal Error
 
 %%====================================================================
@@ -44,6 +46,10 @@ get_result({'runtime_error', Node, R}) ->
   {ok, Info} = orddict:find(Node, R),
   {Node, _Who, {CErr, _Serr}} = proplists:get_value('runtime_error', Info),
   {'error', CErr};
+get_result({'limit_exceeded', Node, R}) ->
+  {ok, Info} = orddict:find(Node, R),
+  {Node, _Who, Limit} = proplists:get_value('limit_exceeded', Info),
+  {'limit_exceeded', Limit};
 get_result({Error, _Node, _R}) ->
   {'internal_error', Error}.
 
@@ -59,12 +65,12 @@ get_traces_files(R) ->
   Logs = proplists:get_value('tlogs', R),
   Dir = proplists:get_value('dir', Logs),
   {ok, Fs} = file:list_dir(Dir),
-  [Dir ++ "/" ++ F || F <- Fs].
+  [Dir ++ "/" ++ F || F <- Fs, not concolic_encdec:is_index_file(F)].
 
 %% Retrieve the mapping of the concrete to symbolic values
 -spec get_mapping(result()) -> [concolic_symbolic:mapping()].
 
-get_mapping({X, _Node, Result}) when X =:= 'ok'; X =:= 'runtime_error' ->
+get_mapping({X, _Node, Result}) when X =:= 'ok'; X =:= 'runtime_error'; X =:= 'limit_exceeded' ->
   {ok, Info} = orddict:find(node(), Result),
   proplists:get_value('mapping', Info);
 get_mapping({_Error, _Node, _R}) -> [].
@@ -74,6 +80,7 @@ get_mapping({_Error, _Node, _R}) -> [].
 %% ------------------------------------------------------------------
 
 %% Extract Path Vertices from the execution traces
+%% (The traces of other nodes are read on their node)
 -spec get_execution_vertices(traces()) -> [{node(), [path_vertex()]}].
 
 get_execution_vertices(Paths) ->
@@ -81,8 +88,11 @@ get_execution_vertices(Paths) ->
 
 get_execution_vertices([], Acc) ->
   lists:reverse(Acc);
-get_execution_vertices([{Node, Fs} | Rest], Acc) ->
+get_execution_vertices([{Node, Fs} | Rest], Acc) when Node =:= node() ->
   Vs = [concolic_encdec:path_vertex(F) || F <- Fs],
+  get_execution_vertices(Rest, [{Node, Vs} | Acc]);
+get_execution_vertices([{Node, Fs} | Rest], Acc) ->
+  Vs = [rpc:call(Node, concolic_encdec, path_vertex, [F]) || F <- Fs],
   get_execution_vertices(Rest, [{Node, Vs} | Acc]).
 
 %% Print the contents of a trace file
@@ -97,8 +107,16 @@ print_trace(D) ->
 -spec clear_and_delete_dir(string()) -> ok.
 
 clear_and_delete_dir(D) ->
-  {ok, CWD} = file:get_cwd(),
-  clear_dir(CWD ++ "/" ++ D).
+  clear_dir(filename:absname(D)).
+
+%% Delete the trace files / folders of an execution on a node
+-spec clear_and_delete_dir(node(), string()) -> ok.
+
+clear_and_delete_dir(Node, D) when Node =:= node() ->
+  clear_and_delete_dir(D);
+clear_and_delete_dir(Node, D) ->
+  _ = rpc:call(Node, ?MODULE, clear_and_delete_dir, [D]),
+  ok.
 
 clear_dir(D) ->
   case filelib:is_regular(D) of
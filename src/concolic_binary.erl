@@ -0,0 +1,197 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(concolic_binary).
+
+%% Compact binary encoding of the logged commands.
+%% It mirrors the JSON encoding of concolic_json and
+%% is decoded by BinaryReader in priv/json_utils.py
+
+-export([command_to_binary/3, new_symbols/0]).
+
+-export_type([symbols/0]).
+
+-include("concolic_internal.hrl").
+
+%% Value tags
+-define(TAG_SYMB_NEW, 0).  %% Symbolic variable first seen: Id, Name
+-define(TAG_SYMB, 1).      %% Symbolic variable: Id
+-define(TAG_INT, 2).       %% Zigzag varint
+-define(TAG_REAL, 3).      %% 64-bit float
+-define(TAG_ATOM, 4).      %% Length, Chars
+-define(TAG_LIST, 5).      %% Length, Terms
+-define(TAG_TUPLE, 6).     %% Size, Terms
+-define(TAG_ALIAS, 7).     %% Shared subterm: Id
+-define(TAG_SHARED, 8).    %% Number of shared subterms, [Id, Term], Term
+-define(TAG_ARRAY, 9).     %% Length, Values (plain list of arguments)
+-define(TAG_TYPESIG, 10).  %% Length, JSON of the type signature
+
+%% The ids of the symbolic variables already written to a trace
+-opaque symbols() :: gb_trees:tree().
+
+%% ============================================================================
+%% External exports
+%% ============================================================================
+
+-spec new_symbols() -> symbols().
+
+new_symbols() ->
+  gb_trees:empty().
+
+%% Encode a Command to a binary
+%% Cmd is the JSON opcode of the command
+-spec command_to_binary(string(), [term()], symbols()) -> {binary(), symbols()}.
+
+command_to_binary(Cmd, [S, Vs], Syms) when Cmd =:= "Bkt"; Cmd =:= "Bkl" ->
+  {S0, Syms1} = encode_value(S, Syms),
+  {Ss, Syms2} = encode_values(Vs, Syms1),
+  Bin = [op_code(Cmd), varint(2), S0, ?TAG_ARRAY, varint(length(Vs)), Ss],
+  {list_to_binary(Bin), Syms2};
+command_to_binary(Cmd, Args, Syms) when is_list(Args) ->
+  {Ss, Syms1} = encode_values(Args, Syms),
+  Bin = [op_code(Cmd), varint(length(Args)), Ss],
+  {list_to_binary(Bin), Syms1}.
+
+%% ============================================================================
+%% Internal functions
+
+encode_values(Vs, Syms) ->
+  F = fun(V, {Acc, Ss}) ->
+    {EncV, Ss1} = encode_value(V, Ss),
+    {[EncV | Acc], Ss1}
+  end,
+  {Acc, Syms1} = lists:foldl(F, {[], Syms}, Vs),
+  {lists:reverse(Acc), Syms1}.
+
+encode_value({?TYPE_SIG_PREFIX, _Type} = T, Syms) ->
+  Json = concolic_json:typesig_to_json(T),
+  {[?TAG_TYPESIG, varint(byte_size(Json)), Json], Syms};
+encode_value(V, Syms) ->
+  case concolic_symbolic:is_symbolic(V) of
+    true  -> encode_symbolic(V, Syms);
+    false -> {encode_concrete(V), Syms}
+  end.
+
+%% Symbolic variables are written by name only the first time
+encode_symbolic(V, Syms) ->
+  Name = concolic_symbolic:to_list(V),
+  case gb_trees:lookup(Name, Syms) of
+    {value, Id} ->
+      {[?TAG_SYMB, varint(Id)], Syms};
+    none ->
+      Id = gb_trees:size(Syms),
+      Enc = [?TAG_SYMB_NEW, varint(Id), varint(length(Name)), Name],
+      {Enc, gb_trees:insert(Name, Id, Syms)}
+  end.
+
+%% Lists and tuples that appear more than once in a term
+%% are encoded once and referenced by an alias
+encode_concrete(Term) ->
+  Seen = scan_term(Term, gb_trees:empty()),
+  Shared = [T || {T, true} <- gb_trees:to_list(Seen)],
+  case Shared of
+    [] ->
+      encode_term(Term, gb_trees:empty(), true);
+    _ ->
+      Ids = gb_trees:from_orddict(lists:zip(Shared, lists:seq(0, length(Shared) - 1))),
+      Ds = [[varint(gb_trees:get(T, Ids)), encode_term(T, Ids, true)] || T <- Shared],
+      [?TAG_SHARED, varint(length(Shared)), Ds, encode_term(Term, Ids, true)]
+  end.
+
+scan_term(Term, Seen) when is_list(Term); is_tuple(Term) ->
+  case gb_trees:lookup(Term, Seen) of
+    none ->
+      Es = if is_list(Term) -> Term; true -> tuple_to_list(Term) end,
+      lists:foldl(fun scan_term/2, gb_trees:insert(Term, false, Seen), Es);
+    {value, false} ->
+      gb_trees:update(Term, true, Seen);
+    {value, true} ->
+      Seen
+  end;
+scan_term(Term, _Seen) when is_function(Term) ->
+  throw(unsupported_term_fun);
+scan_term(_Term, Seen) ->
+  Seen.
+
+encode_term(Term, Ids, false) when is_list(Term); is_tuple(Term) ->
+  case gb_trees:lookup(Term, Ids) of
+    {value, Id} -> [?TAG_ALIAS, varint(Id)];
+    none -> encode_term(Term, Ids, true)
+  end;
+encode_term(I, _Ids, _Top) when is_integer(I) ->
+  [?TAG_INT, varint(zigzag(I))];
+encode_term(F, _Ids, _Top) when is_float(F) ->
+  [?TAG_REAL, <<F:64/float>>];
+encode_term(A, _Ids, _Top) when is_atom(A) ->
+  Cs = atom_to_list(A),
+  [?TAG_ATOM, varint(length(Cs)), [varint(C) || C <- Cs]];
+encode_term(L, Ids, true) when is_list(L) ->
+  %% FIXME will fail for improper lists
+  [?TAG_LIST, varint(length(L)), [encode_term(X, Ids, false) || X <- L]];
+encode_term(T, Ids, true) when is_tuple(T) ->
+  [?TAG_TUPLE, varint(tuple_size(T)), [encode_term(X, Ids, false) || X <- tuple_to_list(T)]];
+encode_term(Term, _Ids, _Top) ->
+  throw({unsupported_term, Term}).
+
+%% Unsigned LEB128
+varint(N) when N < 128 -> [N];
+varint(N) -> [(N band 127) bor 128 | varint(N bsr 7)].
+
+zigzag(I) when I >= 0 -> I bsl 1;
+zigzag(I) -> ((-I) bsl 1) - 1.
+
+%% Maps the JSON opcodes of the commands to bytes
+%% (the same table is OPCODES in priv/json_utils.py)
+op_code("T") -> 0;
+op_code("F") -> 1;
+op_code("Eq") -> 2;
+op_code("Neq") -> 3;
+op_code("Ts") -> 4;
+op_code("Nts") -> 5;
+op_code("Nel") -> 6;
+op_code("El") -> 7;
+op_code("Nl") -> 8;
+op_code("Nt") -> 9;
+op_code("M") -> 10;
+op_code("Nm") -> 11;
+op_code("Nmv") -> 12;
+op_code("Bkl") -> 13;
+op_code("Bkt") -> 14;
+op_code("Pms") -> 15;
+op_code("Psp") -> 16;
+op_code("=:=") -> 17;
+op_code("=/=") -> 18;
+op_code("<") -> 19;
+op_code(">") -> 20;
+op_code(">=") -> 21;
+op_code("=<") -> 22;
+op_code("+") -> 23;
+op_code("-") -> 24;
+op_code("*") -> 25;
+op_code("/") -> 26;
+op_code("div") -> 27;
+op_code("rem") -> 28;
+op_code("or") -> 29;
+op_code("ore") -> 30;
+op_code("and") -> 31;
+op_code("anda") -> 32;
+op_code("not") -> 33;
+op_code("xor") -> 34;
+op_code("hd") -> 35;
+op_code("tl") -> 36;
+op_code("abs") -> 37;
+op_code("elm") -> 38;
+op_code("flt") -> 39;
+op_code("isa") -> 40;
+op_code("isb") -> 41;
+op_code("isf") -> 42;
+op_code("isi") -> 43;
+op_code("isl") -> 44;
+op_code("isn") -> 45;
+op_code("ist") -> 46;
+op_code("rnd") -> 47;
+op_code("trc") -> 48;
+op_code("ltt") -> 49;
+op_code("ttl") -> 50;
+op_code("len") -> 51;
+op_code("tpls") -> 52;
+op_code("mtpl2") -> 53.
@@ -4,7 +4,7 @@
 -behaviour(gen_server).
 
 %% External exports
--export([init_codeserver/2, terminate/1, load/2, mfa_spec/2, return_spec/3, spec_finder/2, module_attributes/2]).
+-export([init_codeserver/1, terminate/1, load/2, mfa_spec/2, return_spec/3, spec_finder/2, module_attributes/2]).
 
 %% gen_server callbacks
 -export([init/1, terminate/2, code_change/3, handle_info/2,
@@ -33,7 +33,6 @@
   %%   Module   :: atom()
   %%   ModuleDb :: ets:tab()
   db :: ets:tab(),          %% Database of the modules and their stored code
-  dir :: string(),          %% Directory where .core files are saved
   waiting = orddict:new() :: [{{mfa_spec, mfa()}, pid()}], %% Info on the waiting processes
   workers = [] :: [pid()],  %% PIDs of the workers
   super :: pid()            %% Concolic Server (supervisor) process
@@ -45,10 +44,10 @@
 %% ============================================================================
 
 %% Initialize a CodeServer
--spec init_codeserver(string(), pid()) -> pid() | no_return().
+-spec init_codeserver(pid()) -> pid() | no_return().
 
-init_codeserver(CoreDir, Super) ->
-  case gen_server:start(?MODULE, [CoreDir, Super], []) of
+init_codeserver(Super) ->
+  case gen_server:start(?MODULE, [Super], []) of
     {ok, CodeServer} -> CodeServer;
     {error, Reason}  -> exit({codeserver_init, Reason})
   end.
@@ -115,14 +114,12 @@ spec_finder(CodeServer, {M, _F, _A}=MFA) ->
 %% ------------------------------------------------------------------
 %% gen_server callback : init/1
 %% ------------------------------------------------------------------
--spec init([string() | pid(), ...]) -> {ok, state()}.
+-spec init([pid(), ...]) -> {ok, state()}.
 
-init([Dir, Super]) when is_list(Dir) ->
+init([Super]) ->
   link(Super),
   Db = ets:new(?MODULE, [ordered_set, protected]),
-  U = erlang:ref_to_list(erlang:make_ref()) -- "#Ref<>",
-  CoreDir = filename:absname(Dir ++ "/core-" ++ U),
-  {ok, #state{db=Db, dir=CoreDir, super=Super}}.
+  {ok, #state{db=Db, super=Super}}.
 
 %% ------------------------------------------------------------------
 %% gen_server callback : terminate/2
@@ -131,13 +128,10 @@ init([Dir, Super]) when is_list(Dir) ->
 
 terminate(_Reason, State) ->
   Db = State#state.db,
-  Dir = State#state.dir,
   Super = State#state.super,
   %% Delete all created ETS tables
   LoadedMods = delete_stored_modules(Db),
   ets:delete(Db),
-  %% Clean up .core files dir
-  delete_stored_core_files(Dir),
   %% Send statistics to supervisor
   ok = concolic:send_clogs(Super, LoadedMods).
   
@@ -224,13 +218,13 @@ handle_cast({return_spec, {MFA, MaybeSpec}, Worker}, S=#state{waiting = Wa, work
 %% ============================================================================
 
 %% Load a module's code
-load_mod(M, #state{db = Db, dir = Dir}) ->
+load_mod(M, #state{db = Db}) ->
   %% Create an ETS table to store the code of the module
   MDb = ets:new(M, [ordered_set, protected]),
   ets:insert(Db, {M, MDb}),
   
   %% Load the code of the module
-  Reply = concolic_load:load(M, MDb, Dir),
+  Reply = concolic_load:load(M, MDb),
   case Reply of
     {ok, M} ->
 %      io:format("[load (~w)]: Loaded module ~p~n", [node(), M]),
@@ -277,15 +271,3 @@ delete_stored_modules(Db) ->
     end,
   ets:foldl(DeleteOne, [], Db).
   
-%% Delete all the created .core files during the execution
--spec delete_stored_core_files(file:name()) -> 'ok'.
-  
-delete_stored_core_files(Dir) ->
-  case file:list_dir(Dir) of
-    {ok, FileNames} ->
-      lists:foreach(fun(FN) -> file:delete(Dir ++ "/" ++ FN) end, FileNames),
-      ok = file:del_dir(Dir);
-    {error, enoent} ->
-      ok
-  end.
-  
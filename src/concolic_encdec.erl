@@ -4,7 +4,7 @@
 
 %% exports are alphabetically ordered
 -export([close_file/1, get_data/1, open_file/2, pprint/1, log_pid/2,
-         log/3, log/4, path_vertex/1]).
+         log/3, log/4, path_vertex/1, index_file/1, is_index_file/1]).
 
 -include("concolic_internal.hrl").
 -include("concolic_flags.hrl").
@@ -13,6 +13,28 @@
 -define(CONSTRAINT_FALSE_OP, 2).
 -define(OTHER_COMMAND_OP, 3).
 
+%% Every trace file starts with a header that tags the
+%% encoding of its records
+-define(TRACE_MAGIC, "CCT").
+-define(TRACE_JSON, 1).
+-define(TRACE_BINARY, 2).
+
+-ifdef(BINARY_TRACE).
+-define(TRACE_VERSION, ?TRACE_BINARY).
+-else.
+-define(TRACE_VERSION, ?TRACE_JSON).
+-endif.
+
+%% Every trace file has an uncompressed index sidecar
+%% with an entry for each constraint record
+%%   <<$T | $F, End:32>>
+%% where End is the offset in the decompressed trace, after the header,
+%% where the record ends
+-define(INDEX_MAGIC, "CCI").
+-define(INDEX_VERSION, 1).
+-define(INDEX_SUFFIX, ".idx").
+-define(INDEX_ENTRY_SIZE, 5).
+
 -type mode() :: 'read' | 'write'.
 
 %%====================================================================
@@ -20,15 +42,34 @@
 %%====================================================================
 
 %% Opens a file for logging or reading terms
+%% The header of the file is written or skipped
 -spec open_file(file:name(), mode()) -> {'ok', file:io_device()}.
 
-open_file(F, M) when M =:= 'read'; M =:= 'write' ->
-  file:open(F, [M, raw, binary, compressed, {delayed_write, 262144, 2000}]).
+open_file(F, 'write') ->
+  {ok, Fd} = file:open(F, ['write', raw, binary | write_mode(F)]),
+  ok = file:write(Fd, [?TRACE_MAGIC, ?TRACE_VERSION]),
+  ok = open_index(F, Fd),
+  {ok, Fd};
+open_file(F, 'read') ->
+  {ok, Fd} = file:open(F, ['read', raw, binary, compressed]),
+  case safe_read(Fd, 4, false) of
+    <<?TRACE_MAGIC, V>> when V =:= ?TRACE_JSON; V =:= ?TRACE_BINARY -> {ok, Fd};
+    _ -> exit({'invalid_trace_header', F})
+  end.
+
+%% Traces in shared memory are not worth compressing
+%% (the executions fall back to the disk when there is none)
+write_mode(F) ->
+  case lists:prefix(?RAM_DIR ++ "/", filename:absname(F)) of
+    true  -> [{delayed_write, 262144, 2000}];
+    false -> [compressed, {delayed_write, 262144, 2000}]
+  end.
 
 %% Wrapper for closing a file
 -spec close_file(file:io_device()) -> 'ok'.
 
 close_file(F) ->
+  ok = close_index(F),
   ok = file:close(F).
 
 %% Return the next term stored in a file
@@ -49,7 +90,10 @@ get_data(F) ->
 -ifdef(LOGGING_FLAG).
 write_data(F, Id, Data) when is_integer(Id), is_binary(Data) ->
   Sz = erlang:byte_size(Data),
-  ok = file:write(F, [Id, i32_to_list(Sz), Data]).
+  ok = file:write(F, [Id, i32_to_list(Sz), Data]),
+  ok = concolic_tserver:charge(trace_bytes, Sz + 5),
+  ok = concolic_metrics:count(trace_bytes, Sz + 5),
+  index_record(F, Id, Sz).
 -else.
 write_data(_F, _Cmd, _Data) ->
   ok.
@@ -71,14 +115,79 @@ pprint_id(<<?CONSTRAINT_TRUE_OP>>) -> 'T';
 pprint_id(<<?CONSTRAINT_FALSE_OP>>) -> 'F';
 pprint_id(_) -> ' '.
 
+%% ------------------------------------------------------------------
+%% Trace index
+%% The index is written by the process that logs to the trace,
+%% thus its descriptor and the offset of the trace are kept
+%% in the process dictionary
+%% ------------------------------------------------------------------
+
+-spec open_index(file:name(), file:io_device()) -> 'ok'.
+-spec close_index(file:io_device()) -> 'ok'.
+-spec index_record(file:io_device(), integer(), non_neg_integer()) -> 'ok'.
+
+-ifdef(TRACE_INDEX).
+open_index(F, Fd) ->
+  {ok, Idx} = file:open(index_file(F), ['write', raw, binary, {delayed_write, 65536, 2000}]),
+  ok = file:write(Idx, [?INDEX_MAGIC, ?INDEX_VERSION]),
+  put({?TRACE_INDEX_PREFIX, Fd}, {Idx, 0}),
+  ok.
+
+close_index(Fd) ->
+  case erase({?TRACE_INDEX_PREFIX, Fd}) of
+    undefined -> ok;
+    {Idx, _Offset} -> file:close(Idx)
+  end.
+
+index_record(Fd, Id, Sz) ->
+  Key = {?TRACE_INDEX_PREFIX, Fd},
+  case get(Key) of
+    undefined -> ok;
+    {Idx, Offset} ->
+      End = Offset + 5 + Sz,
+      put(Key, {Idx, End}),
+      case Id of
+        ?CONSTRAINT_TRUE_OP -> file:write(Idx, [?CONSTRAINT_TRUE_REP, i32_to_list(End)]);
+        ?CONSTRAINT_FALSE_OP -> file:write(Idx, [?CONSTRAINT_FALSE_REP, i32_to_list(End)]);
+        _ -> ok
+      end
+  end.
+-else.
+open_index(_F, _Fd) -> ok.
+
+close_index(_Fd) -> ok.
+
+index_record(_Fd, _Id, _Sz) -> ok.
+-endif.
+
+%% The index of a trace
+-spec index_file(file:name()) -> file:name().
+
+index_file(F) ->
+  F ++ ?INDEX_SUFFIX.
+
+%% Whether a file of a trace directory is the index of a trace
+-spec is_index_file(file:name()) -> boolean().
+
+is_index_file(F) ->
+  filename:extension(F) =:= ?INDEX_SUFFIX.
+
 %% ------------------------------------------------------------------
 %% Read Data
 %% ------------------------------------------------------------------
+
+%% Use the index of the trace when there is one
+%% instead of decompressing all its records
 -spec path_vertex(file:name()) -> concolic_analyzer:path_vertex().
 
 path_vertex(File) ->
-  {ok, Fd} = open_file(File, 'read'),
-  generate_vertex(Fd, []).
+  case file:read_file(index_file(File)) of
+    {ok, <<?INDEX_MAGIC, ?INDEX_VERSION, Es/binary>>} ->
+      [B || <<B, _End:32>> <= Es];
+    _ ->
+      {ok, Fd} = open_file(File, 'read'),
+      generate_vertex(Fd, [])
+  end.
 
 generate_vertex(Fd, Acc) ->
   case safe_read(Fd, 1, true) of
@@ -87,7 +196,8 @@ generate_vertex(Fd, Acc) ->
       lists:reverse(Acc);
     <<N>> ->
       Sz = bin_to_i32(safe_read(Fd, 4, false)),
-      {ok, _} = file:position(Fd, {cur, Sz}),
+      %% Positioning in a compressed file reads the data anyway
+      _ = safe_read(Fd, Sz, false),
       case N of
         ?CONSTRAINT_TRUE_OP -> generate_vertex(Fd, [?CONSTRAINT_TRUE_REP|Acc]);
         ?CONSTRAINT_FALSE_OP -> generate_vertex(Fd, [?CONSTRAINT_FALSE_REP|Acc]);
@@ -161,16 +271,34 @@ log_helper(Fd, Cmd, Data) ->
     undefined -> throw(depth_undefined_in_pdict);
     0 -> ok;
     N when is_integer(N), N > 0 ->
-      Op = json_command_op(Cmd),
       ComType = command_type(Cmd),
-      Json_data = concolic_json:command_to_json(Op, Data),
-      write_data(Fd, ComType, Json_data),
+      Enc_data = encode_command(Fd, Cmd, Data),
+      write_data(Fd, ComType, Enc_data),
       update_constraint_counter(ComType, N)
   end.
 -else.
 log_helper(_, _, _) -> ok.
 -endif.
 
+%% Encode a command in the format of the trace
+%% The binary format writes each symbolic variable by name only
+%% once per file, so the ids given so far are kept per file
+-ifdef(BINARY_TRACE).
+encode_command(Fd, Cmd, Data) ->
+  Key = {?TRACE_SYMBOLS_PREFIX, Fd},
+  Syms =
+    case get(Key) of
+      undefined -> concolic_binary:new_symbols();
+      S -> S
+    end,
+  {Bin, Syms1} = concolic_binary:command_to_binary(json_command_op(Cmd), Data, Syms),
+  put(Key, Syms1),
+  Bin.
+-else.
+encode_command(_Fd, Cmd, Data) ->
+  concolic_json:command_to_json(json_command_op(Cmd), Data).
+-endif.
+
 update_constraint_counter(T, X) when T =:= ?CONSTRAINT_TRUE_OP; T =:= ?CONSTRAINT_FALSE_OP ->
   put(?DEPTH_PREFIX, X-1);
 update_constraint_counter(_T, _X) -> ok.
@@ -2,9 +2,9 @@
 %%------------------------------------------------------------------------------
 -module(concolic_eval).
 
--export([i/5, eval/7, unzip_error/1]).
+-export([i/5, eval/7, unzip_error/1, compile_expr/2]).
 
--export_type([result/0, valuelist/0]).
+-export_type([result/0, valuelist/0, compiled/0]).
 
 -include("concolic_internal.hrl").
 -include_lib("compiler/src/core_parse.hrl").
@@ -16,6 +16,7 @@
                   | {'letrec_func', {atom(), atom(), cerl:c_fun(), function()}}.
 -type exported() :: boolean().
 -type result()   :: {term(), term()}.
+-type compiled() :: fun((pid(), pid(), concolic_lib:environment(), concolic_lib:environment(), file:io_device()) -> result()).
 %% Used to represent list of values for Core Erlang interpretation
 -record(valuelist, {values :: [term()], degree :: non_neg_integer()}).
 -opaque valuelist() :: #valuelist{}.
@@ -37,7 +38,8 @@ i(M, F, As, CodeServer, TraceServer) ->
       log_mfa_spec(Fd, {M, F, length(As)}, SymbAs, CodeServer),
       concolic:send_mapping(Root, Mapping),
       NMF = {named, {M, F}},
-      Val = eval(NMF, As, SymbAs, external, CodeServer, TraceServer, Fd),
+      Eval = fun() -> eval(NMF, As, SymbAs, external, CodeServer, TraceServer, Fd) end,
+      Val = concolic_metrics:time(interpretation, Eval),
       concolic:send_return(Root, Val)
     end,
   erlang:spawn(I).
@@ -355,6 +357,7 @@ eval({named, {M, F}}, CAs_b, SAs_b, CallType, CodeServer, TraceServer, Fd) ->
         preloaded ->
           evaluate_bif(MFA, CAs, SAs_e, Fd);
         {ok, MDb} ->
+          ok = concolic_tserver:charge(calls, 1),
           {Def, Exported} = retrieve_function(MFA, MDb),  %% Get the MFA Code
           %%  io:format("Def=~n~p~n", [Def]),
           check_exported(Exported, CallType, MFA),
@@ -362,7 +365,10 @@ eval({named, {M, F}}, CAs_b, SAs_b, CallType, CodeServer, TraceServer, Fd) ->
           NSenv = concolic_lib:new_environment(),
           Cenv = concolic_lib:bind_parameters(CAs, Def#c_fun.vars, NCenv),
           Senv = concolic_lib:bind_parameters(SAs_e, Def#c_fun.vars, NSenv),
-          eval_expr(M, CodeServer, TraceServer, Def#c_fun.body, Cenv, Senv, Fd)
+          case retrieve_compiled(MFA, MDb) of
+            {ok, Body} -> Body(CodeServer, TraceServer, Cenv, Senv, Fd);
+            error -> eval_expr(M, CodeServer, TraceServer, Def#c_fun.body, Cenv, Senv, Fd)
+          end
       end
   end;
   
@@ -374,6 +380,7 @@ eval({lambda, Closure}, CAs, SAs, _CallType, _CodeServer, _TraceServer, Fd) ->
   
 %% Handle a function bound in a letrec expression
 eval({letrec_func, {M, _F, Def, E}}, CAs, SAs, _CallType, CodeServer, TraceServer, Fd) ->
+  ok = concolic_tserver:charge(calls, 1),
   {Cenv, Senv} = E(),
   SAs_e = concolic_symbolic:ensure_list(SAs, length(CAs), CAs, Fd),
   NCenv = concolic_lib:bind_parameters(CAs, Def#c_fun.vars, Cenv),
@@ -399,22 +406,7 @@ exception(Class, Reason) ->
 %% c_apply
 eval_expr(M, CodeServer, TraceServer, {c_apply, _Anno, Op, Args}, Cenv, Senv, Fd) ->
   {OPcv, _OPsv} = eval_expr(M, CodeServer, TraceServer, Op, Cenv, Senv, Fd),
-  Fun = 
-    fun(A) -> %% Will create closures where appropriate
-      {CA, SA} = eval_expr(M, CodeServer, TraceServer, A, Cenv, Senv, Fd),
-      case CA of
-        {?FUNCTION_PREFIX, {F, Arity}} -> %% local func (external func is already in make_fun/3 in core erlang)
-          Cl = create_closure(M, F, Arity, CodeServer, TraceServer, local, Fd),
-          {Cl, Cl};
-        {letrec_func, {Mod, F, Arity, Def, E}} -> %% letrec func
-          {CE, SE} = E(),
-          Cl = create_closure(Mod, F, Arity, CodeServer, TraceServer, {letrec_fun, {Def, CE, SE}}, Fd),
-          {Cl, Cl};
-        _ ->
-          {CA, SA}
-      end
-    end,
-  ZAs = [Fun(A) || A <- Args],
+  ZAs = [closure_arg(M, CodeServer, TraceServer, eval_expr(M, CodeServer, TraceServer, A, Cenv, Senv, Fd), Fd) || A <- Args],
   {CAs, SAs} = lists:unzip(ZAs),
   case OPcv of %% Check eval_expr(..., #c_var{}, ...) output for reference
     {?FUNCTION_PREFIX, {Func, _Arity}} ->
@@ -447,22 +439,7 @@ eval_expr(M, CodeServer, TraceServer, {c_bitstr, _Anno, Val, Size, Unit, Type, F
 eval_expr(M, CodeServer, TraceServer, {c_call, _Anno, Mod, Name, Args}, Cenv, Senv, Fd) ->
   {Mcv, _Msv} = eval_expr(M, CodeServer, TraceServer, Mod, Cenv, Senv, Fd),
   {Fcv, _Fsv} = eval_expr(M, CodeServer, TraceServer, Name, Cenv, Senv, Fd),
-  Fun = 
-    fun(A) -> %% Will create closures where appropriate
-      {CA, SA} = eval_expr(M, CodeServer, TraceServer, A, Cenv, Senv, Fd),
-      case CA of
-        {?FUNCTION_PREFIX, {F, Arity}} -> %% local func (external func is already in make_fun/3 in core erlang)
-          Cl = create_closure(M, F, Arity, CodeServer, TraceServer, local, Fd),
-          {Cl, Cl};
-        {letrec_func, {Mod, F, Arity, Def, E}} -> %% letrec func
-          {CE, SE} = E(),
-          Cl = create_closure(Mod, F, Arity, CodeServer, TraceServer, {letrec_fun, {Def, CE, SE}}, Fd),
-          {Cl, Cl};
-        _ ->
-          {CA, SA}
-      end
-    end,
-  ZAs = [Fun(A) || A <- Args],
+  ZAs = [closure_arg(M, CodeServer, TraceServer, eval_expr(M, CodeServer, TraceServer, A, Cenv, Senv, Fd), Fd) || A <- Args],
   {CAs, SAs} = lists:unzip(ZAs),
   %% TODO Will make constraints Mcv=Msv and Fcv=Fsv
   eval({named, {Mcv, Fcv}}, CAs, SAs, find_call_type(M, Mcv), CodeServer, TraceServer, Fd);
@@ -649,6 +626,263 @@ eval_expr(_M, _CodeServer, _TraceServer, {c_var, _Anno, Name}, Cenv, Senv, _Fd)
   {ok, Sval} = concolic_lib:get_value(Name, Senv),
   {Cval, Sval}.
 
+%% --------------------------------------------------------
+%% compile_expr
+%%
+%% Translates a Core Erlang expression into a closure that
+%% performs the same concrete/symbolic evaluation as
+%% eval_expr, so that the AST is only traversed once.
+%% Receive expressions (whose clauses are matched by the
+%% message loop) and the bodies of funs and letrec functions
+%% (that are applied through eval) are still interpreted.
+%% --------------------------------------------------------
+-spec compile_expr(atom(), cerl:cerl()) -> compiled().
+
+%% c_apply
+compile_expr(M, {c_apply, _Anno, Op, Args}) ->
+  OpF = compile_expr(M, Op),
+  ArgFs = [compile_expr(M, A) || A <- Args],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {OPcv, _OPsv} = OpF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    ZAs = [closure_arg(M, CodeServer, TraceServer, F(CodeServer, TraceServer, Cenv, Senv, Fd), Fd) || F <- ArgFs],
+    {CAs, SAs} = lists:unzip(ZAs),
+    case OPcv of
+      {?FUNCTION_PREFIX, {Func, _Arity}} ->
+        eval({named, {M, Func}}, CAs, SAs, local, CodeServer, TraceServer, Fd);
+      {letrec_func, {Mod, Func, _Arity, Def, E}} ->
+        eval({letrec_func, {Mod, Func, Def, E}}, CAs, SAs, local, CodeServer, TraceServer, Fd);
+      Closure ->
+        eval({lambda, Closure}, CAs, SAs, local, CodeServer, TraceServer, Fd)
+    end
+  end;
+
+%% c_binary
+compile_expr(M, {c_binary, _Anno, Segments}) ->
+  SFs = [compile_expr(M, S) || S <- Segments],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    Segms = [F(CodeServer, TraceServer, Cenv, Senv, Fd) || F <- SFs],
+    {Cs, Ss} = lists:unzip(Segms),
+    append_segments(Cs, Ss, Fd)
+  end;
+
+%% c_bitstr
+compile_expr(M, {c_bitstr, _Anno, Val, Size, Unit, Type, Flags}) ->
+  [ValF, SizeF, UnitF, TypeF, FlagsF] = [compile_expr(M, E) || E <- [Val, Size, Unit, Type, Flags]],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {Cv, Sv} = ValF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {CSize, SSize} = SizeF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {CUnit, SUnit} = UnitF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {CType, SType} = TypeF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {CFlags, SFlags} = FlagsF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    Cbin = bin_lib:make_bitstring(Cv, CSize, CUnit, CType, CFlags),
+    Sbin = concolic_symbolic:make_bitstring(Sv, {SSize, SUnit, SType, SFlags}, {'some', Cbin}, Fd),
+    {Cbin, Sbin}
+  end;
+
+%% c_call
+compile_expr(M, {c_call, _Anno, Mod, Name, Args}) ->
+  ModF = compile_expr(M, Mod),
+  NameF = compile_expr(M, Name),
+  ArgFs = [compile_expr(M, A) || A <- Args],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {Mcv, _Msv} = ModF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {Fcv, _Fsv} = NameF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    ZAs = [closure_arg(M, CodeServer, TraceServer, F(CodeServer, TraceServer, Cenv, Senv, Fd), Fd) || F <- ArgFs],
+    {CAs, SAs} = lists:unzip(ZAs),
+    eval({named, {Mcv, Fcv}}, CAs, SAs, find_call_type(M, Mcv), CodeServer, TraceServer, Fd)
+  end;
+
+%% c_case
+%% Clause matching is left to find_clause and the clause
+%% counter it returns selects the compiled body
+compile_expr(M, {c_case, _Anno, Arg, Clauses}) ->
+  ArgF = compile_expr(M, Arg),
+  BodyFs = list_to_tuple([compile_expr(M, Cl#c_clause.body) || Cl <- Clauses]),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {Cv, Sv} = ArgF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {_Body, NCenv, NSenv, Cnt} = find_clause(M, 'case', CodeServer, TraceServer, Clauses, Cv, Sv, Cenv, Senv, Fd),
+    BodyF = element(Cnt, BodyFs),
+    BodyF(CodeServer, TraceServer, NCenv, NSenv, Fd)
+  end;
+
+%% c_catch
+compile_expr(M, {c_catch, _Anno, Body}) ->
+  BodyF = compile_expr(M, Body),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    try
+      BodyF(CodeServer, TraceServer, Cenv, Senv, Fd)
+    catch
+      throw:Throw ->
+        unzip_one(Throw);
+      exit:Exit ->
+        {Cv, Sv} = unzip_one(Exit),
+        {{'EXIT', Cv}, {'EXIT', Sv}};
+      error:Error ->
+        %% CAUTION! Stacktrace info is not valid (see eval_expr)
+        {Cv, Sv} = unzip_one(Error),
+        Stacktrace = erlang:get_stacktrace(),
+        {{'EXIT', {Cv, Stacktrace}}, {'EXIT', {Sv, Stacktrace}}}
+    end
+  end;
+
+%% c_cons
+compile_expr(M, {c_cons, _Anno, Hd, Tl}) ->
+  HdF = compile_expr(M, Hd),
+  TlF = compile_expr(M, Tl),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {Hdcv, Hdsv} = HdF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {Tlcv, Tlsv} = TlF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    {[Hdcv|Tlcv], [Hdsv|Tlsv]}
+  end;
+
+%% c_fun
+compile_expr(M, {c_fun, _Anno, Vars, Body}) ->
+  Arity = length(Vars),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    Lambda = make_fun(M, Arity, CodeServer, TraceServer, Vars, Body, Cenv, Senv, Fd),
+    {Lambda, Lambda}
+  end;
+
+%% c_let
+compile_expr(M, {c_let, _Anno, Vars, Arg, Body}) ->
+  Degree = length(Vars),
+  ArgF = compile_expr(M, Arg),
+  BodyF = compile_expr(M, Body),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    {C, S} = ArgF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    case Degree of
+      1 ->
+        CAs = [C],
+        SAs = [S];
+      _ ->
+        {valuelist, CAs, Degree} = C,
+        {valuelist, SAs, Degree} = S
+    end,
+    NCenv = concolic_lib:bind_parameters(CAs, Vars, Cenv),
+    NSenv = concolic_lib:bind_parameters(SAs, Vars, Senv),
+    BodyF(CodeServer, TraceServer, NCenv, NSenv, Fd)
+  end;
+
+%% c_letrec
+compile_expr(M, {c_letrec, _Anno, Defs, Body}) ->
+  BodyF = compile_expr(M, Body),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    H = fun(F) -> fun() ->
+      lists:foldl(
+        fun({Func, Def}, {Ce, Se}) ->
+          LetRec = {letrec_func, {M, Def, F}},
+          NCe = concolic_lib:add_binding(Func#c_var.name, LetRec, Ce),
+          NSe = concolic_lib:add_binding(Func#c_var.name, LetRec, Se),
+          {NCe, NSe}
+        end,
+        {Cenv, Senv}, Defs
+      )
+    end end,
+    {NCenv, NSenv} = (y(H))(),
+    BodyF(CodeServer, TraceServer, NCenv, NSenv, Fd)
+  end;
+
+%% c_literal
+compile_expr(_M, {c_literal, _Anno, Val}) ->
+  fun(_CodeServer, _TraceServer, _Cenv, _Senv, _Fd) -> {Val, Val} end;
+
+%% c_primop
+compile_expr(M, {c_primop, _Anno, Name, Args}) ->
+  Primop = Name#c_literal.val,
+  ArgFs = [compile_expr(M, A) || A <- Args],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    ZAs = [F(CodeServer, TraceServer, Cenv, Senv, Fd) || F <- ArgFs],
+    {CAs, SAs} = lists:unzip(ZAs),
+    case Primop of
+      'raise' ->
+        [CClass, CReason] = CAs,
+        [_SClass, SReason] = SAs,
+        eval({named, {erlang, CClass}}, [CReason], [SReason], external, CodeServer, TraceServer, Fd);
+      'match_fail' ->
+        [Cv]= CAs,
+        [Sv] = SAs,
+        eval({named, {erlang, error}}, [{badmatch, Cv}], [{badmatch, Sv}], external, CodeServer, TraceServer, Fd);
+      _ ->
+        exception('error', {'not_supported_primop', Primop})
+    end
+  end;
+
+%% c_seq
+compile_expr(M, {c_seq, _Anno, Arg, Body}) ->
+  ArgF = compile_expr(M, Arg),
+  BodyF = compile_expr(M, Body),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    _Val = ArgF(CodeServer, TraceServer, Cenv, Senv, Fd),
+    BodyF(CodeServer, TraceServer, Cenv, Senv, Fd)
+  end;
+
+%% c_try
+compile_expr(M, {c_try, _Anno, Arg, Vars, Body, Evars, Handler}) ->
+  Degree = length(Vars),
+  ArgF = compile_expr(M, Arg),
+  BodyF = compile_expr(M, Body),
+  HandlerF = compile_expr(M, Handler),
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    try
+      {C, S} = ArgF(CodeServer, TraceServer, Cenv, Senv, Fd),
+      case Degree of
+        1 ->
+          CAs = [C],
+          SAs = [S];
+        _ ->
+          {valuelist, CAs, Degree} = C,
+          {valuelist, SAs, Degree} = S
+      end,
+      NCenv = concolic_lib:bind_parameters(CAs, Vars, Cenv),
+      NSenv = concolic_lib:bind_parameters(SAs, Vars, Senv),
+      BodyF(CodeServer, TraceServer, NCenv, NSenv, Fd)
+    catch
+      Class:Reason ->
+        {Cv, Sv} = unzip_one(Reason),
+        {Cs, Ss} =
+          case length(Evars) of
+            3 -> {[Class, Cv, Class], [Class, Sv, Class]};
+            2 -> {[Class, Cv], [Class, Sv]}
+          end,
+        ECenv = concolic_lib:bind_parameters(Cs, Evars, Cenv),
+        ESenv = concolic_lib:bind_parameters(Ss, Evars, Senv),
+        HandlerF(CodeServer, TraceServer, ECenv, ESenv, Fd)
+    end
+  end;
+
+%% c_tuple
+compile_expr(M, {c_tuple, _Anno, Es}) ->
+  EFs = [compile_expr(M, E) || E <- Es],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    ZEs = [F(CodeServer, TraceServer, Cenv, Senv, Fd) || F <- EFs],
+    {CEs, SEs} = lists:unzip(ZEs),
+    {list_to_tuple(CEs), list_to_tuple(SEs)}
+  end;
+
+%% c_values
+compile_expr(M, {c_values, _Anno, Es}) ->
+  Degree = length(Es),
+  EFs = [compile_expr(M, E) || E <- Es],
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    ZEs = [F(CodeServer, TraceServer, Cenv, Senv, Fd) || F <- EFs],
+    {CEs, SEs} = lists:unzip(ZEs),
+    {#valuelist{values=CEs, degree=Degree}, #valuelist{values=SEs, degree=Degree}}
+  end;
+
+%% c_var (variables only, function names are resolved by eval_expr)
+compile_expr(_M, {c_var, _Anno, Name}) when not is_tuple(Name) ->
+  fun(_CodeServer, _TraceServer, Cenv, Senv, _Fd) ->
+    {ok, Cval} = concolic_lib:get_value(Name, Cenv),
+    {ok, Sval} = concolic_lib:get_value(Name, Senv),
+    {Cval, Sval}
+  end;
+
+%% Any other expression (c_receive and function names) is interpreted
+compile_expr(M, Expr) ->
+  fun(CodeServer, TraceServer, Cenv, Senv, Fd) ->
+    eval_expr(M, CodeServer, TraceServer, Expr, Cenv, Senv, Fd)
+  end.
+
 
 %% --------------------------------------------------------
 %% find_message_loop
@@ -962,6 +1196,21 @@ bit_pattern_match({M, CodeServer, Cenv, Senv} = BitInfo, Mode, TraceServer, [{c_
 %% passed as an argument to a function call
 %% --------------------------------------------------------
 
+%% Create closures where appropriate for the arguments of a call
+%% (external funcs are already in make_fun/3 in core erlang)
+closure_arg(M, CodeServer, TraceServer, {CA, SA}, Fd) ->
+  case CA of
+    {?FUNCTION_PREFIX, {F, Arity}} -> %% local func
+      Cl = create_closure(M, F, Arity, CodeServer, TraceServer, local, Fd),
+      {Cl, Cl};
+    {letrec_func, {Mod, F, Arity, Def, E}} -> %% letrec func
+      {CE, SE} = E(),
+      Cl = create_closure(Mod, F, Arity, CodeServer, TraceServer, {letrec_fun, {Def, CE, SE}}, Fd),
+      {Cl, Cl};
+    _ ->
+      {CA, SA}
+  end.
+
 %% Create a Closure of a local function
 create_closure(M, F, Arity, CodeServer, TraceServer, local, Fd) ->
   %% Module is already loaded since create_closure is called by eval_expr
@@ -1311,7 +1560,7 @@ get_module_db(M, CodeServer) ->
   What = {?CONCOLIC_PREFIX_PDICT, M},
   case get(What) of
     undefined ->
-      case concolic_cserver:load(CodeServer, M) of
+      case concolic_metrics:exclude(fun() -> concolic_cserver:load(CodeServer, M) end) of
         %% Module Code loaded
         {ok, MDb} = Ok -> 
           put(What, MDb),
@@ -1357,6 +1606,30 @@ retrieve_function(FuncKey, ModDb) ->
       Val
   end.
   
+%% --------------------------------------------------------
+%% Retrieves the compiled body of an MFA, if the module was
+%% stored along with its compiled functions
+%%
+%% Optimization : For caching purposes, the compiled body
+%% is stored in the process dictionary for subsequent lookups
+%% --------------------------------------------------------
+-spec retrieve_compiled(mfa(), ets:tab()) -> {'ok', compiled()} | 'error'.
+
+retrieve_compiled(FuncKey, ModDb) ->
+  What = {?CONCOLIC_PREFIX_PDICT, 'compiled', FuncKey},
+  case get(What) of
+    undefined ->
+      R =
+        case ets:lookup(ModDb, {'compiled', FuncKey}) of
+          [] -> error;
+          [{_, Body}] -> {ok, Body}
+        end,
+      put(What, R),
+      R;
+    R ->
+      R
+  end.
+
 %% --------------------------------------------------------
 %% Ensures compatibility between the type of the call
 %% and the exported status of the MFA
@@ -80,6 +80,13 @@ prepare_port_command(load_file, {File, From, To}) ->
   As = ?ENC_KEY_VAL($a, [$\[, A0, $,, A1, $,, A2, $\]]),
   L = [$\{, T, $,, As, $\}],
   list_to_binary(L);
+prepare_port_command(solve_all, {File, Is}) ->
+  T = ?ENC_KEY_VAL($t, [?Q, "solve_all", ?Q]),
+  A0 = [?Q, File, ?Q],
+  A1 = string:join([integer_to_list(I) || I <- Is], ","),
+  As = ?ENC_KEY_VAL($a, [$\[, A0, $,, $\[, A1, $\], $\]]),
+  L = [$\{, T, $,, As, $\}],
+  list_to_binary(L);
 prepare_port_command(check_model, _) ->
   T = ?ENC_KEY_VAL($t, [?Q, "check", ?Q]),
   L = [$\{, T, $\}],
@@ -87,6 +94,23 @@ prepare_port_command(check_model, _) ->
 prepare_port_command(get_model, _) ->
   T = ?ENC_KEY_VAL($t, [?Q, "model", ?Q]),
   L = [$\{, T, $\}],
+  list_to_binary(L);
+prepare_port_command(reset, _) ->
+  T = ?ENC_KEY_VAL($t, [?Q, "reset", ?Q]),
+  L = [$\{, T, $\}],
+  list_to_binary(L);
+prepare_port_command(stats, _) ->
+  T = ?ENC_KEY_VAL($t, [?Q, "stats", ?Q]),
+  L = [$\{, T, $\}],
+  list_to_binary(L);
+prepare_port_command(timings, _) ->
+  T = ?ENC_KEY_VAL($t, [?Q, "timings", ?Q]),
+  L = [$\{, T, $\}],
+  list_to_binary(L);
+prepare_port_command(limits, {Timeout, Rlimit, Retries}) ->
+  T = ?ENC_KEY_VAL($t, [?Q, "limits", ?Q]),
+  As = ?ENC_KEY_VAL($a, [$\[, json_limit(Timeout), $,, json_limit(Rlimit), $,, integer_to_list(Retries), $\]]),
+  L = [$\{, T, $,, As, $\}],
   list_to_binary(L).
 
 %% Check if a term represents the value of an unbound variable
@@ -287,7 +311,11 @@ trim_separator(JSON, S) ->
   end.
 
 %% ==============================================================================
+%% Encode Port Commands
 
+%% A bound of the solver that is not set is null
+json_limit(infinity) -> "null";
+json_limit(N) -> integer_to_list(N).
 
 %% ==============================================================================
 %% Encode Terms to JSON
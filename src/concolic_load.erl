@@ -3,13 +3,18 @@
 -module(concolic_load).
 
 %% External exports
--export([load/3]).
+-export([load/2, init_cache/0, module_core/1]).
 
 %% Will be using the records representation of
 %% the Core Erlang Abstract Syntax Tree
 %% as they are defined in core_parse.hrl
 -include_lib("compiler/src/core_parse.hrl").
 
+-include("concolic_flags.hrl").
+
+-define(CACHE_TAB, concolic_load_cache).  %% In-memory cache of the node
+-define(CACHE_DIR, ".core_cache").         %% On-disk cache shared by runs
+
 -export_type([compile_error/0]).
 
 -type compile_error() :: {'error', term()} | {'runtime_error', term()}.
@@ -18,10 +23,10 @@
 %%====================================================================
 %% External exports
 %%====================================================================
--spec load(atom(), ets:tab(), string()) -> {'ok', atom()} | compile_error().
+-spec load(atom(), ets:tab()) -> {'ok', atom()} | compile_error().
   
-load(Mod, Db, Dir) ->
-  try store_module(Mod, Db, Dir) of
+load(Mod, Db) ->
+  try concolic_metrics:time(module_load, fun() -> store_module(Mod, Db) end) of
     ok -> {ok, Mod}
   catch
     throw:non_existing ->
@@ -34,6 +39,32 @@ load(Mod, Db, Dir) ->
       {'runtime_error', {'compile', {Mod, Errors}}}
   end.
 
+%% Return the Core Erlang AST of a module
+-spec module_core(atom()) -> {'ok', cerl:cerl()} | compile_error().
+
+module_core(Mod) ->
+  try ensure_mod_loaded(Mod) of
+    {ok, BeamPath} -> {ok, compile_core(Mod, BeamPath)}
+  catch
+    throw:{compile, Errors} ->
+      {'runtime_error', {'compile', {Mod, Errors}}};
+    throw:Reason ->
+      {'error', {Reason, Mod}}
+  end.
+
+%% Create the in-memory module cache of the node
+%% The cache lives as long as the calling process
+-spec init_cache() -> 'ok'.
+
+init_cache() ->
+  case ets:info(?CACHE_TAB) of
+    undefined ->
+      ?CACHE_TAB = ets:new(?CACHE_TAB, [set, public, named_table, {read_concurrency, true}]),
+      ok;
+    _ ->
+      ok
+  end.
+
 %%====================================================================
 %% Internal functions
 %%====================================================================
@@ -47,14 +78,30 @@ load(Mod, Db, Dir) ->
 %% exported             [{Mod :: atom(), Fun :: atom(), Arity :: non_neg_integer()}]  
 %% attributes           Attrs :: [{cerl(), cerl()}]
 %% {Mod, Fun, Arity}    {Def :: #c_fun{}, Exported :: boolean()}
--spec store_module(atom(), ets:tab(), string()) -> 'ok'.
-
-store_module(M, Db, Dir) ->
-  %% Compile the module to Core Erlang
-  Core = compile_core(M, Dir),
-  %% Build Core Erlang Abstract Syntax Tree
-  {ok, Tokens, _} = scan_file(Core),
-  {ok, AST} = core_parse:parse(Tokens),
+%% {compiled, MFA}      Body :: concolic_eval:compiled()
+%%
+%% The compiled bodies are closures of the running code, thus
+%% they are only kept in the in-memory cache of the node.
+-spec store_module(atom(), ets:tab()) -> 'ok'.
+
+store_module(M, Db) ->
+  {ok, BeamPath} = ensure_mod_loaded(M),
+  {ok, {M, MD5}} = beam_lib:md5(BeamPath),
+  Key = {M, MD5},
+  case cache_lookup(Key) of
+    {ok, Objs} ->
+      true = ets:insert(Db, Objs);
+    error ->
+      ok = concolic_metrics:time(module_compile, fun() -> compile_and_store_module(M, BeamPath, Db) end),
+      cache_store(Key, ets:tab2list(Db))
+  end,
+  store_compiled_funs(Key, Db).
+
+-spec compile_and_store_module(atom(), file:filename(), ets:tab()) -> 'ok'.
+
+compile_and_store_module(M, BeamPath, Db) ->
+  %% Compile the module to a Core Erlang Abstract Syntax Tree
+  AST = compile_core(M, BeamPath),
   %% Store Module in the Db
   store_module_info(anno, M, AST, Db),
   store_module_info(name, M, AST, Db),
@@ -63,32 +110,64 @@ store_module(M, Db, Dir) ->
   store_module_funs(M, AST, Db),
   ok.
   
-%% Core Erlang Scanner
--spec scan_file(file:filename()) -> term().
+%% Compile the module to Core Erlang in memory
+%% Use the abstract code of the beam when it has debug info,
+%% otherwise compile the module source
+%% Both use the options the module was compiled with; the abstract
+%% code is already preprocessed and parse transformed, so it only
+%% needs the ones of the Core Erlang passes
+-spec compile_core(atom(), file:filename()) -> cerl:cerl() | no_return().
 
-scan_file(File) ->
-  {ok, FileContents} = file:read_file(File),
-  Data = binary_to_list(FileContents),
-  core_scan:string(Data).
-  
-%% Compile the module source to Core Erlang
--spec compile_core(atom(), string()) -> file:filename() | no_return().
-
-compile_core(M, Dir) ->
-  ok = filelib:ensure_dir(Dir ++ "/"),
-  {ok, BeamPath} = ensure_mod_loaded(M),
-  {ok, {_, [{compile_info, Info}]}} = beam_lib:chunks(BeamPath, [compile_info]),
-  Source = proplists:get_value(source, Info),
-  Includes = proplists:lookup_all(i, proplists:get_value(options, Info)),
-  Macros = proplists:lookup_all(d, proplists:get_value(options, Info)),
-  CompInfo = [to_core, return_errors, {outdir, Dir}] ++ Includes ++ Macros,
-  CompRet = compile:file(Source, CompInfo),
+compile_core(M, BeamPath) ->
+  Opts = [to_core, binary, return_errors],
+  {Source, Recorded} = compile_info(BeamPath),
+  CompRet =
+    case beam_lib:chunks(BeamPath, [abstract_code]) of
+      {ok, {M, [{abstract_code, {raw_abstract_v1, Forms}}]}} ->
+        compile:forms(Forms, Opts ++ [O || O <- Recorded, core_option(O)]);
+      _ ->
+        SrcOpts = [O || O <- Recorded, source_option(O) orelse core_option(O)],
+        compile:file(Source, Opts ++ SrcOpts)
+    end,
   case CompRet of
-    {ok, M} ->
-      Dir ++ "/" ++ atom_to_list(M) ++ ".core";
+    {ok, M, AST} ->
+      AST;
     Errors ->
       erlang:throw({'compile', Errors})
   end.
+
+%% The source of a module and the options it was compiled with
+-spec compile_info(file:filename()) -> {file:filename() | 'undefined', [term()]}.
+
+compile_info(BeamPath) ->
+  case beam_lib:chunks(BeamPath, [compile_info]) of
+    {ok, {_, [{compile_info, Info}]}} ->
+      {proplists:get_value(source, Info), proplists:get_value(options, Info, [])};
+    _ ->
+      {undefined, []}
+  end.
+
+%% The options of the preprocessor and the parse transforms
+-spec source_option(term()) -> boolean().
+
+source_option({i, _}) -> true;
+source_option({d, _}) -> true;
+source_option({d, _, _}) -> true;
+source_option({parse_transform, _}) -> true;
+source_option(_) -> false.
+
+%% The options of the passes that produce the Core Erlang code
+-spec core_option(term()) -> boolean().
+
+core_option(inline) -> true;
+core_option({inline, _}) -> true;
+core_option({inline_size, _}) -> true;
+core_option({inline_effort, _}) -> true;
+core_option({inline_unroll, _}) -> true;
+core_option(inline_list_funcs) -> true;
+core_option(no_inline_list_funcs) -> true;
+core_option(no_copt) -> true;
+core_option(_) -> false.
   
 %% Ensure the module beam code is loaded
 %% and return the path it is located
@@ -106,6 +185,66 @@ ensure_mod_loaded(M) ->
       {ok, Path}
   end.
   
+%% ------------------------------------------------------------------
+%% Module cache
+%% The stored module tables are cached with the module name and
+%% the MD5 of its beam as key, first in memory and then on disk
+%% ------------------------------------------------------------------
+
+-spec cache_lookup({atom(), binary()}) -> {'ok', [tuple()]} | 'error'.
+-spec cache_store({atom(), binary()}, [tuple()]) -> 'ok'.
+
+-ifdef(CACHE_MODULES).
+cache_lookup(Key) ->
+  case ets:info(?CACHE_TAB) of
+    undefined -> cache_read(Key);
+    _ ->
+      case ets:lookup(?CACHE_TAB, Key) of
+        [{Key, Objs}] -> {ok, Objs};
+        [] ->
+          case cache_read(Key) of
+            {ok, Objs} = Ok ->
+              true = ets:insert(?CACHE_TAB, {Key, Objs}),
+              Ok;
+            error -> error
+          end
+      end
+  end.
+
+cache_store(Key, Objs) ->
+  case ets:info(?CACHE_TAB) of
+    undefined -> ok;
+    _ -> true = ets:insert(?CACHE_TAB, {Key, Objs}), ok
+  end,
+  cache_write(Key, Objs).
+
+cache_file({M, MD5}) ->
+  Hex = lists:flatten([io_lib:format("~2.16.0b", [B]) || <<B>> <= MD5]),
+  filename:absname(?CACHE_DIR ++ "/" ++ atom_to_list(M) ++ "-" ++ Hex).
+
+cache_read(Key) ->
+  case file:read_file(cache_file(Key)) of
+    {ok, Bin} -> {ok, binary_to_term(Bin)};
+    {error, _} -> error
+  end.
+
+%% Write to a temporary file first so that concurrent
+%% executions never read a partially written entry
+cache_write(Key, Objs) ->
+  File = cache_file(Key),
+  U = erlang:ref_to_list(erlang:make_ref()) -- "#Ref<>",
+  Tmp = File ++ "." ++ U,
+  ok = filelib:ensure_dir(File),
+  case file:write_file(Tmp, term_to_binary(Objs, [compressed])) of
+    ok -> _ = file:rename(Tmp, File), ok;
+    {error, _} -> _ = file:delete(Tmp), ok
+  end.
+-else.
+cache_lookup(_Key) -> error.
+
+cache_store(_Key, _Objs) -> ok.
+-endif.
+
 %% Store Module Information
 -spec store_module_info(info(), atom(), cerl:cerl(), ets:tab()) -> 'ok'.
 
@@ -150,3 +289,44 @@ store_fun(Exps, M, {Fun, Def}, Db) ->
   Exported = lists:member(MFA, Exps),
   true = ets:insert(Db, {MFA, {Def, Exported}}),
   ok.
+
+%% Store the closure form of the function bodies
+%% The bodies of a module are compiled once per node and version
+%% of the interpreter, and reused by the executions that load it
+-spec store_compiled_funs({atom(), binary()}, ets:tab()) -> 'ok'.
+
+-ifdef(COMPILE_CLOSURES).
+store_compiled_funs({M, _MD5}=Key, Db) ->
+  Vsn = proplists:get_value(vsn, concolic_eval:module_info(attributes)),
+  CKey = {'compiled', Key, Vsn},
+  Fs =
+    case compiled_lookup(CKey) of
+      {ok, Fs0} ->
+        Fs0;
+      error ->
+        Defs = ets:select(Db, [{{{M, '_', '_'}, {'$1', '_'}}, [], [{{{element, 1, '$_'}, '$1'}}]}]),
+        Fs0 = [{{'compiled', MFA}, concolic_eval:compile_expr(M, Def#c_fun.body)} || {MFA, Def} <- Defs],
+        compiled_store(CKey, Fs0),
+        Fs0
+    end,
+  true = ets:insert(Db, Fs),
+  ok.
+
+compiled_lookup(CKey) ->
+  case ets:info(?CACHE_TAB) of
+    undefined -> error;
+    _ ->
+      case ets:lookup(?CACHE_TAB, CKey) of
+        [{CKey, Fs}] -> {ok, Fs};
+        [] -> error
+      end
+  end.
+
+compiled_store(CKey, Fs) ->
+  case ets:info(?CACHE_TAB) of
+    undefined -> ok;
+    _ -> true = ets:insert(?CACHE_TAB, {CKey, Fs}), ok
+  end.
+-else.
+store_compiled_funs(_Key, _Db) -> ok.
+-endif.
@@ -0,0 +1,210 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(concolic_metrics).
+
+%% Wall time and counts of the phases of a run, kept in a public ETS
+%% table of the node of the coordinator. Any process of the node may
+%% record in it. Recording is a no-op when there is no table (e.g. on
+%% the remote nodes of an execution).
+%%
+%% A phase is recorded by its self time: the phases timed inside it by
+%% the same process and the waits wrapped in exclude/1 are left out, so
+%% that the phases do not overlap (e.g. the module loads that an
+%% interpretation waits for are not part of the interpretation).
+%%
+%%       Key                  Value
+%% -----------------    ---------------
+%% {phase, Phase}       Count, Wall time in us
+%% {counter, Name}      Count
+%% {series, Name}       Number of samples so far
+%% {sample, Name, N}    Ms since the table was created, Value
+%% started              Time the table was created
+
+%% External exports
+-export([new/0, delete/0, time/2, exclude/1, add_time/3, count/2,
+         sample/2, snapshot/0, dump/3]).
+
+%% exported types
+-export_type([metric/0, phase/0, format/0]).
+
+-include("concolic_internal.hrl").
+
+-define(TAB, ?MODULE).
+
+-type phase() :: 'module_load'         %% Loading a module to the code server (but the compile)
+               | 'module_compile'      %% Compiling a module to Core Erlang
+               | 'interpretation'      %% Evaluating the entry point of an execution (but the module loads)
+               | 'solver_startup'      %% Starting a solver port until Z3 is loaded
+               | 'trace_loading'       %% Reading and encoding a trace to Z3
+               | 'solver_check'        %% Z3 check() calls
+               | 'model_decoding'      %% Decoding the models of Z3
+               | atom().
+-type metric() :: {'phases', [{phase(), non_neg_integer(), non_neg_integer()}]}  %% {Phase, Count, us}
+                | {'counters', [{atom(), non_neg_integer()}]}
+                | {'series', [{atom(), [{non_neg_integer(), number()}]}]}.       %% {Name, [{Ms, Value}]}
+-type format() :: 'json' | 'csv'.
+
+-define(PHASES, [module_load, module_compile, interpretation, solver_startup,
+                 trace_loading, solver_check, model_decoding]).
+-define(COUNTERS, [trace_bytes]).
+
+%% ============================================================================
+%% External exports
+%% ============================================================================
+
+%% Create the metrics table of the node
+%% The table lives as long as the calling process
+-spec new() -> 'ok'.
+
+new() ->
+  case ets:info(?TAB) of
+    undefined -> ok;
+    _ -> ets:delete(?TAB)
+  end,
+  ?TAB = ets:new(?TAB, [set, public, named_table, {write_concurrency, true}]),
+  true = ets:insert(?TAB, [{started, os:timestamp()}
+                           | [{{phase, P}, 0, 0} || P <- ?PHASES] ++ [{{counter, C}, 0} || C <- ?COUNTERS]]),
+  ok.
+
+-spec delete() -> 'ok'.
+
+delete() ->
+  _ = (catch ets:delete(?TAB)),
+  ok.
+
+%% Run a function and add its wall time to a phase
+%% (less the time of the phases nested in it)
+-spec time(phase(), fun(() -> X)) -> X.
+
+time(Phase, F) ->
+  Outer = enter(),
+  try F()
+  after
+    add_time(Phase, 1, leave(Outer))
+  end.
+
+%% Run a function and leave its wall time out of the
+%% phase it is called in (e.g. waiting for another process)
+-spec exclude(fun(() -> X)) -> X.
+
+exclude(F) ->
+  Outer = enter(),
+  try F()
+  after
+    _ = leave(Outer)
+  end.
+
+%% Add N occurrences of a phase that took Us microseconds
+-spec add_time(phase(), non_neg_integer(), non_neg_integer()) -> 'ok'.
+
+add_time(Phase, N, Us) ->
+  update({phase, Phase}, [{2, N}, {3, Us}], {{phase, Phase}, 0, 0}).
+
+%% Add N to a counter
+-spec count(atom(), integer()) -> 'ok'.
+
+count(Name, N) ->
+  update({counter, Name}, N, {{counter, Name}, 0}).
+
+%% Add a sample to a series of values over time
+-spec sample(atom(), number()) -> 'ok'.
+
+sample(Name, V) ->
+  try
+    [{started, T0}] = ets:lookup(?TAB, started),
+    _ = ets:insert_new(?TAB, {{series, Name}, 0}),
+    N = ets:update_counter(?TAB, {series, Name}, 1),
+    true = ets:insert(?TAB, {{sample, Name, N}, timer:now_diff(os:timestamp(), T0) div 1000, V}),
+    ok
+  catch
+    error:badarg -> ok
+  end.
+
+%% Get everything that has been recorded so far
+-spec snapshot() -> [metric()].
+
+snapshot() ->
+  case ets:info(?TAB) of
+    undefined ->
+      [{phases, []}, {counters, []}, {series, []}];
+    _ ->
+      Ps = lists:sort([{P, N, Us} || {{phase, P}, N, Us} <- ets:tab2list(?TAB)]),
+      Cs = lists:sort([{C, N} || {{counter, C}, N} <- ets:tab2list(?TAB)]),
+      Ss = [{S, [{T, V} || [_Seq, T, V] <- lists:sort(ets:match(?TAB, {{sample, S, '$1'}, '$2', '$3'}))]}
+            || {{series, S}, _Count} <- lists:sort(ets:tab2list(?TAB))],
+      [{phases, Ps}, {counters, Cs}, {series, Ss}]
+  end.
+
+%% Write the metrics of a run to a file
+%% Scalar metrics are written as they are, the phases, the counters
+%% and the series are read from the format of snapshot/0
+-spec dump([{atom(), term()}], format(), file:name()) -> 'ok' | {'error', term()}.
+
+dump(Metrics, Format, File) ->
+  file:write_file(File, encode(Format, Metrics)).
+
+%% ============================================================================
+%% Internal functions
+%% ============================================================================
+
+%% The time of the nested phases of a process is kept in its
+%% dictionary and is charged to the enclosing phase on leave/1
+enter() ->
+  Outer = get(?METRICS_PREFIX),
+  put(?METRICS_PREFIX, 0),
+  {os:timestamp(), Outer}.
+
+%% The self time of the phase that is left
+leave({T0, Outer}) ->
+  Us = timer:now_diff(os:timestamp(), T0),
+  Nested = get(?METRICS_PREFIX),
+  case Outer of
+    undefined -> erase(?METRICS_PREFIX);
+    _ -> put(?METRICS_PREFIX, Outer + Us)
+  end,
+  erlang:max(0, Us - Nested).
+
+update(Key, Op, Default) ->
+  try ets:update_counter(?TAB, Key, Op) of
+    _ -> ok
+  catch
+    error:badarg ->
+      %% A key that is not there yet or a missing table
+      try
+        _ = ets:insert_new(?TAB, Default),
+        _ = ets:update_counter(?TAB, Key, Op),
+        ok
+      catch
+        error:badarg -> ok
+      end
+  end.
+
+-spec encode(format(), [{atom(), term()}]) -> iolist().
+
+encode(json, Metrics) ->
+  [${, join([json_metric(M) || M <- Metrics], ",\n "), "}\n"];
+encode(csv, Metrics) ->
+  ["kind,name,key,value\n" | [csv_metric(M) || M <- Metrics]].
+
+json_metric({phases, Ps}) ->
+  F = fun({P, N, Us}) -> io_lib:format("\"~s\":{\"count\":~w,\"us\":~w}", [P, N, Us]) end,
+  ["\"phases\":{", join([F(P) || P <- Ps], ","), $}];
+json_metric({counters, Cs}) ->
+  ["\"counters\":{", join([io_lib:format("\"~s\":~w", [C, N]) || {C, N} <- Cs], ","), $}];
+json_metric({series, Ss}) ->
+  F = fun({S, Vs}) -> [$", atom_to_list(S), "\":[", join([io_lib:format("[~w,~w]", [T, V]) || {T, V} <- Vs], ","), $]] end,
+  ["\"series\":{", join([F(S) || S <- Ss], ","), $}];
+json_metric({K, V}) when is_number(V) ->
+  io_lib:format("\"~s\":~w", [K, V]).
+
+csv_metric({phases, Ps}) ->
+  [io_lib:format("phase,~s,count,~w~nphase,~s,us,~w~n", [P, N, P, Us]) || {P, N, Us} <- Ps];
+csv_metric({counters, Cs}) ->
+  [io_lib:format("counter,~s,,~w~n", [C, N]) || {C, N} <- Cs];
+csv_metric({series, Ss}) ->
+  [io_lib:format("series,~s,~w,~w~n", [S, T, V]) || {S, Vs} <- Ss, {T, V} <- Vs];
+csv_metric({K, V}) when is_number(V) ->
+  io_lib:format("metric,~s,,~w~n", [K, V]).
+
+join([], _Sep) -> [];
+join([X|Xs], Sep) -> [X | [[Sep, Y] || Y <- Xs]].
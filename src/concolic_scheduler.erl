@@ -4,26 +4,78 @@
 -behaviour(gen_server).
 
 %% External exports
--export([start/2, stop/1, initial_execution/4, request_input/1,
-         store_execution/5]).
+-export([start/2, start/3, stop/1, initial_execution/4, request_input/1,
+         store_execution/5, solver_stats/1, solver_timings/1, metrics/1]).
 
 %% gen_server callbacks
 -export([init/1, terminate/2, code_change/3, handle_info/2,
          handle_call/3, handle_cast/2]).
 
--type call()  :: 'request_input'
+%% exported types
+-export_type([option/0, metrics/0, metric/0]).
+
+-type call()  :: 'solver_stats'
+               | 'solver_timings'
+               | 'metrics'
                | {'init_execution', string(), concolic_analyzer:traces(), [concolic_symbolic:mapping()]}
                | {'store_execution', reference(), string(), concolic_analyzer:traces(), [concolic_symbolic:mapping()]}.
--type cast()  :: 'stop'.
+-type cast()  :: 'stop'
+               | {'request_input', pid(), reference()}.
+-type info()  :: {'solver_job', pid(), solver_result() | {'batch', [{integer(), solver_result()}]}}.
+-type solver_result() :: {'ok', [term()]} | {'error', python:status()}.
 -type reply() :: 'ok'
-               | 'empty'
-               | {reference(), [term()]}.
+               | solver_stats()
+               | solver_timings()
+               | metrics().
+-type solver_stats() :: {non_neg_integer(), non_neg_integer(), non_neg_integer()}.
+-type solver_timings() :: [{concolic_metrics:phase(), non_neg_integer(), non_neg_integer()}].
+-type metrics() :: [metric()].
+-type metric() :: {'elapsed', non_neg_integer()}            %% ms since the scheduler started
+                | {'inputs', non_neg_integer()}             %% Handed out inputs
+                | {'executions', non_neg_integer()}         %% Stored executions
+                | {'duplicates', non_neg_integer()}         %% Executions of an explored path
+                | {'skipped', non_neg_integer()}            %% Negations that were not solved
+                | {'sat' | 'unsat' | 'unknown' | 'timeout', non_neg_integer()}  %% Outcomes of the queries
+                | {'covered_branches', non_neg_integer()}
+                | {'distinct_paths', non_neg_integer()}.
+-type option() :: {'solvers', pos_integer()}                %% Number of solver workers per node
+                | {'nodes', [node()]}                       %% Nodes of the solver workers (and of the executions)
+                | {'max_inflight', pos_integer()}           %% Max number of solved & in-flight inputs
+                | {'generational', boolean()}               %% Expand all the branches of a state at once
+                | {'strategy', concolic_strategy:name()}    %% Prioritization of the queued states
+                | {'time_budget', pos_integer()}            %% Stop handing out inputs after some ms
+                | {'iterations', pos_integer()}             %% Stop handing out inputs after that many
+                | {'solver_timeout', pos_integer()}         %% Time bound of each query in ms
+                | {'solver_rlimit', pos_integer()}          %% Resource bound of each query
+                | {'solver_retries', non_neg_integer()}.    %% Retries with doubled bounds
+-type job()   :: {pid(), pid(), reference(), integer()}. %% {Job, Worker, State, Constraint}
+-type trace() :: {node(), file:name()}.  %% A trace file on the node of its execution
+
+-define(REMOTE_DIR, "temp/remote").  %% Copies of the traces solved on other nodes
 
 %% gen_server state datatype
 -record(state, {
-  queue,
-  info,
-  python,
+  queue,              %% States waiting to be expanded :: concolic_strategy:strategy()
+  info,               %% ETS table with the info of each state
+  paths,              %% Trie of the explored path vertices :: concolic_trie:trie()
+  python,             %% Command that starts a solver port
+  workers = [],       %% Idle solver workers
+  jobs = [],          %% In-flight solver jobs :: [job()]
+  ready,              %% Solved inputs waiting to be requested
+  waiting = [],       %% Callers of request_input waiting for an input :: [{pid(), reference()}]
+  max_inflight,       %% Bound on the number of ready & in-flight inputs
+  generational,       %% Generational search (solve all branches of a state in one job)
+  started,            %% Time the scheduler started
+  time_budget,        %% Time budget in ms or 'infinity'
+  iterations,         %% Budget of handed out inputs or 'infinity'
+  inputs = 0,         %% Number of handed out inputs
+  executions = 0,     %% Number of stored executions
+  duplicates = 0,     %% Number of dropped executions of an explored path
+  skipped = 0,        %% Number of negations of an explored or queued prefix
+  sat = 0,            %% Number of queries with a model
+  unsat = 0,          %% Number of unsatisfiable queries
+  unknown = 0,        %% Number of queries Z3 could not decide
+  timeouts = 0,       %% Number of queries that hit the bounds of the solver
   depth
 }).
 -type state() :: #state{}.
@@ -36,7 +88,12 @@
 -spec start(string(), integer()) -> pid() | no_return().
 
 start(Python, Depth) ->
-  case gen_server:start_link(?MODULE, [Python, Depth], []) of
+  start(Python, Depth, []).
+
+-spec start(string(), integer(), [option()]) -> pid() | no_return().
+
+start(Python, Depth, Opts) ->
+  case gen_server:start_link(?MODULE, [Python, Depth, Opts], []) of
     {ok, Scheduler} -> Scheduler;
     {error, R} -> exit({error_starting_scheduler, R})
   end.
@@ -55,10 +112,34 @@ store_execution(Scheduler, Ref, DataDir, Traces, Mapping) ->
   gen_server:call(Scheduler, {store_execution, Ref, DataDir, Traces, Mapping}).
 
 %% Request a new Input vertex for concolic execution
--spec request_input(pid()) -> {reference(), [term()]} | 'empty'.
+%% The input is sent to the caller as {input, Tag, {Ref, Input} | 'empty'}
+%% so that it can wait for it along with other messages
+-spec request_input(pid()) -> reference().
 
 request_input(Scheduler) ->
-  gen_server:call(Scheduler, request_input, 200000).
+  Tag = make_ref(),
+  gen_server:cast(Scheduler, {request_input, self(), Tag}),
+  Tag.
+
+%% Get the counters of the solver caches of the idle workers
+%% as {Hits, Hits on earlier models, Misses}
+-spec solver_stats(pid()) -> solver_stats().
+
+solver_stats(Scheduler) ->
+  gen_server:call(Scheduler, solver_stats).
+
+%% Get the wall time of the phases of the idle workers
+%% as [{Phase, Count, Microseconds}]
+-spec solver_timings(pid()) -> solver_timings().
+
+solver_timings(Scheduler) ->
+  gen_server:call(Scheduler, solver_timings).
+
+%% Get the number of explored paths and covered branches so far
+-spec metrics(pid()) -> metrics().
+
+metrics(Scheduler) ->
+  gen_server:call(Scheduler, metrics).
 
 %% Stop the Scheduler
 -spec stop(pid()) -> ok.
@@ -73,21 +154,44 @@ stop(Scheduler) ->
 %% ------------------------------------------------------------------
 %% gen_server callback : init/1
 %% ------------------------------------------------------------------
--spec init([string() | integer(), ...]) -> {ok, state()}.
+-spec init([string() | integer() | [option()], ...]) -> {ok, state()}.
 
-init([Python, Depth]) ->
-  Q = queue:new(),
+init([Python, Depth, Opts]) ->
+  Q = concolic_strategy:new(proplists:get_value(strategy, Opts, fifo), Depth),
   I = ets:new(?MODULE, [ordered_set, protected]),
-  {ok, #state{queue = Q, info = I, python = Python, depth = Depth}}.
+  N = proplists:get_value(solvers, Opts, 1),
+  Nodes = proplists:get_value(nodes, Opts, [node()]),
+  MaxInflight = proplists:get_value(max_inflight, Opts, 2 * N * length(Nodes)),
+  Gen = proplists:get_value(generational, Opts, false),
+  Lims = {proplists:get_value(solver_timeout, Opts, infinity), proplists:get_value(solver_rlimit, Opts, infinity),
+          proplists:get_value(solver_retries, Opts, 0)},
+  Ws = [start_worker(Node, Python, Lims) || Node <- Nodes, _ <- lists:seq(1, N)],
+  {ok, #state{queue = Q, info = I, paths = concolic_trie:new(), python = Python, workers = Ws, ready = queue:new(),
+              max_inflight = MaxInflight, generational = Gen, started = os:timestamp(),
+              time_budget = proplists:get_value(time_budget, Opts, infinity),
+              iterations = proplists:get_value(iterations, Opts, infinity), depth = Depth}}.
 
 %% ------------------------------------------------------------------
 %% gen_server callback : terminate/2
 %% ------------------------------------------------------------------
 -spec terminate(term(), state()) -> ok.
 
-terminate(_Reason, #state{info = I}) ->
+terminate(_Reason, #state{info = I, paths = T, workers = Ws, jobs = Js}) ->
+  %% Workers that are still solving are killed along with their jobs
+  %% (unlinked first, so that the scheduler is not killed along with them)
+  Kill = fun(P) -> unlink(P), exit(P, kill) end,
+  lists:foreach(fun({J, W, _R, _X}) -> Kill(J), Kill(W) end, Js),
+  %% States left over when a budget is spent
+  F = fun({_R, Ps}, ok) ->
+    case datadir(Ps) of
+      undefined -> ok;
+      _DataDir -> delete_datadir(Ps)
+    end
+  end,
+  ok = ets:foldl(F, ok, I),
   ets:delete(I),
-  ok.
+  concolic_trie:delete(T),
+  lists:foreach(fun python:stop/1, Ws).
 
 %% ------------------------------------------------------------------
 %% gen_server callback : code_change/3
@@ -100,8 +204,20 @@ code_change(_OldVsn, State, _Extra) ->
 %% ------------------------------------------------------------------
 %% gen_server callback : handle_info/2
 %% ------------------------------------------------------------------
--spec handle_info(term(), state()) -> {noreply, state()}.
-
+-spec handle_info(info() | term(), state()) -> {noreply, state()}.
+
+%% A solver job has finished
+handle_info({solver_job, Job, Result}, S=#state{info = I, workers = Ws, jobs = Js, ready = Rd}) ->
+  {value, {Job, W, R, X}, Js1} = lists:keytake(Job, 1, Js),
+  Rs =
+    case Result of
+      {batch, Rs0} -> Rs0;
+      _ -> [{X, Result}]
+    end,
+  Rd1 = lists:foldl(fun(XR, Acc) -> queue_input(XR, R, I, Acc) end, Rd, Rs),
+  release_state(R, Js1, I),
+  S1 = dispatch(count_results(Rs, S#state{workers = [W|Ws], jobs = Js1, ready = Rd1})),
+  {noreply, reply_waiting(sample_queue(S1))};
 handle_info(Msg, State) ->
   %% Just outputting unexpected messages for now
   io:format("[~s]: Unexpected message ~p~n", [?MODULE, Msg]),
@@ -110,116 +226,361 @@ handle_info(Msg, State) ->
 %% ------------------------------------------------------------------
 %% gen_server callback : handle_call/3
 %% ------------------------------------------------------------------
--spec handle_call(call(), {pid(), reference()}, state()) -> {reply, reply(), state()}.
+-spec handle_call(call(), {pid(), reference()}, state()) -> {reply, reply(), state()}
+                                                         | {noreply, state()}.
 
-handle_call({'init_execution', DataDir, Traces, Mapping}, _From, S=#state{queue = Q, info = I}) ->
+handle_call({'init_execution', DataDir, Traces, Mapping}, _From,
+            S=#state{queue = Q, info = I, paths = T, executions = E}) ->
   R = make_ref(),
 %  io:format("[~s]: Init = ~p~n", [?MODULE, R]),
-  Q1 = queue:in(R, Q),
   %% SIMPLIFICATION : Assume Sequential Execution
   [{_, [V]}] = concolic_analyzer:get_execution_vertices(Traces),
-  Data = create_info(1, length(V), DataDir, Traces, Mapping),
+  Vb = list_to_binary(V),
+  {New, true} = concolic_trie:insert(Vb, T),
+  Data = create_info(1, Vb, DataDir, Traces, Mapping, New),
   ets:insert(I, {R, Data}),
-  {reply, ok, S#state{queue = Q1}};
+  Q1 = concolic_strategy:in(R, Data, Q),
+  {reply, ok, reply_waiting(sample_queue(dispatch(S#state{queue = Q1, executions = E + 1})))};
 
-handle_call({'store_execution', Ref, DataDir, Traces, Mapping}, _From, S=#state{queue = Q, info = I}) ->
+handle_call({'store_execution', Ref, DataDir, Traces, Mapping}, _From,
+            S=#state{queue = Q, info = I, paths = T, executions = E, duplicates = Dp}) ->
   [{Ref, Ps}] = ets:lookup(I, Ref),
   %% SIMPLIFICATION : Assume Sequential Execution
-  [{_, [V]}] = concolic_analyzer:get_execution_vertices(Traces),
-  L = length(V),
-  case next_constraint(Ps) > L of
-    true ->
-%      io:format("[~s]: Wont queue ~p (~w > ~w)~n", [?MODULE, Ref, next_constraint(Ps), L]),
-      concolic_analyzer:clear_and_delete_dir(DataDir),
-      {reply, ok, S};
+  [{Node, [V]}] = concolic_analyzer:get_execution_vertices(Traces),
+  Vb = list_to_binary(V),
+  {New, Fresh} = concolic_trie:insert(Vb, T),
+  add_yield(parent(Ps), New, I),
+  S1 = S#state{executions = E + 1},
+  case Fresh of
     false ->
-      Ps1 = update_partial_info(Ps, L, DataDir, Traces, Mapping),
-      ets:insert(I, {Ref, Ps1}),
-      Q1 = queue:in(Ref, Q),
-      {reply, ok, S#state{queue = Q1}}
+%      io:format("[~s]: Wont queue ~p (explored path)~n", [?MODULE, Ref]),
+      concolic_analyzer:clear_and_delete_dir(Node, DataDir),
+      ets:delete(I, Ref),
+      {reply, ok, reply_waiting(S1#state{duplicates = Dp + 1})};
+    true ->
+      case next_constraint(Ps) > byte_size(Vb) of
+        true ->
+%          io:format("[~s]: Wont queue ~p (~w > ~w)~n", [?MODULE, Ref, next_constraint(Ps), byte_size(Vb)]),
+          concolic_analyzer:clear_and_delete_dir(Node, DataDir),
+          ets:delete(I, Ref),
+          {reply, ok, reply_waiting(S1)};
+        false ->
+          Ps1 = update_partial_info(Ps, Vb, DataDir, Traces, Mapping, New),
+          ets:insert(I, {Ref, Ps1}),
+          Q1 = concolic_strategy:in(Ref, Ps1, Q),
+          {reply, ok, reply_waiting(sample_queue(dispatch(S1#state{queue = Q1})))}
+      end
   end;
 
-handle_call('request_input', _From, S=#state{queue = Q, info = I, python = P, depth = D}) ->
-  case generate_testcase(Q, I, P, D) of
-    {empty, Q1} ->
-      {reply, empty, S#state{queue = Q1}};
-    {ok, {R, Inp}, Q1} ->
-      {reply, {R, Inp}, S#state{queue = Q1}}
-  end.
+handle_call('solver_stats', _From, S=#state{workers = Ws}) ->
+  F = fun(W, {H, MH, M}) ->
+    {WH, WMH, WM} = python:stats(W),
+    {H + WH, MH + WMH, M + WM}
+  end,
+  {reply, lists:foldl(F, {0, 0, 0}, Ws), S};
+
+handle_call('solver_timings', _From, S=#state{workers = Ws}) ->
+  F = fun({P, N, Us}, Acc) ->
+    orddict:update(P, fun({N0, Us0}) -> {N0 + N, Us0 + Us} end, {N, Us}, Acc)
+  end,
+  Ts = lists:foldl(F, orddict:new(), lists:append([python:timings(W) || W <- Ws])),
+  {reply, [{P, N, Us} || {P, {N, Us}} <- Ts], S};
+
+handle_call('metrics', _From, S=#state{paths = T, started = T0, inputs = N, executions = E,
+                                       duplicates = Dp, skipped = Sk, sat = Sat, unsat = Unsat,
+                                       unknown = Unk, timeouts = TO}) ->
+  Elapsed = timer:now_diff(os:timestamp(), T0) div 1000,
+  Ms = [{'elapsed', Elapsed}, {'inputs', N}, {'executions', E}, {'duplicates', Dp}, {'skipped', Sk},
+        {'sat', Sat}, {'unsat', Unsat}, {'unknown', Unk}, {'timeout', TO}],
+  {reply, Ms ++ concolic_trie:metrics(T), S}.
 
 %% ------------------------------------------------------------------
 %% gen_server callback : handle_cast/2
 %% ------------------------------------------------------------------
--spec handle_cast(cast(), state()) -> {stop, normal, state()}.
+-spec handle_cast(cast(), state()) -> {stop, normal, state()} | {noreply, state()}.
 
 handle_cast(stop, State) ->
-  {stop, normal, State}.
+  {stop, normal, State};
+handle_cast({request_input, Pid, Tag}, S=#state{waiting = Wt}) ->
+  {noreply, reply_waiting(S#state{waiting = Wt ++ [{Pid, Tag}]})}.
 
 %% ============================================================================
 %% Internal functions
 %% ============================================================================
 
-generate_testcase(Q, I, P, D) ->
-  case expand_state(Q, I, P, D) of
-    {error, Q1} -> generate_testcase(Q1, I, P, D);
-    X -> X
+%% Hand out queued states to idle solver workers
+%% as long as the in-flight limit allows it
+-spec dispatch(state()) -> state().
+
+dispatch(S=#state{workers = [_|_]=Ws0, queue = Q, info = I, paths = T, jobs = Js, ready = Rd,
+                  max_inflight = Max, generational = Gen, skipped = Sk, depth = D}) ->
+  case length(Js) + queue:len(Rd) < Max of
+    false -> S;
+    true ->
+      case concolic_strategy:out(Q) of
+        {empty, _} -> S;
+        {{value, R}, Q1} ->
+          [{R, Ps}] = ets:lookup(I, R),
+          %% SIMPLIFICATION : Assume Sequential Execution
+          [{Node, [File]}] = traces(Ps),
+          {W, Ws} = take_worker(Node, Ws0),
+          X = next_constraint(Ps),
+%          io:format("[~s]: Try to expand ~p at ~w~n", [?MODULE, R, X]),
+          case Gen of
+            false ->
+              Q2 = requeue_state(Ps, Q1, R, I, D),
+              case concolic_trie:claim(vertex(Ps), X, T) of
+                true ->
+                  Job = spawn_solver_job(W, {Node, File}, X, mapping(Ps)),
+                  dispatch(S#state{workers = Ws, queue = Q2, jobs = [{Job, W, R, X}|Js]});
+                false ->
+                  %% The negated prefix is already explored or being solved
+                  release_state(R, Js, I),
+                  dispatch(S#state{queue = Q2, skipped = Sk + 1})
+              end;
+            true ->
+              %% The whole generation of children is solved at once
+              ets:insert(I, {R, [{'exhausted', true} | Ps]}),
+              Bs = branches(X, Ps, D),
+              case [B || B <- Bs, concolic_trie:claim(vertex(Ps), B, T)] of
+                [] ->
+                  release_state(R, Js, I),
+                  dispatch(S#state{queue = Q1, skipped = Sk + length(Bs)});
+                Xs ->
+                  Job = spawn_batch_job(W, {Node, File}, Xs, mapping(Ps)),
+                  dispatch(S#state{workers = Ws, queue = Q1, jobs = [{Job, W, R, X}|Js],
+                                   skipped = Sk + length(Bs) - length(Xs)})
+              end
+          end
+      end
+  end;
+dispatch(S) -> S.
+
+%% Take an idle worker, preferably one on the node of the trace
+%% so that the trace does not have to be copied
+-spec take_worker(node(), [pid(), ...]) -> {pid(), [pid()]}.
+
+take_worker(Node, Ws) ->
+  case lists:partition(fun(W) -> node(W) =:= Node end, Ws) of
+    {[W|Local], Other} -> {W, Local ++ Other};
+    {[], [W|Other]} -> {W, Other}
   end.
 
-expand_state(Q, I, P, D) ->
-  case queue:out(Q) of
-    {{value, R}, Q1} ->
-      [{R, Ps}] = ets:lookup(I, R),
-      %% SIMPLIFICATION : Assume Sequential Execution
-      [File] = proplists:get_value(node(), traces(Ps)),
-      X = next_constraint(Ps),
-%      io:format("[~s]: Try to expand ~p at ~w~n", [?MODULE, R, X]),
-      case python:solve(File, X, mapping(Ps), P) of
-        error ->
-%          io:format("[~s]: Failed~n", [?MODULE]),
-          Q2 = requeue_state(Ps, Q1, R, I, D),
-          {error, Q2};
-        {ok, Inp} ->
-          R1 = make_ref(),
-%          io:format("[~s]: New Inp = ~p~n", [?MODULE, R1]),
-          ets:insert(I, {R1, create_partial_info(X+1)}),
-          Q2 = requeue_state(Ps, Q1, R, I, D),
-          {ok, {R1, Inp}, Q2}
-      end;
-    {empty, Q} = E -> E;
-    X -> throw(X)
+%% Start a solver worker on a node with the bounds of each query
+-spec start_worker(node(), string(), python:limits()) -> pid().
+
+start_worker(Node, Python, Lims) ->
+  F = fun() ->
+    W = python:start_worker(Node, Python),
+    ok = python:set_limits(W, Lims),
+    %% The first reply of the port comes after Z3 is loaded
+    _ = python:stats(W),
+    W
+  end,
+  concolic_metrics:time(solver_startup, F).
+
+%% Solve a query on a worker without blocking the scheduler
+-spec spawn_solver_job(pid(), trace(), integer(), [concolic_symbolic:mapping()]) -> pid().
+
+spawn_solver_job(W, File, X, Mapping) ->
+  Scheduler = self(),
+  F = fun() ->
+    Result = with_trace(W, File, fun(Tr) -> python:worker_solve(W, Tr, X, Mapping) end),
+    Scheduler ! {solver_job, self(), Result}
+  end,
+  spawn_link(F).
+
+%% Solve the negation of several constraints of a trace
+%% in one session on a worker without blocking the scheduler
+-spec spawn_batch_job(pid(), trace(), [integer()], [concolic_symbolic:mapping()]) -> pid().
+
+spawn_batch_job(W, File, Xs, Mapping) ->
+  Scheduler = self(),
+  F = fun() ->
+    Results = with_trace(W, File, fun(Tr) -> python:worker_solve_all(W, Tr, Xs, Mapping) end),
+    Scheduler ! {solver_job, self(), {batch, Results}}
+  end,
+  spawn_link(F).
+
+%% Run a query of a worker on a trace
+%% The traces are kept on the node of their execution, so a worker
+%% on another node gets a copy of the trace (and of its index)
+%% that is deleted after the query. The copy is named after the job
+%% process, as jobs on the same trace may run on the same node.
+-spec with_trace(pid(), trace(), fun((file:name()) -> X)) -> X.
+
+with_trace(W, {Node, File}, F) when node(W) =:= Node ->
+  F(File);
+with_trace(W, {Node, File}, F) ->
+  WNode = node(W),
+  Job = [C || C <- pid_to_list(self()), C =/= $<, C =/= $>],
+  Copy = ?REMOTE_DIR ++ "/" ++ atom_to_list(Node) ++ "/" ++ string:strip(File, left, $/) ++ "-" ++ Job,
+  Fs = [{Src, Dst} || {Src, Dst} <- [{File, Copy}, {concolic_encdec:index_file(File), concolic_encdec:index_file(Copy)}],
+                      rpc:call(Node, filelib, is_regular, [Src])],
+  Send = fun({Src, Dst}) ->
+    {ok, Bin} = rpc:call(Node, file, read_file, [Src]),
+    ok = rpc:call(WNode, filelib, ensure_dir, [Dst]),
+    ok = rpc:call(WNode, file, write_file, [Dst, Bin])
+  end,
+  lists:foreach(Send, Fs),
+  try F(Copy)
+  after
+    lists:foreach(fun({_Src, Dst}) -> rpc:call(WNode, file, delete, [Dst]) end, Fs)
+  end.
+
+%% The negatable branches of a state, from its bound up to Depth
+-spec branches(integer(), [proplists:property()], integer()) -> [integer()].
+
+branches(X, Ps, Depth) ->
+  Hi = erlang:min(path_length(Ps), Depth),
+  case X =< Hi of
+    true  -> lists:seq(X, Hi);
+    false -> []
   end.
 
+%% Queue the input produced by negating constraint X
+%% Its own executions will be expanded from X+1 onwards
+-spec queue_input({integer(), solver_result()}, reference(), ets:tab(), queue:queue()) -> queue:queue().
+
+queue_input({_X, {error, _}}, _R, _I, Rd) ->
+%  io:format("[~s]: Failed~n", [?MODULE]),
+  Rd;
+queue_input({X, {ok, Inp}}, R, I, Rd) ->
+  R1 = make_ref(),
+%  io:format("[~s]: New Inp = ~p~n", [?MODULE, R1]),
+  ets:insert(I, {R1, create_partial_info(X+1, R)}),
+  queue:in({R1, Inp}, Rd).
+
+%% Count the outcomes of the queries of a solver job
+%% Queries that are unknown or time out are not retried by the scheduler,
+%% their prefix stays claimed so that the branch is skipped
+-spec count_results([{integer(), solver_result()}], state()) -> state().
+
+count_results([], S) ->
+  S;
+count_results([{_X, {ok, _}}|Rs], S=#state{sat = N}) ->
+  count_results(Rs, S#state{sat = N + 1});
+count_results([{_X, {error, unsat}}|Rs], S=#state{unsat = N}) ->
+  count_results(Rs, S#state{unsat = N + 1});
+count_results([{_X, {error, unknown}}|Rs], S=#state{unknown = N}) ->
+  count_results(Rs, S#state{unknown = N + 1});
+count_results([{_X, {error, timeout}}|Rs], S=#state{timeouts = N}) ->
+  count_results(Rs, S#state{timeouts = N + 1});
+count_results([{_X, {error, _}}|Rs], S=#state{unknown = N}) ->
+  %% Any other failure of a query leaves it undecided
+  count_results(Rs, S#state{unknown = N + 1}).
+
+%% Answer the waiting callers of request_input from the ready queue
+%% When there is nothing left to expand they get 'empty'
+-spec reply_waiting(state()) -> state().
+
+reply_waiting(S=#state{waiting = []}) ->
+  S;
+reply_waiting(S=#state{waiting = Wt}) ->
+  case budget_spent(S) of
+    true ->
+      lists:foreach(fun(W) -> reply_input(W, empty) end, Wt),
+      S#state{waiting = []};
+    false ->
+      reply_ready(S)
+  end.
+
+reply_ready(S=#state{waiting = []}) ->
+  S;
+reply_ready(S=#state{waiting = [From|Wt], ready = Rd, queue = Q, jobs = Js, inputs = N}) ->
+  case queue:out(Rd) of
+    {{value, Inp}, Rd1} ->
+      reply_input(From, Inp),
+      reply_waiting(dispatch(S#state{waiting = Wt, ready = Rd1, inputs = N + 1}));
+    {empty, Rd} ->
+      case concolic_strategy:is_empty(Q) andalso Js =:= [] of
+        true ->
+          lists:foreach(fun(W) -> reply_input(W, empty) end, [From|Wt]),
+          S#state{waiting = []};
+        false ->
+          S
+      end
+  end.
+
+reply_input({Pid, Tag}, Reply) ->
+  Pid ! {input, Tag, Reply}.
+
 requeue_state(Ps, Q, R, I, D) ->
 %  io:format("[~s]: Will try to requeue ~p~n", [?MODULE, R]),
   case increase_next_constraint(Ps, D) of
     false ->
 %      io:format("[~s]: Failed~n", [?MODULE]),
-      DataDir = datadir(Ps),
-      concolic_analyzer:clear_and_delete_dir(DataDir),
+      %% The trace is deleted once the solver jobs on it have finished
+      ets:insert(I, {R, [{'exhausted', true} | Ps]}),
       Q;
     {ok, Ps1} ->
 %      io:format("[~s]: Done~n", [?MODULE]),
-      Q1 = queue:in(R, Q),
+      Q1 = concolic_strategy:in(R, Ps1, Q),
       ets:insert(I, {R, Ps1}),
       Q1
   end.
 
+%% Credit a state with the branches first covered by one of its children
+add_yield(undefined, _New, _I) ->
+  ok;
+add_yield(_R, 0, _I) ->
+  ok;
+add_yield(R, New, I) ->
+  case ets:lookup(I, R) of
+    [{R, Ps}] ->
+      Y = proplists:get_value('yield', Ps, 0),
+      ets:insert(I, {R, [{'yield', Y + New} | proplists:delete('yield', Ps)]}),
+      ok;
+    [] ->
+      ok
+  end.
+
+%% Record the number of states waiting to be expanded
+sample_queue(S=#state{queue = Q}) ->
+  ok = concolic_metrics:sample(queue_depth, concolic_strategy:len(Q)),
+  S.
+
+%% Whether the time or the iteration budget has been spent
+budget_spent(#state{started = T0, time_budget = T, iterations = Max, inputs = N}) ->
+  budget_spent(N, Max) orelse budget_spent(timer:now_diff(os:timestamp(), T0) div 1000, T).
+
+budget_spent(_Spent, infinity) -> false;
+budget_spent(Spent, Budget) -> Spent >= Budget.
+
+%% Delete the trace of an exhausted state when no job is still using it
+release_state(R, Js, I) ->
+  [{R, Ps}] = ets:lookup(I, R),
+  case is_exhausted(Ps) andalso not lists:keymember(R, 3, Js) of
+    true ->
+      delete_datadir(Ps),
+      ets:delete(I, R),
+      ok;
+    false ->
+      ok
+  end.
+
 %% ------------------------------------------------------------------
 %% Functions that handle the info stored in the ETS table
 %% Info structure
 %% --------------
 %% {No of constraint to negate :: integer(),
 %%  Length of execution path :: integer(),
+%%  Path vertex :: concolic_trie:vertex(),
 %%  DataDir :: string(),
 %%  Traces :: concolic_analyzer:traces(),
-%%  Mapping :: [concolic_symbolic:mapping()]}
+%%  Mapping :: [concolic_symbolic:mapping()],
+%%  Parent :: reference()  (state whose expansion produced it),
+%%  New branches :: integer()  (branches first covered by its execution),
+%%  Yield :: integer()  (branches first covered by its children),
+%%  Exhausted :: boolean()  (no more constraints to negate)}
 %% ------------------------------------------------------------------
 
-create_partial_info(I) ->
-  [{'next_constraint', I}].
+create_partial_info(I, Parent) ->
+  [{'next_constraint', I}, {'parent', Parent}].
 
-update_partial_info(Ps, L, DataDir, Ts, Ms) ->
-  [{'path_length', L}, {'datadir', DataDir}, {'traces', Ts}, {'mapping', Ms} | Ps].
+update_partial_info(Ps, V, DataDir, Ts, Ms, New) ->
+  [{'path_length', byte_size(V)}, {'vertex', V}, {'datadir', DataDir}, {'traces', Ts}, {'mapping', Ms},
+   {'new_branches', New} | Ps].
 
 increase_next_constraint(Ps, Depth) ->
   X = next_constraint(Ps) + 1,
@@ -236,15 +597,28 @@ replace_property(Key, Value, [{Key, _V}|Ps], Acc) ->
 replace_property(Key, Value, [{_K, _V}=P|Ps], Acc) ->
   replace_property(Key, Value, Ps, [P|Acc]).
 
-create_info(I, L, DataDir, Ts, Ms) ->
-  [{'next_constraint', I}, {'path_length', L}, {'datadir', DataDir}, {'traces', Ts}, {'mapping', Ms}].
+create_info(I, V, DataDir, Ts, Ms, New) ->
+  [{'next_constraint', I}, {'path_length', byte_size(V)}, {'vertex', V}, {'datadir', DataDir},
+   {'traces', Ts}, {'mapping', Ms}, {'new_branches', New}].
 
 next_constraint(Ps) -> proplists:get_value('next_constraint', Ps).
 
+%% The data directory of a state is on the node of its execution
+delete_datadir(Ps) ->
+  %% SIMPLIFICATION : Assume Sequential Execution
+  [{Node, _}] = traces(Ps),
+  concolic_analyzer:clear_and_delete_dir(Node, datadir(Ps)).
+
 path_length(Ps) -> proplists:get_value('path_length', Ps).
 
+vertex(Ps) -> proplists:get_value('vertex', Ps).
+
 datadir(Ps) -> proplists:get_value('datadir', Ps).
 
 traces(Ps) -> proplists:get_value('traces', Ps).
 
 mapping(Ps) -> proplists:get_value('mapping', Ps).
+
+parent(Ps) -> proplists:get_value('parent', Ps).
+
+is_exhausted(Ps) -> proplists:get_value('exhausted', Ps, false).
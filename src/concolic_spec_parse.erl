@@ -125,7 +125,7 @@
 -spec parse_specs_in_module(atom()) -> ok.
 
 parse_specs_in_module(M) ->
-  Server = concolic_cserver:init_codeserver("tmp", self()),
+  Server = concolic_cserver:init_codeserver(self()),
   {Specs, BoundTypes} = spec_and_bind_types(Server, M),
   parse_all_specs(Server, Specs, BoundTypes),
   error_logger:tty(false),
@@ -179,7 +179,7 @@ parse_all_specs(Server, Specs, BoundTypes) ->
 -spec locate_spec_in_module(mfa()) -> {ok, type_sig()} | error.
 
 locate_spec_in_module({M, _F, _A}=MFA) ->
-  Server = concolic_cserver:init_codeserver("dev", self()),
+  Server = concolic_cserver:init_codeserver(self()),
   {Specs, BoundTypes} = spec_and_bind_types(Server, M),
   S = locate_mfa_spec(Server, MFA, Specs, BoundTypes),
   io:format("~p~n", [S]),
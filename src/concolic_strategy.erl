@@ -0,0 +1,97 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(concolic_strategy).
+
+%% Prioritization of the states that wait to be expanded by the scheduler.
+%% The states are kept in a priority queue ordered by their score and,
+%% for equal scores, by the order they were queued. The 'fifo' strategy
+%% is the one that gives the same score to every state.
+
+%% External exports
+-export([new/2, in/3, out/1, is_empty/1, len/1]).
+
+%% exported types
+-export_type([strategy/0, name/0, score_fun/0, features/0]).
+
+-type name() :: 'fifo' | 'coverage' | score_fun().
+-type score_fun() :: fun((features()) -> number()).
+-type features() :: [{'new_branches', non_neg_integer()}      %% Branches first covered by the state
+                   | {'yield', non_neg_integer()}             %% Branches first covered by its children
+                   | {'next_constraint', pos_integer()}       %% Next constraint to negate
+                   | {'path_length', non_neg_integer()}       %% Length of its execution path
+                   | {'depth', pos_integer()}].               %% Depth of the search
+
+-record(strategy, {
+  score,                       %% score_fun()
+  depth,                       %% Depth of the search
+  queue = gb_trees:empty(),    %% {-Score, Seq} -> State
+  seq = 0                      %% Number of queued states so far
+}).
+-opaque strategy() :: #strategy{}.
+
+%% ============================================================================
+%% External exports
+%% ============================================================================
+
+%% Create an empty queue of states
+-spec new(name(), pos_integer()) -> strategy().
+
+new(Name, Depth) ->
+  #strategy{score = score_fun(Name), depth = Depth}.
+
+%% Queue a state with its info
+-spec in(reference(), [proplists:property()], strategy()) -> strategy().
+
+in(R, Ps, St=#strategy{score = Score, depth = Depth, queue = Q, seq = N}) ->
+  Fs = [{'new_branches', proplists:get_value('new_branches', Ps, 0)},
+        {'yield', proplists:get_value('yield', Ps, 0)},
+        {'next_constraint', proplists:get_value('next_constraint', Ps)},
+        {'path_length', proplists:get_value('path_length', Ps)},
+        {'depth', Depth}],
+  St#strategy{queue = gb_trees:insert({-Score(Fs), N}, R, Q), seq = N + 1}.
+
+%% Take the state with the highest score out of the queue
+-spec out(strategy()) -> {'empty', strategy()} | {{'value', reference()}, strategy()}.
+
+out(St=#strategy{queue = Q}) ->
+  case gb_trees:is_empty(Q) of
+    true -> {empty, St};
+    false ->
+      {_Key, R, Q1} = gb_trees:take_smallest(Q),
+      {{value, R}, St#strategy{queue = Q1}}
+  end.
+
+-spec is_empty(strategy()) -> boolean().
+
+is_empty(#strategy{queue = Q}) ->
+  gb_trees:is_empty(Q).
+
+-spec len(strategy()) -> non_neg_integer().
+
+len(#strategy{queue = Q}) ->
+  gb_trees:size(Q).
+
+%% ============================================================================
+%% Internal functions
+%% ============================================================================
+
+-spec score_fun(name()) -> score_fun().
+
+score_fun(fifo) ->
+  fun(_Fs) -> 0 end;
+score_fun(coverage) ->
+  fun coverage_score/1;
+score_fun(F) when is_function(F, 1) ->
+  F.
+
+%% Prefer the states that covered new branches themselves
+%% or through their children, and then the ones with
+%% a larger part of their path left to negate
+-spec coverage_score(features()) -> number().
+
+coverage_score(Fs) ->
+  New = proplists:get_value('new_branches', Fs),
+  Yield = proplists:get_value('yield', Fs),
+  X = proplists:get_value('next_constraint', Fs),
+  L = erlang:min(proplists:get_value('path_length', Fs), proplists:get_value('depth', Fs)),
+  2 * New + Yield + erlang:max(0, L - X + 1) / erlang:max(1, L).
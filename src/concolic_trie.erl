@@ -0,0 +1,121 @@
+%% -*- erlang-indent-level: 2 -*-
+%%------------------------------------------------------------------------------
+-module(concolic_trie).
+
+%% A trie of the explored path vertices, kept in an ETS table.
+%% Every node of the trie is a prefix of a path vertex and is
+%% either 'explored', when an execution has taken it, or 'queued',
+%% when an input that is expected to take it is being solved.
+%%
+%%       Key                  Value
+%% -----------------    ---------------
+%% {Parent, Branch}     {Node :: pos_integer(), 'explored' | 'queued'}
+%% {path, Node}         true  (an execution ended at Node)
+%% nodes                Number of nodes so far
+%% explored             Number of explored nodes
+%% paths                Number of distinct paths
+
+%% External exports
+-export([new/0, delete/1, insert/2, claim/3, metrics/1]).
+
+%% exported types
+-export_type([trie/0, vertex/0]).
+
+-define(ROOT, 0).
+
+-type trie() :: ets:tab().
+-type vertex() :: binary().  %% A path vertex as a binary of $T / $F
+
+%% ============================================================================
+%% External exports
+%% ============================================================================
+
+-spec new() -> trie().
+
+new() ->
+  T = ets:new(?MODULE, [set, protected]),
+  true = ets:insert(T, [{nodes, 0}, {explored, 0}, {paths, 0}]),
+  T.
+
+-spec delete(trie()) -> true.
+
+delete(T) ->
+  ets:delete(T).
+
+%% Add the path vertex of an execution and return the number
+%% of branches it explored first and whether it is a new path
+-spec insert(vertex(), trie()) -> {non_neg_integer(), boolean()}.
+
+insert(V, T) ->
+  {Node, New} = insert(V, ?ROOT, 0, T),
+  case ets:insert_new(T, {{path, Node}, true}) of
+    true ->
+      _ = ets:update_counter(T, paths, 1),
+      {New, true};
+    false ->
+      {New, false}
+  end.
+
+%% Claim the prefix that negates the Xth branch of a path vertex
+%% Fails when an execution has already taken that prefix or
+%% when an input for it is already being solved
+-spec claim(vertex(), pos_integer(), trie()) -> boolean().
+
+claim(V, X, T) when X =< byte_size(V) ->
+  Y = X - 1,
+  <<Prefix:Y/binary, B, _/binary>> = V,
+  case lookup(Prefix, ?ROOT, T) of
+    {ok, Parent} ->
+      case ets:lookup(T, {Parent, flip(B)}) of
+        [] ->
+          N = ets:update_counter(T, nodes, 1),
+          ets:insert_new(T, {{Parent, flip(B)}, {N, queued}});
+        [_] ->
+          false
+      end;
+    error ->
+      true
+  end;
+claim(_V, _X, _T) ->
+  true.
+
+-spec metrics(trie()) -> [{'covered_branches' | 'distinct_paths', non_neg_integer()}].
+
+metrics(T) ->
+  [{explored, E}] = ets:lookup(T, explored),
+  [{paths, P}] = ets:lookup(T, paths),
+  [{covered_branches, E}, {distinct_paths, P}].
+
+%% ============================================================================
+%% Internal functions
+%% ============================================================================
+
+insert(<<>>, Node, New, _T) ->
+  {Node, New};
+insert(<<B, Bs/binary>>, Parent, New, T) ->
+  Key = {Parent, B},
+  case ets:lookup(T, Key) of
+    [{Key, {Node, explored}}] ->
+      insert(Bs, Node, New, T);
+    [{Key, {Node, queued}}] ->
+      true = ets:insert(T, {Key, {Node, explored}}),
+      _ = ets:update_counter(T, explored, 1),
+      insert(Bs, Node, New + 1, T);
+    [] ->
+      Node = ets:update_counter(T, nodes, 1),
+      true = ets:insert(T, {Key, {Node, explored}}),
+      _ = ets:update_counter(T, explored, 1),
+      insert(Bs, Node, New + 1, T)
+  end.
+
+%% Find the node of a prefix
+lookup(<<>>, Node, _T) ->
+  {ok, Node};
+lookup(<<B, Bs/binary>>, Parent, T) ->
+  case ets:lookup(T, {Parent, B}) of
+    [{_, {Node, _}}] -> lookup(Bs, Node, T);
+    [] -> error
+  end.
+
+flip($T) -> $F;
+flip($F) -> $T.
@@ -4,15 +4,15 @@
 -behaviour(gen_server).
 
 %% External exports
--export([init_traceserver/3, terminate/1, register_to_trace/2,
-         is_monitored/2, node_servers/2, file_descriptor/1]).
+-export([init_traceserver/3, init_traceserver/4, terminate/1, register_to_trace/2,
+         is_monitored/2, node_servers/2, file_descriptor/1, charge/2]).
 
 %% gen_server callbacks
 -export([init/1, terminate/2, handle_call/3,
          code_change/3, handle_info/2, handle_cast/2]).
          
 %% exported types
--export_type([tlogs/0]).
+-export_type([tlogs/0, limit/0, limits/0]).
 
 -include("concolic_internal.hrl").
 
@@ -22,9 +22,12 @@
                | {'node_servers', node()}
                | {'get_fd', pid()}.
 -type cast()  :: {'store_fd', pid(), file:io_device()}
-               | {'terminate', pid()}.
--type info()  :: {'DOWN', reference(), 'process', pid(), term()}.
--type reply() :: {'ok', file:name(), integer()}
+               | {'terminate', pid()}
+               | {'limit_exceeded', pid(), limit()}.
+-type info()  :: {'DOWN', reference(), 'process', pid(), term()}
+               | {'limit_exceeded', limit()}
+               | 'check_reductions'.
+-type reply() :: {'ok', file:name(), integer(), ets:tab() | 'undefined'}
                | boolean()
                | {'ok', {pid(), pid()}}
                | {'ok', file:io_device()}.
@@ -36,8 +39,18 @@
   ptree :: ets:tab(),  %% ETS table where {Parent, Child} process pids are stored
   fds   :: ets:tab(),  %% ETS table where {Pid, Fd} are stored
   dir   :: string(),   %% Directory where traces are saved
-  logs  :: tlogs()     %% Proplist to store log informations // currently only {procs, NumOfMonitoredProcs}
+  logs  :: tlogs(),    %% Proplist to store log informations // currently only {procs, NumOfMonitoredProcs}
+  limits :: ets:tab() | 'undefined',  %% Counters of the limits charged by the evaluators
+  reductions :: pos_integer() | 'infinity'  %% Limit on the reductions of the live evaluators
 }).
+-type limit()  :: 'time'         %% Wall time of the execution in ms
+                | 'reductions'   %% Reductions of the live evaluator processes
+                | 'trace_bytes'  %% Bytes logged to the traces
+                | 'calls'.       %% Interpreted function calls
+-type limits() :: [{limit(), pos_integer()}].
+
+-define(REDUCTIONS_TICK, 100).  %% ms between two checks of the reductions
+-define(STOP_TIMEOUT, 5000).    %% ms an evaluator over a limit waits to be killed
 -type state() :: #state{}.
 -type tlogs() :: [proplists:property()].
 
@@ -49,7 +62,12 @@
 -spec init_traceserver(string(), pid(), integer()) -> pid() | no_return().
 
 init_traceserver(TraceDir, Super, Depth) ->
-  case gen_server:start(?MODULE, [TraceDir, Super, Depth], []) of
+  init_traceserver(TraceDir, Super, Depth, []).
+
+-spec init_traceserver(string(), pid(), integer(), limits()) -> pid() | no_return().
+
+init_traceserver(TraceDir, Super, Depth, Limits) ->
+  case gen_server:start(?MODULE, [TraceDir, Super, Depth, Limits], []) of
     {ok, TraceServer} -> TraceServer;
     {error, Reason}   -> exit({traceserver_init, Reason})
   end.
@@ -64,10 +82,11 @@ terminate(TraceServer) ->
 -spec register_to_trace(pid(), pid()) -> {'ok', file:io_device()}.
 
 register_to_trace(TraceServer, Parent) ->
-  {ok, Filename, Depth} = gen_server:call(TraceServer, {register_parent, Parent}),
+  {ok, Filename, Depth, Limits} = gen_server:call(TraceServer, {register_parent, Parent}),
   {ok, Fd} = concolic_encdec:open_file(Filename, 'write'),
   store_file_descriptor(TraceServer, Fd),
   put(?DEPTH_PREFIX, Depth), %% Set Remaining Constraint counter to Depth
+  put(?LIMITS_PREFIX, {TraceServer, Limits}),
 %  ok = concolic_encdec:log_pid(Fd, self()),
   {ok, Fd}.
 
@@ -91,6 +110,30 @@ file_descriptor(TraceServer) ->
   {ok, Fd} = gen_server:call(TraceServer, {get_fd, self()}),
   Fd.
 
+%% Charge the calling evaluator's execution with N units of a limit
+%% When the limit is exceeded the TraceServer stops the execution
+%% and the caller waits to be killed (or exits itself if it is not)
+%% The counters are gone once the TraceServer has terminated
+-spec charge(limit(), pos_integer()) -> 'ok'.
+
+charge(Limit, N) ->
+  case get(?LIMITS_PREFIX) of
+    {TraceServer, Limits} when Limits =/= undefined ->
+      try ets:update_counter(Limits, Limit, [{2, N}, {3, 0}]) of
+        [C, Max] when Max >= 0, C > Max ->
+          gen_server:cast(TraceServer, {limit_exceeded, self(), Limit}),
+          receive after ?STOP_TIMEOUT -> exit({limit_exceeded, Limit}) end;
+        _ ->
+          ok
+      catch
+        error:badarg ->
+          put(?LIMITS_PREFIX, {TraceServer, undefined}),
+          ok
+      end;
+    _ ->
+      ok
+  end.
+
 %% ============================================================================
 %% gen_server callbacks
 %% ============================================================================
@@ -98,9 +141,9 @@ file_descriptor(TraceServer) ->
 %% ------------------------------------------------------------------
 %% gen_server callback : init/1
 %% ------------------------------------------------------------------
--spec init([string() | pid() | integer(), ...]) -> {'ok', state()}.
+-spec init([string() | pid() | integer() | limits(), ...]) -> {'ok', state()}.
 
-init([Dir, Super, Depth]) ->
+init([Dir, Super, Depth, Limits]) ->
   process_flag(trap_exit, true),
   link(Super),
   Ptree = ets:new(?MODULE, [bag, protected]),
@@ -116,7 +159,9 @@ init([Dir, Super, Depth]) ->
     ptree = Ptree,
     fds = Fds,
     dir = TraceDir,
-    logs = [{procs, 0}, {dir, TraceDir}]
+    logs = [{procs, 0}, {dir, TraceDir}],
+    limits = init_limits(Limits),
+    reductions = proplists:get_value(reductions, Limits, infinity)
   },
   {ok, InitState}.
   
@@ -137,6 +182,10 @@ terminate(_Reason, State) ->
   ets:delete(Ptree),
   ets:delete(Procs),
   ets:delete(Fds),
+  case State#state.limits of
+    undefined -> ok;
+    Limits -> ets:delete(Limits)
+  end,
   %% Send Logs to supervisor
   ok = concolic:send_tlogs(Super, Logs).
 
@@ -154,13 +203,14 @@ code_change(_OldVsn, State, _Extra) ->
 -spec handle_call(call(), {pid(), reference()}, state()) -> {'reply', reply(), state()}.
   
 %% Call Request : {register_parent, Parent, Link}
-%% Ret Msg : {ok, Filename, Depth}
+%% Ret Msg : {ok, Filename, Depth, Limits}
 handle_call({register_parent, Parent}, {From, _FromTag}, State) ->
   Procs = State#state.procs,
   Ptree = State#state.ptree,
   Dir = State#state.dir,
   Logs = State#state.logs,
   Depth = State#state.depth,
+  Limits = State#state.limits,
   FromPid = 
     case is_atom(From) of
      true ->  whereis(From);
@@ -176,7 +226,7 @@ handle_call({register_parent, Parent}, {From, _FromTag}, State) ->
   %% Create the filename of the log file
   F = erlang:pid_to_list(FromPid) -- "<>",
   Filename = filename:absname(Dir ++ "/proc-" ++ F),
-  {reply, {ok, Filename, Depth}, State#state{logs=NewLogs}};
+  {reply, {ok, Filename, Depth, Limits}, State#state{logs=NewLogs}};
 %% Call Request : {is_monitored, Who}
 %% Ret Msg : boolean()
 handle_call({is_monitored, Who}, {_From, _FromTag}, State) ->
@@ -215,6 +265,9 @@ handle_cast({store_fd, From, Fd}, State) ->
   Fds = State#state.fds,
   ets:insert(Fds, {From, Fd}),
   {noreply, State};
+%% Cast Request : {limit_exceeded, Who, Limit}
+handle_cast({limit_exceeded, Who, Limit}, State) ->
+  stop_execution(Who, Limit, State);
 %% Cast Request : {terminate, FromWho}
 handle_cast({terminate, FromWho}, State) ->
   Super = State#state.super,
@@ -253,12 +306,61 @@ handle_info({'DOWN', _Ref, process, Who, Reason}, State) ->
   kill_all_processes(get_procs(Procs)),
   %% Send the Error Report to the supervisor
   concolic:send_error_report(Super, Who, concolic_eval:unzip_error(Reason)),
-  {stop, normal, State}.
+  {stop, normal, State};
+%% Msg when the wall time of the execution is up
+handle_info({limit_exceeded, Limit}, State) ->
+  stop_execution(self(), Limit, State);
+%% Msg to check the reductions of the live evaluators
+handle_info(check_reductions, State=#state{procs = Procs, reductions = Max}) ->
+  F = fun(P, Acc) ->
+    case erlang:process_info(P, reductions) of
+      {reductions, R} -> Acc + R;
+      undefined -> Acc
+    end
+  end,
+  case lists:foldl(F, 0, get_procs(Procs)) > Max of
+    true ->
+      stop_execution(self(), reductions, State);
+    false ->
+      _ = erlang:send_after(?REDUCTIONS_TICK, self(), check_reductions),
+      {noreply, State}
+  end.
   
 %% ============================================================================
 %% Internal functions
 %% ============================================================================
 
+%% Create the table with the counters of the limits
+%% and start the timers of the ones checked by the TraceServer
+%% A maximum of -1 stands for no limit
+-spec init_limits(limits()) -> ets:tab() | 'undefined'.
+
+init_limits([]) ->
+  undefined;
+init_limits(Limits) ->
+  case proplists:get_value(time, Limits) of
+    undefined -> ok;
+    T -> _ = erlang:send_after(T, self(), {limit_exceeded, time}), ok
+  end,
+  case proplists:is_defined(reductions, Limits) of
+    true  -> _ = erlang:send_after(?REDUCTIONS_TICK, self(), check_reductions), ok;
+    false -> ok
+  end,
+  Tab = ets:new(?MODULE, [set, public, {write_concurrency, true}]),
+  Cs = [{L, 0, proplists:get_value(L, Limits, -1)} || L <- [trace_bytes, calls]],
+  true = ets:insert(Tab, Cs),
+  Tab.
+
+%% Stop the execution when one of its limits is exceeded
+-spec stop_execution(pid(), limit(), state()) -> {'stop', 'normal', state()}.
+
+stop_execution(Who, Limit, State) ->
+  Super = State#state.super,
+  Procs = State#state.procs,
+  kill_all_processes(get_procs(Procs)),
+  concolic:send_limit_report(Super, Who, Limit),
+  {stop, normal, State}.
+
 %% Stores the file descriptor of a process's trace
 -spec store_file_descriptor(pid(), file:io_device()) -> 'ok'.
 
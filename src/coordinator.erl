@@ -2,14 +2,25 @@
 %%------------------------------------------------------------------------------
 -module(coordinator).
 
--export([run/4, test_run/3]).
+-export([run/4, run/5, explore/5, test_run/3, test_run/4]).
 
+%% Executions on other nodes
+-export([remote_execution/6]).
+
+-export_type([option/0, metrics/0]).
+
+-include("concolic_internal.hrl").
 -include("concolic_flags.hrl").
 
 -define(TRACEDIR(BaseDir), BaseDir ++ "/traces").
--define(COREDIR(BaseDir), BaseDir ++ "/core").
 -define(PYTHON_CALL, ?PYTHON_PATH ++ " -u priv/erlang_port.py").
 
+-type option() :: concolic_scheduler:option()
+                | {'executions', pos_integer()}                %% Number of concurrent executions
+                | {'limits', concolic_tserver:limits()}       %% Limits of each execution
+                | {'metrics', 'return' | {concolic_metrics:format(), file:name()}}.  %% Return or dump the metrics
+-type metrics() :: [concolic_scheduler:metric() | concolic_metrics:metric()].
+
 %% ------------------------------------------------------------------
 %% Run function
 %% ------------------------------------------------------------------
@@ -17,68 +28,183 @@
 -spec run(atom(), atom(), [term()], pos_integer()) -> ok.
 
 run(M, F, As, Depth) ->
+  run(M, F, As, Depth, []).
+
+%% The metrics of the run are returned with {metrics, return}
+%% or written to a JSON or CSV file with {metrics, {Format, File}}
+-spec run(atom(), atom(), [term()], pos_integer(), [option()]) -> ok | metrics().
+
+run(M, F, As, Depth, Opts) ->
+  Metrics = explore(M, F, As, Depth, Opts),
+  case proplists:get_value(metrics, Opts) of
+    undefined -> ok;
+    return -> Metrics;
+    {Format, File} -> ok = concolic_metrics:dump(Metrics, Format, File)
+  end.
+
+%% Run the concolic testing of an M, F, As and
+%% return the metrics of the exploration
+-spec explore(atom(), atom(), [term()], pos_integer(), [option()]) -> metrics().
+
+explore(M, F, As, Depth, Opts) ->
   error_logger:tty(false),  %% Disable error_logger
   io:format("Testing ~p:~p/~p ...~n", [M, F, length(As)]),
-  {TmpDir, E, S} = init(Depth),
+  {TmpDir, E, S} = init(Depth, Opts),
   pprint_input(As),
-  CR = concolic_execute(M, F, As, TmpDir, E, Depth),
-  {DataDir, Traces, Mapping} = prepare_execution_info(S, CR),
+  Lim = {Depth, proplists:get_value(limits, Opts, []), proplists:get_value(nodes, Opts, [node()])},
+  CR = concolic_execute(M, F, As, TmpDir, E, Lim),
+  {DataDir, Traces, Mapping} = prepare_execution_info(S, [], CR),
   ok = concolic_scheduler:initial_execution(S, DataDir, Traces, Mapping),
-  loop(M, F, TmpDir, E+1, S, Depth).
-
-loop(M, F, TmpDir, E, S, Depth) ->
-  case concolic_scheduler:request_input(S) of
-    empty ->
-      concolic_scheduler:stop(S),
-      _ = file:del_dir(filename:absname(TmpDir)),
-      ok;
-    {R, As} ->
+  K = proplists:get_value(executions, Opts, 1),
+  loop(M, F, TmpDir, E+1, S, Lim, K, [], undefined).
+
+%% Keep up to K concolic executions running and hand their
+%% results to the scheduler as each one finishes
+%% Lim is the depth and the limits of each execution and the
+%% nodes that the executions are spread over
+%% Req is the tag of the pending request for an input, or 'empty'
+%% when the scheduler had none to give until an execution finishes
+loop(M, F, TmpDir, E, S, Lim, K, Running, undefined) when length(Running) < K ->
+  Req = concolic_scheduler:request_input(S),
+  loop(M, F, TmpDir, E, S, Lim, K, Running, Req);
+loop(_M, _F, TmpDir, _E, S, {_Depth, _Limits, Nodes}, _K, [], empty) ->
+  finish(TmpDir, S, Nodes);
+loop(M, F, TmpDir, E, S, Lim, K, Running, Req) ->
+  case wait_for_any(S, Running, Req) of
+    {input, {R, As}} ->
+      {Concolic, DataDir} = start_execution(M, F, As, TmpDir, E, Lim),
+      loop(M, F, TmpDir, E+1, S, Lim, K, [{Concolic, R, As, DataDir}|Running], undefined);
+    {input, empty} ->
+      loop(M, F, TmpDir, E, S, Lim, K, Running, empty);
+    {Concolic, Results} ->
+      {value, {Concolic, R, As, DataDir}, Running1} = lists:keytake(Concolic, 1, Running),
       pprint_input(As),
-      CR = concolic_execute(M, F, As, TmpDir, E, Depth),
-      {DataDir, Traces, Mapping} = prepare_execution_info(S, CR),
+      CR = execution_result(Results, DataDir),
+      {DataDir, Traces, Mapping} = prepare_execution_info(S, Running, CR),
       ok = concolic_scheduler:store_execution(S, R, DataDir, Traces, Mapping),
-      loop(M, F, TmpDir, E+1, S, Depth)
+      Req1 = case Req of empty -> undefined; _ -> Req end,
+      loop(M, F, TmpDir, E, S, Lim, K, Running1, Req1)
   end.
 
-init(Depth) ->
+finish(TmpDir, S, Nodes) ->
+  report_solver_stats(concolic_scheduler:solver_stats(S)),
+  lists:foreach(fun({P, N, Us}) -> concolic_metrics:add_time(P, N, Us) end,
+                concolic_scheduler:solver_timings(S)),
+  Metrics = concolic_scheduler:metrics(S),
+  report_metrics(Metrics),
+  concolic_scheduler:stop(S),
+  lists:foreach(fun(Node) -> del_dir(Node, TmpDir) end, Nodes),
+  Phases = concolic_metrics:snapshot(),
+  concolic_metrics:delete(),
+  Metrics ++ Phases.
+
+init(Depth, Opts) ->
   process_flag(trap_exit, true),
-  TmpDir = "temp",
+  TmpDir = tmp_dir(),
   E = 0,
-  S = concolic_scheduler:start(?PYTHON_CALL, Depth),
+  ok = concolic_load:init_cache(),
+  ok = concolic_metrics:new(),
+  S = concolic_scheduler:start(?PYTHON_CALL, Depth, Opts),
   {TmpDir, E, S}.
 
-prepare_execution_info(S, {'internal_error', IError}) ->
+%% An internal error stops the run along with the other executions
+prepare_execution_info(S, Running, {'internal_error', IError}) ->
   io:format("Internal Error in Concolic Execution : ~p~n", [IError]),
-  concolic_scheduler:stop(S),
+  abort(S, Running),
   exit(normal);
-prepare_execution_info(_S, {'ok', {Result, DataDir, Traces, Mapping}}) ->
+prepare_execution_info(_S, _Running, {'ok', {Result, DataDir, Traces, Mapping}}) ->
   report_execution_status(Result),
   report_exec_vertices(Traces),
   report_trace_contents(Traces),
   {DataDir, Traces, Mapping}.
 
+%% Kill the running executions, delete their data
+%% directories and stop the scheduler
+abort(S, Running) ->
+  F = fun({Concolic, _R, _As, DataDir}) ->
+    exit(Concolic, kill),
+    concolic_analyzer:clear_and_delete_dir(node(Concolic), DataDir)
+  end,
+  lists:foreach(F, Running),
+  concolic_scheduler:stop(S).
+
 %% Run function for testing
 -spec test_run(atom(), atom(), [term()]) -> concolic_analyzer:ret().
 
 test_run(M, F, As) ->
+  test_run(M, F, As, []).
+
+-spec test_run(atom(), atom(), [term()], concolic_tserver:limits()) -> concolic_analyzer:ret().
+
+test_run(M, F, As, Limits) ->
   process_flag(trap_exit, true),
-  TmpDir = "temp",
-  {ok, {R, DataDir, _, _}} = concolic_execute(M, F, As, TmpDir, 0, 1000),
+  TmpDir = tmp_dir(),
+  {ok, {R, DataDir, _, _}} = concolic_execute(M, F, As, TmpDir, 0, {1000, Limits, [node()]}),
   _ = concolic_analyzer:clear_and_delete_dir(DataDir),
   _ = file:del_dir(filename:absname(TmpDir)),
   R.
 
+%% The directory of the executions
+%% In shared memory the traces are handed to the solver
+%% without touching the disk
+-ifdef(MEMORY_TRACE).
+tmp_dir() ->
+  case filelib:is_dir(?RAM_DIR) of
+    true  -> ?RAM_DIR ++ "/concolic-" ++ os:getpid();
+    false -> "temp"
+  end.
+-else.
+tmp_dir() -> "temp".
+-endif.
+
+%% Delete the (empty) directory of the executions on a node
+del_dir(Node, Dir) when Node =:= node() ->
+  _ = file:del_dir(filename:absname(Dir));
+del_dir(Node, Dir) ->
+  _ = rpc:call(Node, file, del_dir, [Dir]).
+
 %% ------------------------------------------------------------------
 %% Concolic Execution
 %% ------------------------------------------------------------------
 
 %% Concolic Execution of an M, F, As
-concolic_execute(M, F, As, Dir, E, Depth) ->
+concolic_execute(M, F, As, Dir, E, Lim) ->
+  {Concolic, DataDir} = start_execution(M, F, As, Dir, E, Lim),
+  R = wait_for_execution(Concolic),
+  execution_result(R, DataDir).
+
+%% Start a concolic execution in its own data directory
+%% The executions take turns on the nodes
+start_execution(M, F, As, Dir, E, {Depth, Limits, Nodes}) ->
   DataDir = Dir ++ "/exec" ++ integer_to_list(E),
-  CoreDir = ?COREDIR(DataDir),    %% Directory to store .core files
-  TraceDir = ?TRACEDIR(DataDir),  %% Directory to store traces
-  Concolic = concolic:init_server(M, F, As, CoreDir, TraceDir, Depth),
+  case lists:nth(E rem length(Nodes) + 1, Nodes) of
+    Node when Node =:= node() ->
+      TraceDir = ?TRACEDIR(DataDir),  %% Directory to store traces
+      Concolic = concolic:init_server(M, F, As, TraceDir, Depth, Limits),
+      {Concolic, DataDir};
+    Node ->
+      Exec = spawn_link(Node, ?MODULE, remote_execution, [self(), M, F, As, DataDir, {Depth, Limits}]),
+      {Exec, DataDir}
+  end.
+
+%% Run a concolic execution on this node for the coordinator
+%% of another node and send it back the result
+%% The traces stay in the data directory on this node, where the
+%% scheduler reads them and the solver workers of this node solve them
+-spec remote_execution(pid(), atom(), atom(), [term()], string(),
+                       {pos_integer(), concolic_tserver:limits()}) -> ok.
+
+remote_execution(Coord, M, F, As, DataDir, {Depth, Limits}) ->
+  process_flag(trap_exit, true),
+  ok = concolic_load:init_cache(),
+  Concolic = concolic:init_server(M, F, As, ?TRACEDIR(DataDir), Depth, Limits),
   R = wait_for_execution(Concolic),
+  Coord ! {self(), {remote, execution_result(R, DataDir)}},
+  ok.
+
+execution_result({remote, CR}, _DataDir) ->
+  CR;
+execution_result(R, DataDir) ->
   analyze(R),
   case concolic_analyzer:get_result(R) of
     {'internal_error', _IError} = IE -> IE;
@@ -92,6 +218,30 @@ wait_for_execution(Concolic) ->
     {Concolic, Results} -> Results
   end.
 
+%% Wait for any of the running executions to finish
+%% or for the input of the pending request
+wait_for_any(S, Running, Req) ->
+  receive
+    {input, Req, Reply} ->
+      {input, Reply};
+    {'EXIT', S, Why} ->
+      io:format("Scheduler exited : ~p~n", [Why]),
+      abort(S, Running),
+      exit(normal);
+    {'EXIT', Concolic, Why} when Why =/= normal ->
+      case lists:keymember(Concolic, 1, Running) of
+        true  -> {Concolic, {'internal_concolic_error', node(), Why}};
+        false -> wait_for_any(S, Running, Req)
+      end;
+    {'EXIT', _Concolic, normal} ->
+      wait_for_any(S, Running, Req);
+    {Concolic, Results} when is_pid(Concolic) ->
+      case lists:keymember(Concolic, 1, Running) of
+        true  -> {Concolic, Results};
+        false -> wait_for_any(S, Running, Req)
+      end
+  end.
+
 %% ------------------------------------------------------------------
 %% Report Results
 %% ------------------------------------------------------------------
@@ -103,25 +253,36 @@ pprint_input([H|T]) ->
   io:format("~n").
 
 report_execution_status({ok, {Cv, _}}) -> io:format(" Result: ~w~n", [Cv]);
-report_execution_status({error, CR}) -> io:format(" Runtime Error: ~w~n", [CR]).
+report_execution_status({error, CR}) -> io:format(" Runtime Error: ~w~n", [CR]);
+report_execution_status({limit_exceeded, L}) -> io:format(" Limit Exceeded: ~w~n", [L]).
 
-report_exec_vertices([]) -> ok;
-report_exec_vertices([{_Node, Fs}|Rest]) ->
-  F = fun(X) ->
-    V = concolic_encdec:path_vertex(X),
-    io:format(" Path Vertex: ~p~n", [V])
+report_solver_stats({Hits, ModelHits, Misses}) ->
+  io:format("Solver cache: ~w hits, ~w solved by earlier models, ~w misses~n", [Hits, ModelHits, Misses]).
+
+report_metrics(Metrics) ->
+  P = proplists:get_value(distinct_paths, Metrics),
+  E = proplists:get_value(executions, Metrics),
+  T = proplists:get_value(elapsed, Metrics),
+  io:format("Explored ~w distinct paths in ~w executions (~.2f paths/min)~n", [P, E, P * 60000 / erlang:max(1, T)]),
+  io:format("Skipped ~w negations of explored paths and ~w duplicate executions~n",
+            [proplists:get_value(skipped, Metrics), proplists:get_value(duplicates, Metrics)]),
+  io:format("Solver queries: ~w sat, ~w unsat, ~w unknown, ~w timeout~n",
+            [proplists:get_value(K, Metrics) || K <- [sat, unsat, unknown, timeout]]).
+
+report_exec_vertices(Traces) ->
+  F = fun({_Node, Vs}) ->
+    lists:foreach(fun(V) -> io:format(" Path Vertex: ~p~n", [V]) end, Vs)
   end,
-  lists:foreach(F, Fs),
-  report_exec_vertices(Rest).
+  lists:foreach(F, concolic_analyzer:get_execution_vertices(Traces)).
 
 -ifdef(PRINT_TRACES).
 report_trace_contents(Traces) ->
   lists:foreach(fun report_trace_contents_node/1, Traces).
 
-report_trace_contents_node({_Node, TraceFiles}) ->
+report_trace_contents_node({Node, TraceFiles}) ->
   F = fun(X) ->
     io:format("Contents of ~p~n", [X]),
-    ok = concolic_analyzer:print_trace(X)
+    ok = rpc:call(Node, concolic_analyzer, print_trace, [X])
   end,
   lists:foreach(F, TraceFiles).
 -else.
@@ -140,6 +301,9 @@ analyze({'internal_traceserver_error', Node, Results}) ->
 analyze({'runtime_error', Node, Results}) ->
   io:format("%%   Runtime error in Node ~p~n", [Node]),
   report(Results);
+analyze({'limit_exceeded', Node, Results}) ->
+  io:format("%%   Limit exceeded in Node ~p~n", [Node]),
+  report(Results);
 analyze({'ok', _Node, Results}) ->
   report(Results).
 
@@ -165,6 +329,8 @@ report_result({'clogs', Logs}) ->
 report_result({'tlogs', Logs}) ->
   io:format("%%   Monitored Processes : ~w~n", [proplists:get_value('procs', Logs)]),
   io:format("%%   Traces Directory : ~p~n", [proplists:get_value('dir', Logs)]);
+report_result({'limit_exceeded', {_Node, Who, Limit}}) ->
+  io:format("%%   Limit ~p exceeded by ~p~n", [Limit, Who]);
 report_result({'codeserver_error', Error}) ->
   io:format("%%   CodeServer Error = ~p~n", [Error]);
 report_result({'traceserver_error', Error}) ->
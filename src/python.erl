@@ -5,7 +5,9 @@
 
 %% External exports
 -export([start/0, exec/2, load_file/2, check_model/1, get_model/1,
-         stop/1, solve/4]).
+         reset/1, stop/1, solve/4, start_worker/1, start_worker/2, worker_solve/4,
+         solve_all/3, worker_solve_all/4, stats/1, timings/1, set_limits/2,
+         query_timeout/1]).
 
 %% gen_fsm callbacks
 -export([init/1, handle_event/3, handle_sync_event/4, handle_info/3,
@@ -13,21 +15,41 @@
          %% custom state names
          idle/2, idle/3, waiting/2, waiting/3, solving/2, solving/3,
          solved/2, solved/3, generating_model/2, generating_model/3,
-         finished/2, finished/3]).
+         batch_solving/2, batch_solving/3, finished/2, finished/3,
+         reporting/2, reporting/3]).
+
+%% exported types
+-export_type([limits/0, status/0]).
+
+-define(REUSED_MODELS, 4).         %% Recent models the port tries before a check
+-define(TIMEOUT_MARGIN, 30000).    %% Ms on top of the bounds of the solver
+-define(DEFAULT_TIMEOUT, 300000).  %% Ms to wait for a query without a time bound
+-define(LOAD_MS_PER_MB, 1000).     %% Ms to read each MB of a trace
 
 %% fsm state datatype
 -record(state, {
   super,
   from = null,
-  port = null
+  port = null,
+  batch = null,  %% {Pending indices, Collected results, Awaiting a model}
+  chunks = [],   %% Received chunks of a streamed model (reversed)
+  python,        %% Command that started the port
+  limits,        %% Bounds of each query of the port :: limits()
+  timeout = ?DEFAULT_TIMEOUT, %% Ms to wait for an answer of the port to a query
+  allowance = 0  %% Ms to read the trace of the current query on top of it
 }).
 
--type reply() :: {reply, ok, statename(), state()}
+-type reply() :: {reply, ok | [batch_result()], statename(), state()}
                | {stop, term(), ok, state()}.
 -type ret() :: {stop, term(), state()}
-             | {next_state, statename(), state()}.
+             | {next_state, statename(), state()}
+             | {next_state, statename(), state(), timeout()}.
 -type state() :: #state{}.
--type statename() :: idle | waiting | solving | solved | generating_model | finished.
+-type statename() :: idle | waiting | solving | solved | generating_model
+                   | batch_solving | finished | reporting.
+-type batch_result() :: {integer(), {ok, binary()} | {error, status()}}.
+-type status() :: unsat | unknown | timeout.  %% Outcomes of a query without a model
+-type limits() :: {timeout(), timeout(), non_neg_integer()}.  %% {Ms, Rlimit, Retries}
 
 
 %% ============================================================================
@@ -56,16 +78,62 @@ load_file(Pid, FileInfo) ->
   gen_fsm:sync_send_event(Pid, {load_file, FileInfo}).
 
 %% Port Command: Check the model for satisfiability
+%% When the port does not answer within the bounds of the query
+%% it is restarted and the query counts as a timeout
 -spec check_model(pid()) -> binary().
 
 check_model(Pid) ->
-  gen_fsm:sync_send_event(Pid, check_model, 500000).
+  gen_fsm:sync_send_event(Pid, check_model, infinity).
 
 %% Port Command: Get the instance of the sat model
--spec get_model(pid()) -> binary().
+%% ('error' when the port failed to generate it)
+-spec get_model(pid()) -> binary() | 'timeout' | 'error'.
 
 get_model(Pid) ->
-  gen_fsm:sync_send_event(Pid, get_model, 500000).
+  gen_fsm:sync_send_event(Pid, get_model, infinity).
+
+%% Port Command: Load a trace file once and solve the negation of
+%% each of the given constraints incrementally
+-spec solve_all(pid(), file:name(), [integer()]) -> [batch_result()].
+
+solve_all(Pid, File, Is) ->
+  gen_fsm:sync_send_event(Pid, {solve_all, {File, lists:usort(Is)}}, infinity).
+
+%% Port Command: Get the wall time of the phases of the port
+%% as [{Phase, Count, Microseconds}]
+-spec timings(pid()) -> [{concolic_metrics:phase(), non_neg_integer(), non_neg_integer()}].
+
+timings(Pid) ->
+  case gen_fsm:sync_send_event(Pid, timings) of
+    <<"error">> -> [];
+    Bin -> timings_to_list(string:tokens(binary_to_list(Bin), " "))
+  end.
+
+%% Port Command: Bound the time (in ms) and the resources of each
+%% query and the number of retries with doubled bounds when it hits them
+-spec set_limits(pid(), limits()) -> ok.
+
+set_limits(Pid, Limits) ->
+  gen_fsm:sync_send_event(Pid, {set_limits, Limits}).
+
+%% Port Command: Drop the loaded constraints so that the port
+%% can be reused for another query
+-spec reset(pid()) -> ok.
+
+reset(Pid) ->
+  gen_fsm:sync_send_event(Pid, reset).
+
+%% Port Command: Get the counters of the solver cache of the port
+%% as {Hits, Hits on earlier models, Misses}
+-spec stats(pid()) -> {non_neg_integer(), non_neg_integer(), non_neg_integer()}.
+
+stats(Pid) ->
+  case gen_fsm:sync_send_event(Pid, stats) of
+    <<"error">> -> {0, 0, 0};
+    Bin ->
+      [H, MH, M] = [list_to_integer(X) || X <- string:tokens(binary_to_list(Bin), " ")],
+      {H, MH, M}
+  end.
 
 %% Stop the Python fsm
 -spec stop(pid()) -> ok.
@@ -82,18 +150,78 @@ solve(File, I, Mapping, Python) ->
   python:exec(FSM, Python),
   python:load_file(FSM, {File, 1, I}),
   Sat = python:check_model(FSM),
-  case Sat of
-    <<"sat">> ->
-      M = python:get_model(FSM),
-      Decoded = concolic_json:decode_z3_result(M),
-      Inp = concolic_symbolic:generate_new_input(Mapping, Decoded),
-      python:stop(FSM),
-      {ok, Inp};
-    _ ->
-      python:stop(FSM),
-      error
+  R =
+    case Sat =:= <<"sat">> andalso python:get_model(FSM) of
+      false -> error;
+      timeout -> error;
+      error -> error;
+      M ->
+        Decoded = concolic_json:decode_z3_result(M),
+        {ok, concolic_symbolic:generate_new_input(Mapping, Decoded)}
+    end,
+  python:stop(FSM),
+  R.
+
+%% Start a long-lived solver worker that keeps its port
+%% (and the declared Z3 datatypes) alive between queries
+-spec start_worker(string()) -> pid().
+
+start_worker(Python) ->
+  FSM = python:start(),
+  python:exec(FSM, Python),
+  FSM.
+
+%% Start a solver worker on another node
+%% The worker is linked to the caller and its port runs on that node
+-spec start_worker(node(), string()) -> pid().
+
+start_worker(Node, Python) when Node =:= node() ->
+  start_worker(Python);
+start_worker(Node, Python) ->
+  case rpc:call(Node, gen_fsm, start, [?MODULE, self(), []]) of
+    {ok, FSM} ->
+      true = link(FSM),
+      python:exec(FSM, Python),
+      FSM;
+    Error ->
+      exit({error_starting_worker, Node, Error})
   end.
 
+%% Interact with Z3 through a solver worker to solve a set of constraints
+%% The worker is reset and ready for the next query when this returns
+-spec worker_solve(pid(), file:name(), integer(), [concolic_symbolic:mapping()]) -> {ok, [term()]} | {error, status()}.
+
+worker_solve(FSM, File, I, Mapping) ->
+  python:load_file(FSM, {File, 1, I}),
+  Sat = python:check_model(FSM),
+  R =
+    case Sat =:= <<"sat">> andalso python:get_model(FSM) of
+      false -> {error, status(Sat)};
+      timeout -> {error, timeout};
+      error -> {error, unknown};
+      M ->
+        Decoded = concolic_json:decode_z3_result(M),
+        {ok, concolic_symbolic:generate_new_input(Mapping, Decoded)}
+    end,
+  python:reset(FSM),
+  R.
+
+%% Interact with Z3 through a solver worker to solve the negation of
+%% several constraints of the same trace in one session
+-spec worker_solve_all(pid(), file:name(), [integer()], [concolic_symbolic:mapping()]) ->
+  [{integer(), {ok, [term()]} | {error, status()}}].
+
+worker_solve_all(FSM, File, Is, Mapping) ->
+  Rs = python:solve_all(FSM, File, Is),
+  python:reset(FSM),
+  F = fun({I, {ok, M}}) ->
+        Decoded = concolic_json:decode_z3_result(M),
+        {I, {ok, concolic_symbolic:generate_new_input(Mapping, Decoded)}};
+      ({_I, {error, _}}=E) ->
+        E
+  end,
+  [F(R) || R <- Rs].
+
 %% ============================================================================
 %% gen_fsm callbacks
 %% ============================================================================
@@ -112,13 +240,10 @@ init(Super) ->
 %% ------------------------------------------------------------------
 -spec terminate(term(), statename(), state()) -> ok.
 
-terminate(normal, finished, _Data) ->
-  ok;
+terminate(normal, _State, #state{port = Port}) ->
+  close_port(Port);
 terminate(Reason, State,  #state{port = Port}) ->
-  case erlang:port_info(Port) of
-    undefined -> ok;
-    _ -> port_close(Port)
-  end,
+  close_port(Port),
   exit({State, Reason}).
 
 %% ------------------------------------------------------------------
@@ -156,8 +281,8 @@ idle(Event, Data) ->
 
 -spec idle(term(), tuple(), state()) -> reply().
 idle({exec, Python}, _From, Data) ->
-  Port = open_port({spawn, Python}, [{packet, 2}, binary, hide]),
-  {reply, ok, waiting, Data#state{port = Port}};
+  Port = open_port({spawn, Python}, [{packet, 4}, binary, hide]),
+  {reply, ok, waiting, Data#state{port = Port, python = Python}};
 idle(Event, _From, Data) ->
   {stop, {unexpected_event, Event}, ok, Data}.
 
@@ -167,19 +292,45 @@ waiting(Event, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
 -spec waiting(term(), tuple(), state()) -> ret() | reply().
-waiting({load_file, FileInfo}, _From, Data=#state{port = Port}) ->
+waiting({load_file, {File, _Start, _End}=FileInfo}, _From, Data=#state{port = Port}) ->
   Cmd = concolic_json:prepare_port_command(load_file, FileInfo),
   Port ! {self(), {command, Cmd}},
-  {reply, ok, waiting, Data};
+  {reply, ok, waiting, Data#state{allowance = load_allowance(File)}};
 waiting(check_model, From, Data=#state{port = Port}) ->
   Cmd = concolic_json:prepare_port_command(check_model, null),
   Port ! {self(), {command, Cmd}},
-  {next_state, solving, Data#state{from = From}};
+  {next_state, solving, Data#state{from = From}, wait_time(Data)};
+waiting({solve_all, {_File, []}}, _From, Data) ->
+  {reply, [], finished, Data};
+waiting({solve_all, {File, Is}=Info}, From, Data=#state{port = Port}) ->
+  Cmd = concolic_json:prepare_port_command(solve_all, Info),
+  Port ! {self(), {command, Cmd}},
+  Data1 = Data#state{from = From, batch = {Is, [], false}, allowance = load_allowance(File)},
+  {next_state, batch_solving, Data1, wait_time(Data1)};
+waiting(reset, _From, Data) ->
+  reset_port(Data);
+waiting({set_limits, Limits}, _From, Data=#state{port = Port}) ->
+  Cmd = concolic_json:prepare_port_command(limits, Limits),
+  Port ! {self(), {command, Cmd}},
+  {reply, ok, waiting, Data#state{limits = Limits, timeout = query_timeout(Limits)}};
+waiting(stats, From, Data=#state{port = Port}) ->
+  Cmd = concolic_json:prepare_port_command(stats, null),
+  Port ! {self(), {command, Cmd}},
+  {next_state, reporting, Data#state{from = From}};
+waiting(timings, From, Data=#state{port = Port}) ->
+  Cmd = concolic_json:prepare_port_command(timings, null),
+  Port ! {self(), {command, Cmd}},
+  {next_state, reporting, Data#state{from = From}};
+waiting(stop, _From, Data) ->
+  {stop, normal, ok, Data};
 waiting(Event, _From, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
 %% State 'solving'
 -spec solving(term(), state()) -> ret().
+solving(timeout, Data=#state{from = From}) ->
+  gen_fsm:reply(From, <<"timeout">>),
+  {next_state, finished, restart_port(Data#state{from = null})};
 solving(Event, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
@@ -193,15 +344,22 @@ solved(Event, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
 -spec solved(term(), tuple(), state()) -> ret() | reply().
-solved(get_model, From, Data=#state{port = Port}) ->
+solved(get_model, From, Data=#state{port = Port, timeout = T}) ->
   Cmd = concolic_json:prepare_port_command(get_model, null),
   Port ! {self(), {command, Cmd}},
-  {next_state, generating_model, Data#state{from = From}};
+  {next_state, generating_model, Data#state{from = From}, T};
+solved(reset, _From, Data) ->
+  reset_port(Data);
+solved(stop, _From, Data) ->
+  {stop, normal, ok, Data};
 solved(Event, _From, Data) ->
   {stop, {unexpected_event, Event}, ok, Data}.
 
 %% State 'generating_model'
 -spec generating_model(term(), state()) -> ret().
+generating_model(timeout, Data=#state{from = From}) ->
+  gen_fsm:reply(From, timeout),
+  {next_state, finished, restart_port(Data#state{from = null, chunks = []})};
 generating_model(Event, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
@@ -209,17 +367,43 @@ generating_model(Event, Data) ->
 generating_model(Event, _From, Data) ->
   {stop, {unexpected_event, Event}, ok, Data}.
 
+%% State 'batch_solving'
+%% The query that timed out counts as a timeout
+%% and the ones after it as unknown
+-spec batch_solving(term(), state()) -> ret().
+batch_solving(timeout, Data=#state{from = From, batch = {[I|Is], Acc, _}}) ->
+  Rs = [{I, {error, timeout}} | [{J, {error, unknown}} || J <- Is]],
+  gen_fsm:reply(From, lists:reverse(Acc, Rs)),
+  {next_state, finished, restart_port(Data#state{from = null, batch = null, chunks = []})};
+batch_solving(Event, Data) ->
+  {stop, {unexpected_event, Event}, Data}.
+
+-spec batch_solving(term(), tuple(), state()) -> reply().
+batch_solving(Event, _From, Data) ->
+  {stop, {unexpected_event, Event}, ok, Data}.
+
 %% State 'finished'
 -spec finished(term(), state()) -> ret().
 finished(Event, Data) ->
   {stop, {unexpected_event, Event}, Data}.
 
 -spec finished(term(), tuple(), state()) -> ret() | reply().
+finished(reset, _From, Data) ->
+  reset_port(Data);
 finished(stop, _From, Data) ->
   {stop, normal, ok, Data};
 finished(Event, _From, Data) ->
   {stop, {unexpected_event, Event}, ok, Data}.
 
+%% State 'reporting'
+-spec reporting(term(), state()) -> ret().
+reporting(Event, Data) ->
+  {stop, {unexpected_event, Event}, Data}.
+
+-spec reporting(term(), tuple(), state()) -> reply().
+reporting(Event, _From, Data) ->
+  {stop, {unexpected_event, Event}, ok, Data}.
+
 %% ------------------------------------------------------------------
 %% gen_fsm callback : handle_info/3
 %% ------------------------------------------------------------------
@@ -231,14 +415,122 @@ handle_info({Port, {data, Bin}}, solving, Data=#state{from = From, port = Port})
     <<"sat">> -> {next_state, solved, Data#state{from = null}};
     _ -> {next_state, finished, Data#state{from = null}}
   end;
-handle_info({Port, {data, Bin}}, generating_model, Data=#state{from = From, port = Port}) ->
+handle_info({Port, {data, <<>>}}, generating_model, Data=#state{from = From, port = Port, chunks = Cs}) ->
+  gen_fsm:reply(From, model(Cs)),
+  {next_state, finished, Data#state{from = null, chunks = []}};
+handle_info({Port, {data, Bin}}, generating_model, Data=#state{port = Port, chunks = Cs, timeout = T}) ->
+  {next_state, generating_model, Data#state{chunks = [Bin|Cs]}, T};
+handle_info({Port, {data, Bin}}, reporting, Data=#state{from = From, port = Port}) ->
   gen_fsm:reply(From, Bin),
-  {next_state, finished, Data#state{from = null}};
+  {next_state, waiting, Data#state{from = null}};
+handle_info({Port, {data, Bin}}, batch_solving, Data=#state{port = Port, batch = {[I|Is], Acc, false}}) ->
+  case Bin of
+    <<"sat">> -> {next_state, batch_solving, Data#state{batch = {[I|Is], Acc, true}}, wait_time(Data)};
+    _ -> next_batch_result(Is, [{I, {error, status(Bin)}}|Acc], Data)
+  end;
+handle_info({Port, {data, <<>>}}, batch_solving, Data=#state{port = Port, batch = {[I|Is], Acc, true}, chunks = Cs}) ->
+  next_batch_result(Is, [{I, {ok, join_chunks(Cs)}}|Acc], Data#state{chunks = []});
+handle_info({Port, {data, Bin}}, batch_solving, Data=#state{port = Port, batch = {_, _, true}, chunks = Cs}) ->
+  {next_state, batch_solving, Data#state{chunks = [Bin|Cs]}, wait_time(Data)};
+%% Late answers of a port that was restarted
+handle_info({OldPort, {data, _}}, StateName, Data=#state{port = Port}) when is_port(OldPort), OldPort =/= Port ->
+  {next_state, StateName, Data};
 handle_info(Info, _StateName, Data) ->
   {stop, {unexpected_info, Info}, Data}.
 
+%% ============================================================================
+%% Internal functions
+%% ============================================================================
 
+%% Ask the port to drop its constraints and wait for a new query
+-spec reset_port(state()) -> reply().
+
+reset_port(Data=#state{port = Port}) ->
+  Cmd = concolic_json:prepare_port_command(reset, null),
+  Port ! {self(), {command, Cmd}},
+  {reply, ok, waiting, Data#state{allowance = 0}}.
+
+%% Reply with the collected results once every index has been solved
+-spec next_batch_result([integer()], [batch_result()], state()) -> ret().
+
+next_batch_result([], Acc, Data=#state{from = From}) ->
+  gen_fsm:reply(From, lists:reverse(Acc)),
+  {next_state, finished, Data#state{from = null, batch = null}};
+next_batch_result(Is, Acc, Data) ->
+  {next_state, batch_solving, Data#state{batch = {Is, Acc, false}}, wait_time(Data)}.
+
+%% Replace a port that does not answer with a new one
+%% that has the same bounds
+-spec restart_port(state()) -> state().
+
+restart_port(Data=#state{port = Port, python = Python, limits = Limits}) ->
+  close_port(Port),
+  NewPort = open_port({spawn, Python}, [{packet, 4}, binary, hide]),
+  case Limits of
+    undefined -> ok;
+    _ -> NewPort ! {self(), {command, concolic_json:prepare_port_command(limits, Limits)}}
+  end,
+  Data#state{port = NewPort}.
 
+%% The longest the port may take to solve a query: each check may be
+%% retried with doubled bounds, after the recent models are tried
+%% Queries without a time bound get a default one, so that a port
+%% that hangs is always replaced
+-spec query_timeout(limits()) -> pos_integer().
 
+query_timeout({infinity, _Rlimit, _Retries}) ->
+  ?DEFAULT_TIMEOUT;
+query_timeout({Ms, _Rlimit, Retries}) ->
+  Ms * ((1 bsl (Retries + 1)) - 1 + ?REUSED_MODELS) + ?TIMEOUT_MARGIN.
 
+%% The time to read a trace, which the port does within a query
+-spec load_allowance(file:name()) -> non_neg_integer().
 
+load_allowance(File) ->
+  ?LOAD_MS_PER_MB * (filelib:file_size(File) div (1 bsl 20) + 1).
+
+%% How long to wait for the next answer of the port to a query
+-spec wait_time(state()) -> pos_integer().
+
+wait_time(#state{timeout = T, allowance = A}) ->
+  T + A.
+
+%% Parse the "Phase Count Microseconds ..." report of the port
+-spec timings_to_list([string()]) -> [{atom(), non_neg_integer(), non_neg_integer()}].
+
+timings_to_list([P, N, Us | Rest]) ->
+  [{list_to_atom(P), list_to_integer(N), list_to_integer(Us)} | timings_to_list(Rest)];
+timings_to_list([]) ->
+  [].
+
+%% The outcome of a query that has no model
+%% Anything unexpected from the port counts as unknown
+-spec status(binary()) -> status().
+
+status(<<"unsat">>) -> unsat;
+status(<<"timeout">>) -> timeout;
+status(_) -> unknown.
+
+%% A model that the port failed to generate is streamed as "error"
+-spec model([binary()]) -> binary() | 'error'.
+
+model([<<"error">>]) -> error;
+model(Cs) -> join_chunks(Cs).
+
+%% Models are streamed by the port as a series of chunks
+%% terminated by an empty one
+-spec join_chunks([binary()]) -> binary().
+
+join_chunks(Cs) ->
+  iolist_to_binary(lists:reverse(Cs)).
+
+%% Close the port (if it is still open)
+-spec close_port(port() | null) -> ok.
+
+close_port(null) ->
+  ok;
+close_port(Port) ->
+  case erlang:port_info(Port) of
+    undefined -> ok;
+    _ -> port_close(Port), ok
+  end.
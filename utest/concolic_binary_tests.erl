@@ -0,0 +1,42 @@
+-module(concolic_binary_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% The same records are decoded by BinaryReader in utest/port_tests.py
+
+%% Symbolic variables are written by name the first time only
+-spec symbols_test() -> 'ok'.
+
+symbols_test() ->
+  X = concolic_symbolic:list_to_symbolic("0.1"),
+  {B1, Syms1} = concolic_binary:command_to_binary("Pms", [X], concolic_binary:new_symbols()),
+  ?assertEqual(<<15, 1, 0, 0, 3, "0.1">>, B1),
+  {B2, Syms2} = concolic_binary:command_to_binary("T", [X], Syms1),
+  ?assertEqual(<<0, 1, 1, 0>>, B2),
+  Y = concolic_symbolic:list_to_symbolic("0.2"),
+  Z = concolic_symbolic:list_to_symbolic("0.3"),
+  {B3, _} = concolic_binary:command_to_binary("Bkt", [X, [Y, Z]], Syms2),
+  ?assertEqual(<<14, 2, 1, 0, 9, 2, 0, 1, 3, "0.2", 0, 2, 3, "0.3">>, B3).
+
+%% Integers are zigzag varints
+-spec integers_test() -> 'ok'.
+
+integers_test() ->
+  Cases = [{0, <<0>>}, {-1, <<1>>}, {1, <<2>>}, {-64, <<127>>}, {64, <<128, 1>>}, {300, <<216, 4>>}],
+  F = fun({I, Enc}) ->
+    {B, _} = concolic_binary:command_to_binary("Eq", [ok, I], concolic_binary:new_symbols()),
+    ?assertEqual(<<2, 2, 4, 2, "ok", 2, Enc/binary>>, B)
+  end,
+  lists:foreach(F, Cases).
+
+%% A subterm that appears more than once is written once
+%% and referenced by an alias
+-spec aliases_test() -> 'ok'.
+
+aliases_test() ->
+  X = concolic_symbolic:list_to_symbolic("0.1"),
+  {_, Syms} = concolic_binary:command_to_binary("Pms", [X], concolic_binary:new_symbols()),
+  {B, _} = concolic_binary:command_to_binary("Eq", [X, {[1, 2], [1, 2]}], Syms),
+  ?assertEqual(<<2, 2, 1, 0, 8, 1, 0, 5, 2, 2, 2, 2, 4, 6, 2, 7, 0, 7, 0>>, B).
@@ -0,0 +1,51 @@
+-module(concolic_metrics_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% The phases are recorded by their self time: the nested phases
+%% and the excluded waits are left out of the enclosing phase
+-spec self_time_test() -> 'ok'.
+
+self_time_test() ->
+  ok = concolic_metrics:new(),
+  ok = concolic_metrics:time(outer, fun() ->
+    timer:sleep(100),
+    ok = concolic_metrics:time(inner, fun() -> timer:sleep(200) end),
+    ok = concolic_metrics:exclude(fun() -> timer:sleep(200) end),
+    ok = concolic_metrics:time(inner, fun() -> timer:sleep(100) end)
+  end),
+  {1, Outer} = phase(outer),
+  {2, Inner} = phase(inner),
+  ?assert(Outer >= 100000 andalso Outer < 300000),
+  ?assert(Inner >= 300000 andalso Inner < 500000),
+  ok = concolic_metrics:delete().
+
+%% A phase timed by another process is not nested in the caller's
+-spec other_process_test() -> 'ok'.
+
+other_process_test() ->
+  ok = concolic_metrics:new(),
+  Self = self(),
+  ok = concolic_metrics:time(outer, fun() ->
+    spawn(fun() -> concolic_metrics:time(other, fun() -> timer:sleep(200) end), Self ! done end),
+    receive done -> ok end
+  end),
+  {1, Outer} = phase(outer),
+  {1, Other} = phase(other),
+  ?assert(Outer >= 200000 andalso Other >= 200000),
+  ok = concolic_metrics:delete().
+
+%% Recording without a table is a no-op
+-spec no_table_test() -> 'ok'.
+
+no_table_test() ->
+  ok = concolic_metrics:delete(),
+  ?assertEqual(ok, concolic_metrics:time(outer, fun() -> ok end)),
+  ?assertEqual([{phases, []}, {counters, []}, {series, []}], concolic_metrics:snapshot()).
+
+phase(P) ->
+  Ps = proplists:get_value(phases, concolic_metrics:snapshot()),
+  {P, N, Us} = lists:keyfind(P, 1, Ps),
+  {N, Us}.
@@ -0,0 +1,31 @@
+-module(concolic_scheduler_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% demo:foo/2 has 3 paths: X =/= 100000, X >= 2*Y and X < 2*Y
+
+%% A pool of solvers explores the same paths as a single one
+-spec solver_pool_test_() -> term().
+
+solver_pool_test_() ->
+  Opts = [[{solvers, 1}], [{solvers, 3}], [{solvers, 2}, {executions, 2}], [{solvers, 2}, {generational, true}]],
+  [{timeout, 100, fun() -> foo_paths(O) end} || O <- Opts].
+
+foo_paths(Opts) ->
+  Ms = coordinator:explore(demo, foo, [0, 0], 10, Opts),
+  ?assertEqual(3, proplists:get_value(distinct_paths, Ms)),
+  ?assertEqual(proplists:get_value(inputs, Ms) + 1, proplists:get_value(executions, Ms)).
+
+%% No inputs are handed out past the iteration budget
+-spec iterations_test_() -> term().
+
+iterations_test_() ->
+  Opts = [[{iterations, 1}], [{iterations, 1}, {solvers, 3}, {executions, 2}], [{iterations, 1}, {generational, true}]],
+  [{timeout, 100, fun() -> budget_inputs(1, O) end} || O <- Opts].
+
+budget_inputs(Max, Opts) ->
+  Ms = coordinator:explore(demo, foo, [0, 0], 10, Opts),
+  ?assertEqual(Max, proplists:get_value(inputs, Ms)),
+  ?assertEqual(Max + 1, proplists:get_value(executions, Ms)).
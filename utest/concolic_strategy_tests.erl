@@ -0,0 +1,48 @@
+-module(concolic_strategy_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% The fifo strategy hands out the states in the order they were queued
+-spec fifo_test() -> 'ok'.
+
+fifo_test() ->
+  [R1, R2, R3] = [make_ref() || _ <- lists:seq(1, 3)],
+  St0 = concolic_strategy:new(fifo, 10),
+  ?assert(concolic_strategy:is_empty(St0)),
+  St1 = lists:foldl(fun(R, St) -> concolic_strategy:in(R, state(0, 1, 5), St) end, St0, [R1, R2, R3]),
+  ?assertEqual(3, concolic_strategy:len(St1)),
+  ?assertEqual([R1, R2, R3], out_all(St1)).
+
+%% The coverage strategy prefers the states that covered new branches
+%% and, for equal scores, keeps the order they were queued
+-spec coverage_test() -> 'ok'.
+
+coverage_test() ->
+  [R1, R2, R3, R4] = [make_ref() || _ <- lists:seq(1, 4)],
+  Ss = [{R1, state(0, 1, 5)}, {R2, state(2, 1, 5)}, {R3, state(0, 1, 5)}, {R4, state(0, 5, 5)}],
+  St = lists:foldl(fun({R, Ps}, Acc) -> concolic_strategy:in(R, Ps, Acc) end, concolic_strategy:new(coverage, 10), Ss),
+  ?assertEqual([R2, R1, R3, R4], out_all(St)).
+
+%% A custom score function
+-spec score_fun_test() -> 'ok'.
+
+score_fun_test() ->
+  [R1, R2] = [make_ref() || _ <- lists:seq(1, 2)],
+  Score = fun(Fs) -> proplists:get_value(path_length, Fs) end,
+  St0 = concolic_strategy:new(Score, 10),
+  St = concolic_strategy:in(R2, state(0, 1, 7), concolic_strategy:in(R1, state(0, 1, 3), St0)),
+  ?assertEqual([R2, R1], out_all(St)).
+
+state(New, X, L) ->
+  [{new_branches, New}, {next_constraint, X}, {path_length, L}].
+
+out_all(St) ->
+  case concolic_strategy:out(St) of
+    {empty, St1} ->
+      ?assert(concolic_strategy:is_empty(St1)),
+      [];
+    {{value, R}, St1} ->
+      [R | out_all(St1)]
+  end.
@@ -0,0 +1,44 @@
+-module(concolic_trie_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% New paths count the branches they cover first
+-spec insert_test() -> 'ok'.
+
+insert_test() ->
+  T = concolic_trie:new(),
+  ?assertEqual({2, true}, concolic_trie:insert(<<"TT">>, T)),
+  ?assertEqual({1, true}, concolic_trie:insert(<<"TF">>, T)),
+  ?assertEqual({0, false}, concolic_trie:insert(<<"TT">>, T)),
+  ?assertEqual([{covered_branches, 3}, {distinct_paths, 2}], concolic_trie:metrics(T)),
+  concolic_trie:delete(T).
+
+%% A negation can be claimed once and not after it is explored
+-spec claim_after_insert_test() -> 'ok'.
+
+claim_after_insert_test() ->
+  T = concolic_trie:new(),
+  {3, true} = concolic_trie:insert(<<"TTF">>, T),
+  ?assert(concolic_trie:claim(<<"TTF">>, 2, T)),
+  ?assertNot(concolic_trie:claim(<<"TTF">>, 2, T)),
+  {2, true} = concolic_trie:insert(<<"FT">>, T),
+  ?assertNot(concolic_trie:claim(<<"TTF">>, 1, T)),
+  %% A prefix that is not in the trie and a branch past the path
+  ?assert(concolic_trie:claim(<<"FFT">>, 3, T)),
+  ?assert(concolic_trie:claim(<<"TTF">>, 4, T)),
+  concolic_trie:delete(T).
+
+%% An execution that takes a queued prefix explores it
+-spec claim_queued_prefix_test() -> 'ok'.
+
+claim_queued_prefix_test() ->
+  T = concolic_trie:new(),
+  {2, true} = concolic_trie:insert(<<"TT">>, T),
+  ?assert(concolic_trie:claim(<<"TT">>, 1, T)),
+  ?assertNot(concolic_trie:claim(<<"TF">>, 1, T)),
+  ?assertEqual({2, true}, concolic_trie:insert(<<"FT">>, T)),
+  ?assertNot(concolic_trie:claim(<<"TT">>, 1, T)),
+  ?assertEqual([{covered_branches, 4}, {distinct_paths, 2}], concolic_trie:metrics(T)),
+  concolic_trie:delete(T).
@@ -0,0 +1,54 @@
+-module(concolic_tserver_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+-include("../src/concolic_internal.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+%% An execution over a limit is stopped and reports the limit
+-spec limits_test_() -> term().
+
+limits_test_() ->
+  Ls = [[{calls, 10}], [{trace_bytes, 100}], [{calls, 10}, {trace_bytes, 1000000}]],
+  [{timeout, 100, fun() -> exceeded(L) end} || L <- Ls].
+
+exceeded([{Limit, _} | _] = Limits) ->
+  ?assertEqual({limit_exceeded, Limit}, coordinator:test_run(demo, fib, [10], Limits)).
+
+%% An execution within its limits runs to the end
+-spec within_limits_test() -> 'ok'.
+
+within_limits_test() ->
+  R = coordinator:test_run(demo, fib, [10], [{calls, 1000000}]),
+  ?assertMatch({ok, {55, _}}, R).
+
+%% Charging after the TraceServer has deleted the counters does not fail
+-spec deleted_counters_test() -> 'ok'.
+
+deleted_counters_test() ->
+  Tab = ets:new(?MODULE, [set, public]),
+  true = ets:insert(Tab, {calls, 0, 1}),
+  true = ets:delete(Tab),
+  put(?LIMITS_PREFIX, {self(), Tab}),
+  ?assertEqual(ok, concolic_tserver:charge(calls, 5)),
+  ?assertEqual(ok, concolic_tserver:charge(calls, 5)),
+  erase(?LIMITS_PREFIX).
+
+%% An evaluator over a limit exits by itself when nobody stops it
+-spec unstopped_caller_test_() -> term().
+
+unstopped_caller_test_() ->
+  {timeout, 100, fun unstopped_caller/0}.
+
+unstopped_caller() ->
+  Tab = ets:new(?MODULE, [set, public]),
+  true = ets:insert(Tab, {calls, 0, 1}),
+  Server = self(),
+  {Pid, Ref} = spawn_monitor(fun() ->
+                               put(?LIMITS_PREFIX, {Server, Tab}),
+                               ok = concolic_tserver:charge(calls, 1),
+                               concolic_tserver:charge(calls, 1)
+                             end),
+  receive {'$gen_cast', {limit_exceeded, Pid, calls}} -> ok end,
+  receive {'DOWN', Ref, process, Pid, Reason} -> ?assertEqual({limit_exceeded, calls}, Reason) end,
+  true = ets:delete(Tab).
@@ -0,0 +1,205 @@
+## Tests of the pure parts of the solver port
+## Run from the top directory: python utest/port_tests.py
+
+import gzip, json, os, shutil, struct, subprocess, sys, tempfile, unittest
+from StringIO import StringIO
+PRIV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "priv")
+sys.path.insert(0, PRIV)
+from json_utils import *
+from z3_utils import *
+
+## Records written by concolic_binary (see concolic_binary_tests.erl)
+PMS = "\x0f\x01\x00\x00\x030.1"
+EQ_ALIAS = "\x02\x02\x01\x00\x08\x01\x00\x05\x02\x02\x02\x02\x04\x06\x02\x07\x00\x07\x00"
+T = "\x00\x01\x01\x00"
+
+def sym(s):
+  return {"s" : s}
+
+def cmd(c, *args):
+  return {"c" : c, "a" : list(args)}
+
+class BinaryReaderTests(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write_trace(self, name, records, opener=open):
+    f = os.path.join(self.dir, name)
+    fd = opener(f, 'wb')
+    fd.write(TRACE_MAGIC + chr(TRACE_BINARY))
+    for k, data in records:
+      fd.write(struct.pack('!BI', k, len(data)) + data)
+    fd.close()
+    return f
+
+  def expected(self):
+    l = {"t" : "List", "v" : [{"t" : "Int", "v" : 1}, {"t" : "Int", "v" : 2}]}
+    t = {"t" : "Tuple", "v" : [{"l" : "_l2.0"}, {"l" : "_l2.0"}], "d" : {"_l2.0" : l}}
+    return [cmd("Pms", sym("0.1")), cmd("Eq", sym("0.1"), t), dict(cmd("T", sym("0.1")), r=True)]
+
+  def test_round_trip(self):
+    f = self.write_trace("trace", [(3, PMS), (3, EQ_ALIAS), (1, T)])
+    self.assertEqual(self.expected(), list(TraceReader(f, 1)))
+
+  def test_compressed_round_trip(self):
+    f = self.write_trace("trace.gz", [(3, PMS), (3, EQ_ALIAS), (1, T)], gzip.open)
+    self.assertEqual(self.expected(), list(TraceReader(f, 1)))
+
+  def test_integers(self):
+    rd = BinaryReader(open(os.devnull, 'rb'), 0)
+    for v, enc in [(0, "\x00"), (-1, "\x01"), (1, "\x02"), (-64, "\x7f"), (64, "\x80\x01"), (300, "\xd8\x04")]:
+      data = "\x02\x02\x04\x02ok\x02" + enc
+      self.assertEqual(cmd("Eq", {"t" : "Atom", "v" : [111, 107]}, {"t" : "Int", "v" : v}), rd.decode(data))
+
+  ## A record cut short (e.g. by a killed execution) ends the trace
+  def test_truncated_trace(self):
+    f = self.write_trace("trace", [(3, PMS), (1, T)])
+    with open(f, 'r+b') as fd:
+      fd.truncate(os.path.getsize(f) - 2)
+    self.assertEqual([cmd("Pms", sym("0.1"))], list(TraceReader(f, 1)))
+
+class SlicerTests(unittest.TestCase):
+  ## x1 is broken into x3 and x4, and x3 into the list of x5 and x6
+  def test_break_chain(self):
+    cmds = [cmd("Pms", sym("x1"), sym("x2")),
+            cmd("Bkt", sym("x1"), [sym("x3"), sym("x4")]),
+            cmd("Bkl", sym("x3"), [sym("x5"), sym("x6")]),
+            cmd("T", sym("x5")),
+            cmd("F", sym("x2")),
+            cmd("Eq", sym("x4"), {"t" : "Tuple", "v" : [{"l" : "a"}, {"l" : "a"}],
+                                  "d" : {"a" : {"t" : "Int", "v" : 1}}})]
+    sl = Slicer()
+    for i, c in enumerate(cmds):
+      sl.add(c, i)
+    self.assertEqual([0, 1, 2, 3, 5], sl.slice(cmd("T", sym("x6"))))
+    self.assertEqual([0, 4], sl.slice(cmd("F", sym("x2"))))
+
+  ## The alias "a" defined with x1 is used again with x2
+  ## (the alias names are unique in a trace)
+  def test_shared_alias(self):
+    l = {"t" : "List", "v" : [sym("x1")]}
+    cmds = [cmd("Pms", sym("x1"), sym("x2"), sym("x3"), sym("x4")),
+            cmd("Eq", sym("x3"), {"t" : "Tuple", "v" : [{"l" : "a"}], "d" : {"a" : l}}),
+            cmd("T", sym("x1")),
+            cmd("Eq", sym("x2"), {"t" : "Tuple", "v" : [{"l" : "a"}, {"t" : "Int", "v" : 2}]}),
+            cmd("F", sym("x3")),
+            cmd("T", sym("x4"))]
+    sl = Slicer()
+    for i, c in enumerate(cmds):
+      sl.add(c, i)
+    self.assertEqual([0, 1, 2, 3, 4], sl.slice(cmd("T", sym("x2"))))
+    self.assertEqual([0, 1, 2, 3, 4], sl.slice(cmd("F", sym("x1"))))
+    self.assertEqual([0, 5], sl.slice(cmd("F", sym("x4"))))
+
+  def test_symbolic_vars(self):
+    t = {"t" : "List", "v" : [sym("x1"), {"l" : "a"}], "d" : {"a" : {"t" : "Int", "v" : 1}}}
+    self.assertEqual(["x1", "x2"], symbolic_vars([t, sym("x2")]))
+    d = {"t" : "Tuple", "v" : [{"l" : "a"}], "d" : {"a" : {"t" : "List", "v" : [sym("x3")]}}}
+    self.assertEqual(["x3", "x2"], symbolic_vars([d, sym("x2")]))
+
+class SolverCacheTests(unittest.TestCase):
+  def test_lookup(self):
+    c = SolverCache(size=2)
+    c.store("a", sat, ["1"])
+    c.store("b", unsat, None)
+    c.store("u", unknown, None)
+    self.assertEqual((sat, ["1"]), c.lookup("a"))
+    self.assertEqual((unsat, None), c.lookup("b"))
+    self.assertEqual(None, c.lookup("u"))
+    self.assertEqual("2 0 0", c.stats())
+
+  def test_eviction(self):
+    c = SolverCache(size=2)
+    c.store("a", unsat, None)
+    c.store("b", unsat, None)
+    c.lookup("a")
+    c.store("c", unsat, None)
+    self.assertEqual(None, c.lookup("b"))
+    self.assertNotEqual(None, c.lookup("a"))
+
+  def test_recent_models(self):
+    c = SolverCache(models=2)
+    c.store("a", sat, ["1"])
+    c.store("b", sat, ["2"])
+    c.store("c", sat, ["3"])
+    c.lookup("b")
+    self.assertEqual([["2"], ["3"]], c.models())
+
+class FramingTests(unittest.TestCase):
+  def frames(self, data):
+    fs = []
+    while (data != ""):
+      sz = struct.unpack('!I', data[:4])[0]
+      fs.append(data[4:4+sz])
+      data = data[4+sz:]
+    return fs
+
+  def test_receive(self):
+    p = ErlangPort()
+    p.chan_in = StringIO(struct.pack('!I', 3) + "abc" + struct.pack('!I', 0) + "\x00\x00")
+    self.assertEqual("abc", p.receive())
+    self.assertEqual("", p.receive())
+    ## A closed or cut short input
+    self.assertEqual(None, p.receive())
+
+  ## Streamed messages are sent in frames of at least CHUNK bytes
+  ## (but the last) and end with an empty frame
+  def test_send_stream(self):
+    p = ErlangPort()
+    p.CHUNK = 4
+    p.chan_out = StringIO()
+    p.send("sat")
+    p.send_stream(["ab", "cd", "e", "fghij", "k"])
+    p.send_stream([])
+    self.assertEqual(["sat", "abcd", "efghij", "k", "", ""], self.frames(p.chan_out.getvalue()))
+
+## Talks to the port the way python.erl does, with 4-byte framed messages
+class PortErrorTests(unittest.TestCase):
+  def setUp(self):
+    self.devnull = open(os.devnull, 'w')
+    self.port = subprocess.Popen([sys.executable, "-u", os.path.join(PRIV, "erlang_port.py")],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.devnull)
+
+  def tearDown(self):
+    self.request("stop")
+    self.port.wait()
+    self.devnull.close()
+
+  def request(self, t, *args):
+    msg = json.dumps({"t" : t, "a" : list(args)})
+    self.port.stdin.write(struct.pack('!I', len(msg)) + msg)
+    self.port.stdin.flush()
+
+  def reply(self):
+    sz = struct.unpack('!I', self.port.stdout.read(4))[0]
+    return self.port.stdout.read(sz)
+
+  ## A query whose trace cannot be loaded is undecided
+  ## and the port is kept for the next query
+  def test_failed_load(self):
+    self.request("load", "/nonexistent", 1, 1)
+    self.request("check")
+    self.assertEqual("error", self.reply())
+    self.request("reset")
+    self.request("stats")
+    self.assertEqual("0 0 0", self.reply())
+
+  ## Each index of a failed batch gets a reply
+  def test_failed_batch(self):
+    self.request("solve_all", "/nonexistent", [1, 2, 3])
+    self.assertEqual(["error", "error", "error"], [self.reply() for i in range(3)])
+    self.request("stats")
+    self.assertEqual("0 0 0", self.reply())
+
+  ## A model that cannot be generated is streamed as "error"
+  def test_failed_model(self):
+    self.request("model")
+    self.assertEqual(["error", ""], [self.reply(), self.reply()])
+    self.request("timings")
+    self.reply()
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,42 @@
+-module(python_tests).
+
+-include_lib("eunit/include/eunit.hrl").
+
+-spec test() -> 'ok' | {'error' | term()}.
+
+-define(PYTHON_CALL, ?PYTHON_PATH ++ " -u priv/erlang_port.py").
+
+%% A query whose trace cannot be read is undecided
+%% and the worker is kept for the next one
+-spec failed_query_test() -> 'ok'.
+
+failed_query_test() ->
+  W = python:start_worker(?PYTHON_CALL),
+  ?assertEqual({error, unknown}, python:worker_solve(W, "nonexistent", 1, [])),
+  ?assertEqual([{1, {error, unknown}}, {2, {error, unknown}}], python:worker_solve_all(W, "nonexistent", [2, 1], [])),
+  ?assertEqual({0, 0, 0}, python:stats(W)),
+  python:stop(W).
+
+%% Each check may be retried with doubled bounds after the recent
+%% models are tried, and queries without a time bound get a default one
+-spec query_timeout_test() -> 'ok'.
+
+query_timeout_test() ->
+  ?assertEqual(1000 * (1 + 4) + 30000, python:query_timeout({1000, infinity, 0})),
+  ?assertEqual(1000 * (1 + 2 + 4 + 4) + 30000, python:query_timeout({1000, 5000, 2})),
+  ?assert(is_integer(python:query_timeout({infinity, infinity, 0}))).
+
+%% A port that does not answer is replaced, the query counts as a
+%% timeout and the rest of a batch as unknown
+-spec hung_port_test_() -> term().
+
+hung_port_test_() ->
+  Test =
+    fun() ->
+      W = python:start_worker("cat > /dev/null"),
+      ok = python:set_limits(W, {1, infinity, 0}),
+      ?assertEqual({error, timeout}, python:worker_solve(W, "nonexistent", 1, [])),
+      ?assertEqual([{1, {error, timeout}}, {2, {error, unknown}}], python:worker_solve_all(W, "nonexistent", [1, 2], [])),
+      python:stop(W)
+    end,
+  {timeout, 100, Test}.